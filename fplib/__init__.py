@@ -1 +1,5 @@
-from .fpmain import Fingerprint as fplib
\ No newline at end of file
+import sys
+
+# On MicroPython fplibMicro.py subclasses fplib.fpmain.Fingerprint, the alias is left out.
+if sys.implementation.name != "micropython":
+    from .fpmain import Fingerprint as fplib
@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import os
+
+import serial
+
+from .errors import RETRYABLE
+from .fpmain import Fingerprint
+from .framing import (DATA_HEADER, DATA_SYNC, PACKET_SIZE, RESPONSE_SYNC, UPLOAD_SIZES,
+                      FrameReader, build_packet, data_checksum, parse_response, unwrap_data,
+                      verify_data, verify_packet)
+
+logger = logging.getLogger("Fingerprint.aio")
+
+
+class SerialStream():
+    '''
+    * Non-blocking byte stream over the file descriptor of a tty, driven by the event loop.
+    * Received bytes go into a FrameReader, waiters are woken up whenever bytes arrive.
+    '''
+
+    def __init__(self, port, baud, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.ser = serial.Serial(port, baudrate=baud, timeout=0)
+        self.fd = self.ser.fileno()
+        self.reader = FrameReader()
+        self._waiter = None
+        self.loop.add_reader(self.fd, self._on_readable)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except (BlockingIOError, InterruptedError):
+            return
+        if data:
+            self.reader.feed(data)
+            if self._waiter and not self._waiter.done():
+                self._waiter.set_result(None)
+
+    async def _wait_bytes(self, timeout):
+        self._waiter = self.loop.create_future()
+        try:
+            await asyncio.wait_for(self._waiter, timeout)
+        finally:
+            self._waiter = None
+
+    async def read_frame(self, sync, size, timeout=None, verify=None):
+        '''
+            Next `size` byte frame starting with `sync`. Raises asyncio.TimeoutError when
+            nothing arrives for `timeout` seconds, long frames are fine as long as bytes flow.
+            verify: check of a complete frame, e.g. verify_packet. A frame failing it began
+                    with a false sync word: its first byte is dropped and the rest scanned
+                    again for the next sync word, as FrameReader.read_frame() does.
+        '''
+        reader = self.reader
+        while True:
+            frame = reader.take(sync, size)
+            if frame is None:
+                await self._wait_bytes(timeout)
+            elif verify is None or verify(frame):
+                return frame
+            else:
+                reader.resyncs += 1
+                reader.buffer = frame[1:] + reader.buffer
+
+    async def write(self, *chunks):
+        for chunk in chunks:
+            view = memoryview(chunk)
+            while view:
+                try:
+                    n = os.write(self.fd, view)
+                except (BlockingIOError, InterruptedError):
+                    n = 0
+                view = view[n:]
+                if view:
+                    writable = self.loop.create_future()
+                    self.loop.add_writer(self.fd, writable.set_result, None)
+                    try:
+                        await writable
+                    finally:
+                        self.loop.remove_writer(self.fd)
+
+    def flush(self):
+        self.reader.clear()
+
+    def close(self):
+        self.loop.remove_reader(self.fd)
+        self.ser.close()
+
+
+class AsyncFingerprint():
+    '''
+    * asyncio version of `Fingerprint`, one event loop can drive many sensors.
+    * Commands to one sensor are serialised with a lock. Every exchange times out when the
+      sensor stays silent for `response_timeout` seconds and can be cancelled at any point.
+    '''
+
+    COMMENDS = Fingerprint.COMMENDS
+    PACKETS = Fingerprint.PACKETS
+    DATA_SIZES = Fingerprint.DATA_SIZES
+    SETTLE = Fingerprint.SETTLE
+    ACK = Fingerprint.ACK
+    NACK_TIMEOUT = Fingerprint.NACK_TIMEOUT
+    NACK_ENROLL_FAILED = Fingerprint.NACK_ENROLL_FAILED
+
+    def __init__(self, port, baud, response_timeout=5, settle=None, loop=None):
+        self.port = port
+        self.baud = baud
+        self.response_timeout = response_timeout
+        self.settle = dict(AsyncFingerprint.SETTLE)
+        if settle:
+            self.settle.update(settle)
+        self.loop = loop
+        self.stream = None
+        self.last_duplicate = None
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self.init()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close_serial()
+
+    async def init(self):
+        '''Opens the port and checks that the sensor answers.'''
+        self.stream = SerialStream(self.port, self.baud, self.loop)
+        try:
+            if await self.open():
+                return True
+        except asyncio.TimeoutError:
+            pass
+        logger.error("Failed to connect to the sensor on %s." % self.port)
+        self.close_serial()
+        return False
+
+    def close_serial(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+    def is_connected(self):
+        return self.stream is not None
+
+    async def _settle(self, name):
+        delay = self.settle.get(name)
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def _exchange(self, cmd, param=0, size=None, data=None):
+        stream = self.stream
+        stream.flush()
+        if param == 0:
+            packet = AsyncFingerprint.PACKETS[cmd]
+        else:
+            packet = build_packet(AsyncFingerprint.COMMENDS[cmd], param)
+        await stream.write(packet)
+        response = await stream.read_frame(RESPONSE_SYNC, PACKET_SIZE, self.response_timeout,
+                                           verify_packet)
+        ack, rparam, _, _ = parse_response(response)
+        if ack and data is not None:
+            if not isinstance(data, (bytes, bytearray, memoryview)):
+                data = bytes(data)
+            payload = unwrap_data(data, UPLOAD_SIZES[cmd])
+            if payload is None:
+                payload = data
+            await stream.write(DATA_HEADER, payload, data_checksum(payload))
+            response = await stream.read_frame(RESPONSE_SYNC, PACKET_SIZE,
+                                               self.response_timeout, verify_packet)
+            ack, rparam, _, _ = parse_response(response)
+        payload = None
+        if ack and size is not None:
+            frame = await stream.read_frame(DATA_SYNC, size + 6, self.response_timeout)
+            if not verify_data(frame):
+                raise IOError("Data packet checksum mismatch.")
+            payload = memoryview(frame)[4:-2]
+        return ack, rparam, payload
+
+    async def _command(self, cmd, param=0, size=None, data=None):
+        '''
+            Sends `cmd` (and `data` as a data packet once it is acknowledged) and waits
+            for the response, plus the data packet of `size` bytes if one is expected.
+            Raises asyncio.TimeoutError when the sensor stays silent for `response_timeout`.
+            Returns: ack, param, data
+        '''
+        async with self._lock:
+            if not self.stream:
+                raise IOError("Sensor %s is not connected." % self.port)
+            try:
+                return await self._exchange(cmd, param, size, data)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                # a late answer must not be taken for the next command's response
+                self.stream.flush()
+                raise
+
+    async def open(self):
+        ack, _, _ = await self._command("Open")
+        return ack
+
+    async def close(self):
+        ack, _, _ = await self._command("Close")
+        return ack
+
+    async def set_led(self, on):
+        ack, _, _ = await self._command("CmosLed", 1 if on else 0)
+        return ack
+
+    async def get_enrolled_cnt(self):
+        ack, param, _ = await self._command("GetEnrollCount")
+        return param if ack else -1
+
+    async def is_finger_pressed(self):
+        await self.set_led(True)
+        await self._settle('CmosLed')
+        ack, param, _ = await self._command("IsPressFinger")
+        await self.set_led(False)
+        if not ack:
+            return None
+        return param == 0
+
+    async def _press_finger(self):
+        # IsPressFinger without touching the LED: True / False, None if it was refused.
+        ack, param, _ = await self._command("IsPressFinger")
+        if not ack:
+            return None
+        return param == 0
+
+    async def _poll_finger(self, pressed, timeout, interval, max_interval):
+        # Polls until the finger state is `pressed`, starting every `interval` seconds and
+        # backing off by half up to `max_interval` while nothing changes.
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            state = await self._press_finger()
+            if state is None:
+                return None
+            if state == pressed:
+                return True
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return False
+                await asyncio.sleep(min(interval, remaining))
+            else:
+                await asyncio.sleep(interval)
+            interval = min(interval * 1.5, max_interval)
+
+    async def wait_for_finger(self, timeout=None, interval=0.02, max_interval=0.5):
+        '''
+            Turns the LED on and polls IsPressFinger until a finger is placed.
+            Returns: True, False after `timeout` seconds, None if the sensor refused.
+        '''
+        await self.set_led(True)
+        await self._settle('CmosLed')
+        found = await self._poll_finger(True, timeout, interval, max_interval)
+        if not found:
+            await self.set_led(False)
+        return found
+
+    async def wait_for_release(self, timeout=None, interval=0.02, max_interval=0.5):
+        '''
+            Polls until the finger is lifted and turns the LED off.
+            Returns: True, False after `timeout` seconds, None if the sensor refused.
+        '''
+        await self.set_led(True)
+        released = await self._poll_finger(False, timeout, interval, max_interval)
+        await self.set_led(False)
+        return released
+
+    async def capture_finger(self, best=False):
+        await self.set_led(True)
+        await self._settle('CmosLed')
+        ack, _, _ = await self._command("CaptureFinger", 1 if best else 0)
+        await self.set_led(False)
+        return ack
+
+    async def GetImage(self):
+        ack, param, data = await self._command("GetImage", size=self.DATA_SIZES['GetImage'])
+        if not ack:
+            return None, False
+        return data, param == 0
+
+    async def MakeTemplate(self):
+        if not await self.capture_finger(best=True):
+            return None, False
+        ack, param, data = await self._command("MakeTemplate",
+                                               size=self.DATA_SIZES['MakeTemplate'])
+        if not ack:
+            return None, False
+        return data, param == 0
+
+    async def check_enrolled(self, idx):
+        ack, _, _ = await self._command("CheckEnrolled", idx)
+        return ack
+
+    async def _free_slot(self):
+        # First ID from the enrolled count on that nothing is enrolled under, as Enrollment.
+        idx = await self.get_enrolled_cnt()
+        if idx is None or idx < 0:
+            return None
+        while await self.check_enrolled(idx):
+            idx += 1
+        return idx
+
+    async def start_enroll(self, idx):
+        ack, _, _ = await self._command("EnrollStart", idx)
+        return ack
+
+    async def _enroll_stage(self, stage, idx):
+        cmd = "Enroll%d" % stage
+        size = self.DATA_SIZES[cmd] if stage == 3 and idx == -1 else None
+        return await self._command(cmd, size=size)
+
+    async def _enroll_stages(self, idx, try_cnt, sleep, finger_timeout):
+        # EnrollStart and the three stages, as fplib.enroll.Enrollment runs them.
+        # Returns the outcome ('ok', 'restart', 'duplicate' or 'failed') and Enroll3's data.
+        if not await self.start_enroll(idx):
+            return 'failed', None
+        data = None
+        for stage in (1, 2, 3):
+            for cnt in range(try_cnt):
+                if not await self.wait_for_finger(finger_timeout, max_interval=sleep):
+                    return 'failed', None
+                param = None
+                if await self.capture_finger(best=True):
+                    ack, param, data = await self._enroll_stage(stage, idx)
+                    if ack:
+                        break
+                    if param < self.NACK_TIMEOUT:
+                        # A NACK with an ID as its parameter: the finger is enrolled already.
+                        self.last_duplicate = param
+                        return 'duplicate', None
+                    if param not in RETRYABLE and param != self.NACK_ENROLL_FAILED:
+                        return 'failed', None
+                if not await self.wait_for_release(finger_timeout, max_interval=sleep):
+                    return 'failed', None
+                if param == self.NACK_ENROLL_FAILED:
+                    # The sensor dropped the enrollment, it has to start over.
+                    return 'restart', None
+            else:
+                return 'failed', None
+            if stage < 3 and not await self.wait_for_release(finger_timeout, max_interval=sleep):
+                return 'failed', None
+        return 'ok', data
+
+    async def enroll(self, idx=None, try_cnt=10, sleep=1, finger_timeout=10, restarts=1):
+        '''
+            Enrolls the finger on the sensor under `idx` (the first free ID if None, -1 to
+            get the template back without saving it). The finger is polled for each stage
+            and has to lift before the next one, there are no fixed sleeps.
+            try_cnt: tries per stage. sleep: longest pause (seconds) between two polls.
+            finger_timeout: seconds to wait for the finger to be placed or lifted.
+            restarts: how often the enrollment starts over after the sensor dropped it
+                      because the captures did not match (ENROLL_FAILED).
+            A finger that is enrolled already ends the enrollment at once, the ID it is
+            enrolled with is logged and kept in `last_duplicate`.
+            Returns: idx, data, downloadstat -- or -1 if enrolling failed.
+        '''
+        self.last_duplicate = None
+        if idx is None:
+            idx = await self._free_slot()
+            if idx is None:
+                return -1
+        logger.info("Enroll with the ID: %s" % idx)
+        for restart in range(restarts + 1):
+            outcome, data = await self._enroll_stages(idx, try_cnt, sleep, finger_timeout)
+            if outcome != 'restart':
+                break
+            logger.info("The sensor dropped the enrollment, starting over.")
+        if outcome == 'duplicate':
+            logger.info("The finger is enrolled with the ID: %s" % self.last_duplicate)
+        if outcome != 'ok':
+            return -1
+        if idx == -1:
+            return idx, data, data is not None
+        return idx, None, None
+
+    async def setTemplate(self, idx, data):
+        ack, _, _ = await self._command("SetTemplate", idx, data=data)
+        return bool(ack)
+
+    async def verifyTemplate(self, idx, data):
+        ack, _, _ = await self._command("VerifyTemplate1_1", idx, data=data)
+        return bool(ack)
+
+    async def delete(self, idx=None):
+        if idx is None:
+            ack, _, _ = await self._command("DeleteAll")
+        else:
+            ack, _, _ = await self._command("DeleteID", idx)
+        return ack
+
+    async def identify(self):
+        if not await self.capture_finger(best=True):
+            return None
+        ack, param, _ = await self._command("Identify1_N")
+        return param if ack else -1
+
+    async def identifyTemplate(self, data):
+        ack, param, _ = await self._command("IdentifyTemplate1_N", data=data)
+        return param if ack else -1
@@ -0,0 +1,108 @@
+import os
+import struct
+from collections import namedtuple
+
+from .framing import checksum
+
+
+class TransferProgress(namedtuple('TransferProgress', 'slot done total nbytes elapsed')):
+    '''
+    * Progress of a database export / import, yielded once per transferred template.
+    * done / total count templates (total is None when it is not known up front).
+    '''
+
+    __slots__ = ()
+
+    @property
+    def rate(self):
+        '''Throughput in bytes per second.'''
+        return self.nbytes / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def templates_per_s(self):
+        return self.done / self.elapsed if self.elapsed else 0.0
+
+
+class TemplateArchive():
+    '''
+    * Container file for a sensor database: a small header followed by fixed size
+      records (slot, checksum, template), so the index is rebuilt with one pass of seeks.
+    * Records are only appended; a record cut short by an interruption is dropped when
+      the archive is opened again, which is what makes exports resumable.
+    '''
+
+    MAGIC = b'FPDB\x01'
+    _HEADER = struct.Struct('<5sH')  # magic, template size
+    _RECORD = struct.Struct('<IH')  # slot, checksum
+
+    def __init__(self, path, template_size=498):
+        self.path = path
+        self.template_size = template_size
+        self.index = {}
+        exists = os.path.exists(path) and os.path.getsize(path) >= self._HEADER.size
+        self._file = open(path, "r+b" if exists else "w+b")
+        if exists:
+            magic, self.template_size = self._HEADER.unpack(self._file.read(self._HEADER.size))
+            if magic != self.MAGIC:
+                self._file.close()
+                raise ValueError("%s is not a template archive." % path)
+            self._scan()
+        else:
+            self._file.write(self._HEADER.pack(self.MAGIC, template_size))
+            self._file.flush()
+
+    @property
+    def record_size(self):
+        return self._RECORD.size + self.template_size
+
+    def _scan(self):
+        size = os.path.getsize(self.path)
+        count = (size - self._HEADER.size) // self.record_size
+        for i in range(count):
+            offset = self._HEADER.size + i * self.record_size
+            self._file.seek(offset)
+            slot, _ = self._RECORD.unpack(self._file.read(self._RECORD.size))
+            self.index[slot] = offset
+        # drop a partially written record
+        self._file.truncate(self._HEADER.size + count * self.record_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, slot):
+        return slot in self.index
+
+    def close(self):
+        self._file.close()
+
+    def slots(self):
+        return sorted(self.index)
+
+    def append(self, slot, data):
+        if len(data) != self.template_size:
+            raise ValueError("template of slot %d has %d bytes, expected %d"
+                             % (slot, len(data), self.template_size))
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        self._file.write(self._RECORD.pack(slot, checksum(data)))
+        self._file.write(data)
+        self._file.flush()
+        self.index[slot] = offset
+
+    def read(self, slot):
+        self._file.seek(self.index[slot])
+        _, chksum = self._RECORD.unpack(self._file.read(self._RECORD.size))
+        data = self._file.read(self.template_size)
+        if checksum(data) != chksum:
+            raise ValueError("template of slot %d is corrupted" % slot)
+        return data
+
+    def __iter__(self):
+        for slot in self.slots():
+            yield slot, self.read(slot)
@@ -0,0 +1,184 @@
+import time
+
+from .framing import PACKET_SIZE, build_packet
+
+
+def _ack(ack, param, data):
+    return ack
+
+
+def _count(ack, param, data):
+    return param if ack else -1
+
+
+def _pressed(ack, param, data):
+    return None if ack is None or not ack else param == 0
+
+
+def _download(ack, param, data):
+    if not ack or data is None:
+        return None, False
+    return data, param == 0
+
+
+class Batch():
+    '''
+    * Queues commands for one sensor and runs them with as few writes as possible:
+      consecutive commands go out as one write and their responses are read in order.
+    * A command with a settle time (the LED in legacy mode, for example) ends a write,
+      and uploads (setTemplate, verifyTemplate, identifyTemplate) run on their own,
+      because the sensor has to acknowledge them before the data packet is sent.
+    * The methods mirror those of `Fingerprint`, results (with the same types as the
+      `Fingerprint` methods return) are in `results` once the `with` block is left.
+      A command that gets no response ends the batch, the rest of the results are None.
+    '''
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.results = None
+        self._ops = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.run()
+
+    def __len__(self):
+        return len(self._ops)
+
+    def _queue(self, cmd, param=0, decode=_ack, size=None, after=None):
+        self._ops.append(('command', cmd, param, decode, size, after))
+        return self
+
+    def _queue_call(self, method, *args):
+        self._ops.append(('call', method, args, None, None, None))
+        return self
+
+    # -------------------------------------------------------------- commands
+
+    def open(self):
+        return self._queue("Open")
+
+    def close(self):
+        return self._queue("Close")
+
+    def set_led(self, on):
+        def led(ack, param, data):
+            if ack:
+                self.fp._led = bool(on)
+            return ack
+        return self._queue("CmosLed", 1 if on else 0, led)
+
+    def get_enrolled_cnt(self):
+        return self._queue("GetEnrollCount", decode=_count)
+
+    def is_finger_pressed(self):
+        '''IsPressFinger only, turn the LED on first.'''
+        return self._queue("IsPressFinger", decode=_pressed)
+
+    def capture_finger(self, best=False):
+        '''CaptureFinger only, turn the LED on first.'''
+        return self._queue("CaptureFinger", 1 if best else 0)
+
+    def check_enrolled(self, idx):
+        return self._queue("CheckEnrolled", idx)
+
+    def identify(self):
+        '''Identify1_N of the last captured finger.'''
+        return self._queue("Identify1_N", decode=_count)
+
+    def MakeTemplate(self):
+        '''Template of the last captured finger.'''
+        return self._queue("MakeTemplate", decode=_download,
+                           size=self.fp.DATA_SIZES['MakeTemplate'])
+
+    def getTemplate(self, idx):
+        '''Always read from the sensor, the result is put into the cache.'''
+        def cache(ack, param, data):
+            if ack and data is not None and self.fp.cache is not None:
+                self.fp.cache.put(self.fp.sensor_id, idx, data)
+        return self._queue("GetTemplate", idx, _download, self.fp.DATA_SIZES['GetTemplate'],
+                           cache)
+
+    def delete(self, idx=None):
+        def invalidate(ack, param, data):
+            if ack and self.fp.cache is not None:
+                self.fp.cache.invalidate(self.fp.sensor_id, idx)
+        if idx is None:
+            return self._queue("DeleteAll", after=invalidate)
+        return self._queue("DeleteID", idx, after=invalidate)
+
+    def setTemplate(self, idx, data, check_duplicate=True):
+        return self._queue_call(self.fp.setTemplate, idx, data, check_duplicate)
+
+    def verifyTemplate(self, idx, data):
+        return self._queue_call(self.fp.verifyTemplate, idx, data)
+
+    def identifyTemplate(self, data):
+        return self._queue_call(self.fp.identifyTemplate, data)
+
+    # ------------------------------------------------------------------- run
+
+    def _settles(self, op):
+        # True if the sensor needs its settle time after this command, the LED only
+        # when it is turned on.
+        return bool(op[0] == 'command' and self.fp.settle.get(op[1])
+                    and (op[1] != 'CmosLed' or op[2]))
+
+    def _groups(self):
+        # Runs of commands that can go out in one write.
+        group = []
+        for op in self._ops:
+            if op[0] == 'call':
+                if group:
+                    yield group
+                    group = []
+                yield [op]
+                continue
+            group.append(op)
+            if self._settles(op):
+                yield group
+                group = []
+        if group:
+            yield group
+
+    def run(self):
+        '''Sends the queued commands, returns the list of results.'''
+        fp = self.fp
+        if fp.cache is not None:
+            fp.sensor_id  # looked up now, not in the middle of the responses
+        results = []
+        for group in self._groups():
+            if group[0][0] == 'call':
+                _, method, args, _, _, _ = group[0]
+                results.append(method(*args))
+                continue
+            packets = b''.join(build_packet(fp.COMMENDS[cmd], param)
+                               for _, cmd, param, _, _, _ in group)
+            if not (fp.ser and fp.ser.writable()):
+                break
+            fp.ser.write(packets)
+            if fp.hook is not None:
+                fp._sent_at = time.monotonic()
+                for _, cmd, _, _, _, _ in group:
+                    fp.hook.command(cmd, PACKET_SIZE)
+            for _, cmd, param, decode, size, after in group:
+                fp._cmd = cmd
+                ack, rparam, _, data = fp._read_packet(size=size)
+                if ack is None:
+                    fp._flush()
+                    break
+                results.append(decode(ack, rparam, data))
+                if after:
+                    after(ack, rparam, data)
+            else:
+                if self._settles(group[-1]):
+                    fp._settle(group[-1][1])
+                continue
+            break
+        results += [None] * (len(self._ops) - len(results))
+        self._ops = []
+        self.results = results
+        return results
@@ -0,0 +1,199 @@
+'''
+* Latency / throughput benchmark of the `Fingerprint` commands against the emulated sensor.
+* Run with `python -m fplib.benchmark [--baud 9600 57600 115200] [--iterations N] [--commands ...]`.
+* Note: a GetImage transfer (52 KB) takes about a minute at 9600 baud.
+'''
+import argparse
+import json
+import time
+
+from .emulator import FingerprintEmulator
+from .enroll import EnrollResult, RetryPolicy
+from .fpmain import Fingerprint
+
+BAUDRATES = (9600, 57600, 115200)
+
+
+def percentile(samples, pct):
+    # nearest-rank percentile
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def succeeded(result):
+    '''
+        Whether the return value of a command reports success: an EnrollResult that is ok,
+        a (data, downloadstat) pair with downloadstat set, anything but None / False / -1.
+    '''
+    if isinstance(result, EnrollResult):
+        return result.ok
+    if isinstance(result, tuple):
+        return bool(result[-1])
+    return result is not None and result is not False and result != -1
+
+
+class Benchmark():
+
+    def __init__(self, baud, iterations=20, delays=None, wait_ack=False):
+        self.baud = baud
+        self.wait_ack = wait_ack
+        self.iterations = iterations
+        self.delays = delays
+        self.emu = None
+        self.fp = None
+
+    def _drain(self, idle=0.05):
+        # Wait until the emulator has nothing left to send, then drop it.
+        ser = self.fp.ser
+        quiet_since = time.monotonic()
+        while time.monotonic() - quiet_since < idle:
+            if ser.in_waiting:
+                ser.read(ser.in_waiting)
+                quiet_since = time.monotonic()
+            else:
+                time.sleep(0.005)
+
+    def cases(self):
+        fp, emu = self.fp, self.emu
+        known = FingerprintEmulator.make_template(0)
+        fresh = iter(range(1, 1 << 30))
+
+        def press_known():
+            emu.press_finger(known)
+
+        def press_fresh():
+            emu.press_finger(FingerprintEmulator.make_template(next(fresh)))
+
+        def captured():
+            press_known()
+            emu.captured = known
+
+        def enroll_setup():
+            emu.db.pop(1, None)
+            press_fresh()
+
+        def finger(event):
+            # the finger lifts after each stage and is put back for the next prompt
+            if event.kind == 'stage_done':
+                emu.release_finger()
+            elif event.kind == 'prompt' and emu.finger is None:
+                emu.press_finger(finger.template)
+
+        def enroll():
+            finger.template = emu.finger
+            policy = RetryPolicy(attempts=1, restarts=0, finger_timeout=2)
+            return fp.enrollment(1, check_duplicate=False, policy=policy, on_event=finger).run()
+
+        return [
+            ("open", None, fp.open),
+            ("set_led", None, lambda: fp.set_led(True)),
+            ("capture_finger", press_known, lambda: fp.capture_finger(best=True)),
+            ("identify", press_known, fp.identify),
+            ("identifyTemplate", None, lambda: fp.identifyTemplate(known)),
+            ("setTemplate", None, lambda: fp.setTemplate(0, known)),
+            ("GetImage", captured, fp.GetImage),
+            ("MakeTemplate", press_known, fp.MakeTemplate),
+            ("enroll", enroll_setup, enroll),
+        ]
+
+    def run(self, commands=None):
+        results = []
+        with FingerprintEmulator(baud=self.baud, delays=self.delays) as emu:
+            self.emu = emu
+            self.fp = Fingerprint(emu.port, self.baud, timeout=1, wait_ack=self.wait_ack)
+            if not self.fp.init():
+                raise RuntimeError("could not connect to the emulated sensor")
+            self.fp.open()
+            emu.db[0] = FingerprintEmulator.make_template(0)
+            for name, setup, call in self.cases():
+                if commands and name not in commands:
+                    continue
+                results.append(self._measure(name, setup, call))
+            self.fp.close_serial()
+        return results
+
+    def _measure(self, name, setup, call):
+        # Failed calls are counted on their own, latency, bytes and throughput are those of
+        # the calls that succeeded (a NACK comes back faster than the real work).
+        emu = self.emu
+        samples = []
+        failures = 0
+        wire = 0
+        commands = 0
+        for _ in range(self.iterations):
+            if setup:
+                setup()
+            self._drain()
+            before_bytes = emu.bytes_in + emu.bytes_out
+            before_cmds = sum(emu.commands.values())
+            start = time.perf_counter()
+            result = call()
+            elapsed = time.perf_counter() - start
+            self._drain()
+            if not succeeded(result):
+                failures += 1
+                continue
+            samples.append(elapsed)
+            wire += emu.bytes_in + emu.bytes_out - before_bytes
+            commands += sum(emu.commands.values()) - before_cmds
+        total = sum(samples)
+        return {
+            "command": name,
+            "baud": self.baud,
+            "iterations": self.iterations,
+            "failures": failures,
+            "p50_ms": _ms(percentile(samples, 50)),
+            "p95_ms": _ms(percentile(samples, 95)),
+            "p99_ms": _ms(percentile(samples, 99)),
+            "bytes_per_call": wire / float(len(samples)) if samples else None,
+            "commands_per_s": commands / total if total else 0.0,
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+def format_table(results):
+    lines = ["%-18s %7s %10s %10s %10s %12s %10s %8s" % (
+        "command", "baud", "p50 ms", "p95 ms", "p99 ms", "bytes/call", "cmd/s", "failed")]
+    for r in results:
+        lines.append("%-18s %7d %10s %10s %10s %12s %10.1f %8d" % (
+            r["command"], r["baud"], _cell(r["p50_ms"], "%.1f"), _cell(r["p95_ms"], "%.1f"),
+            _cell(r["p99_ms"], "%.1f"), _cell(r["bytes_per_call"], "%.0f"),
+            r["commands_per_s"], r["failures"]))
+    return "\n".join(lines)
+
+
+def _cell(value, fmt):
+    # "-" when no call succeeded
+    return "-" if value is None else fmt % value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark fplib against the emulated GT-521Fx2.")
+    parser.add_argument("--baud", type=int, nargs="+", default=list(BAUDRATES))
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--commands", nargs="+", default=None)
+    parser.add_argument("--wait-ack", action="store_true", help="wait on ACKs instead of fixed sleeps")
+    parser.add_argument("--no-delays", action="store_true", help="zero sensor processing time")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write results as JSON")
+    args = parser.parse_args(argv)
+
+    delays = {} if args.no_delays else None
+    results = []
+    for baud in args.baud:
+        bench = Benchmark(baud, args.iterations, delays=delays, wait_ack=args.wait_ack)
+        results += bench.run(args.commands)
+    print(format_table(results))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
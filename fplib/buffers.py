@@ -0,0 +1,32 @@
+import threading
+
+
+class BufferPool():
+    '''
+    * Pool of preallocated receive buffers, keyed by size.
+    * Data packets are read straight into a pooled `bytearray` and handed out as a
+      `memoryview`; give it back with `Fingerprint.release()` once it is processed.
+    '''
+
+    def __init__(self, per_size=4):
+        self.per_size = per_size
+        self._free = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, size):
+        with self._lock:
+            free = self._free.get(size)
+            if free:
+                return free.pop()
+        return bytearray(size)
+
+    def release(self, buf):
+        # unwrap memoryviews and numpy arrays down to the bytearray they were made from
+        while isinstance(buf, memoryview) or getattr(buf, 'base', None) is not None:
+            buf = buf.obj if isinstance(buf, memoryview) else buf.base
+        if not isinstance(buf, bytearray):
+            return
+        with self._lock:
+            free = self._free.setdefault(len(buf), [])
+            if len(free) < self.per_size and not any(b is buf for b in free):
+                free.append(buf)
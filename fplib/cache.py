@@ -0,0 +1,91 @@
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+
+class TemplateCache():
+    '''
+    * Host side cache of downloaded templates, keyed by (sensor serial number, slot ID).
+    * Least recently used entries are evicted above `capacity`.
+    * Can be saved to / loaded from disk so repeat reads survive a restart.
+    '''
+
+    MAGIC = b'FPTC\x01'
+    _ENTRY = struct.Struct('<B32sIH')  # serial length, serial, slot, template length
+
+    def __init__(self, capacity=10000, path=None):
+        '''path: file the cache is loaded from now and saved to by save().'''
+        self.capacity = capacity
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, sensor, idx):
+        with self._lock:
+            data = self._entries.get((sensor, idx))
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((sensor, idx))
+            self.hits += 1
+            return data
+
+    def put(self, sensor, idx, data):
+        with self._lock:
+            self._entries[(sensor, idx)] = bytes(data)
+            self._entries.move_to_end((sensor, idx))
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, sensor, idx=None):
+        '''Drops one slot of a sensor, or all of its slots when idx is None.'''
+        with self._lock:
+            if idx is not None:
+                self._entries.pop((sensor, idx), None)
+                return
+            for key in [k for k in self._entries if k[0] == sensor]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def save(self, path=None):
+        path = path or self.path
+        with self._lock:
+            entries = list(self._entries.items())
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.MAGIC)
+            f.write(struct.pack('<I', len(entries)))
+            for (sensor, idx), data in entries:
+                key = sensor.encode()[:32]
+                f.write(self._ENTRY.pack(len(key), key, idx, len(data)))
+                f.write(data)
+        os.replace(tmp, path)
+
+    def load(self, path=None):
+        path = path or self.path
+        with open(path, "rb") as f:
+            blob = f.read()
+        if not blob.startswith(self.MAGIC):
+            raise ValueError("%s is not a template cache file." % path)
+        offset = len(self.MAGIC)
+        count, = struct.unpack_from('<I', blob, offset)
+        offset += 4
+        for _ in range(count):
+            length, key, idx, size = self._ENTRY.unpack_from(blob, offset)
+            offset += self._ENTRY.size
+            self.put(key[:length].decode(), idx, blob[offset:offset + size])
+            offset += size
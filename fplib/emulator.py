@@ -0,0 +1,608 @@
+import hashlib
+import logging
+import math
+import os
+import random
+import select
+import termios
+import threading
+import time
+import tty
+
+from .framing import DATA_SYNC, RESPONSE_SYNC, build_data, build_packet, verify_data, verify_packet
+from .transport import LoopbackTransport
+
+logger = logging.getLogger("Fingerprint.emulator")
+
+
+class FingerprintEmulator():
+    '''
+    * Software stand-in for a GT-521F32 / 52 sensor on a Linux pseudo-terminal.
+    * `port` is the slave side of the pty and can be handed to `Fingerprint(port, baud)`.
+    * Without a pty (or in-process): `Fingerprint("loop", baud, transport=emu.loopback())`.
+    * Fingers are simulated by 498 byte templates, see `press_finger()`.
+    '''
+
+    COMMENDS = {
+        0x01: 'Open',
+        0x02: 'Close',
+        0x03: 'UsbInternalCheck',
+        0x04: 'ChangeBaudrate',
+        0x12: 'CmosLed',
+        0x20: 'GetEnrollCount',
+        0x21: 'CheckEnrolled',
+        0x22: 'EnrollStart',
+        0x23: 'Enroll1',
+        0x24: 'Enroll2',
+        0x25: 'Enroll3',
+        0x26: 'IsPressFinger',
+        0x40: 'DeleteID',
+        0x41: 'DeleteAll',
+        0x50: 'Verify1_1',
+        0x51: 'Identify1_N',
+        0x52: 'VerifyTemplate1_1',
+        0x53: 'IdentifyTemplate1_N',
+        0x60: 'CaptureFinger',
+        0x61: 'MakeTemplate',
+        0x62: 'GetImage',
+        0x63: 'GetRawImage',
+        0x70: 'GetTemplate',
+        0x71: 'SetTemplate',
+    }
+
+    # Processing time of the sensor for each command, in seconds.
+    DELAYS = {
+        'Open': 0.005,
+        'CmosLed': 0.005,
+        'IsPressFinger': 0.01,
+        'CaptureFinger': 0.2,
+        'MakeTemplate': 0.05,
+        'Enroll1': 0.1,
+        'Enroll2': 0.1,
+        'Enroll3': 0.15,
+        'Identify1_N': 0.1,
+        'IdentifyTemplate1_N': 0.05,
+        'Verify1_1': 0.05,
+        'VerifyTemplate1_1': 0.02,
+        'GetImage': 0.02,
+        'GetRawImage': 0.2,
+    }
+
+    BAUDRATES = (9600, 19200, 38400, 57600, 115200)
+
+    TEMPLATE_SIZE = 498
+    IMAGE_SIZE = (202, 258)  # rows, columns
+    RAW_IMAGE_SIZE = (240, 320)
+
+    NACK_TIMEOUT = 0x1001
+    NACK_INVALID_BAUDRATE = 0x1002
+    NACK_INVALID_POS = 0x1003
+    NACK_IS_NOT_USED = 0x1004
+    NACK_IS_ALREADY_USED = 0x1005
+    NACK_COMM_ERR = 0x1006
+    NACK_VERIFY_FAILED = 0x1007
+    NACK_IDENTIFY_FAILED = 0x1008
+    NACK_DB_IS_FULL = 0x1009
+    NACK_DB_IS_EMPTY = 0x100A
+    NACK_TURN_ERR = 0x100B
+    NACK_BAD_FINGER = 0x100C
+    NACK_ENROLL_FAILED = 0x100D
+    NACK_IS_NOT_SUPPORTED = 0x100E
+    NACK_DEV_ERR = 0x100F
+    NACK_INVALID_PARAM = 0x1011
+    NACK_FINGER_IS_NOT_PRESSED = 0x1012
+
+    def __init__(self, baud=9600, capacity=3000, delays=None, pace=True, strict_baud=True,
+                 drop_rate=0.0, corrupt_rate=0.0, nack_rate=0.0, seed=None):
+        self.baud = baud
+        self.capacity = capacity
+        self.delays = dict(self.DELAYS if delays is None else delays)
+        self.pace = pace
+        self.strict_baud = strict_baud
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.nack_rate = nack_rate
+        self.serial_number = bytes(range(16))
+        self.firmware_version = 0x20120703
+
+        self.db = {}
+        self.finger = None
+        self.captured = None
+        self.opened = False
+        self.led = False
+        self.enroll_slot = None
+        self.enroll_stage = 0
+        self._enroll_template = None
+
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.commands = {}
+
+        self.port = None
+        self._random = random.Random(seed)
+        self._faults = []
+        self._images = {}
+        self._pending = None
+        self._buffer = bytearray()
+        self._master = None
+        self._slave = None
+        self._link = None  # sensor end of a LoopbackTransport pair
+        self._thread = None
+        self._running = False
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ------------------------------------------------------------------ pty
+
+    def start(self):
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name="fp-emulator", daemon=True)
+        self._thread.start()
+        logger.info("Emulated sensor listening on %s" % self.port)
+        return self.port
+
+    def loopback(self, timeout=1):
+        '''
+            Serves an in-process LoopbackTransport instead of a pty, returns the host end
+            for `Fingerprint(..., transport=...)`.
+        '''
+        host, self._link = LoopbackTransport.pair(timeout, self.baud)
+        self._link.timeout = 0.05
+        self.port = "loop"
+        self._running = True
+        self._thread = threading.Thread(target=self._serve_loopback, name="fp-emulator",
+                                        daemon=True)
+        self._thread.start()
+        return host
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+        self._link = None
+
+    def _host_baud(self):
+        if self._link is not None:
+            return self._link.peer.baudrate
+        speed = termios.tcgetattr(self._slave)[5]
+        for baud in self.BAUDRATES:
+            if getattr(termios, "B%d" % baud) == speed:
+                return baud
+        return None
+
+    def _serve(self):
+        while self._running:
+            r, _, _ = select.select([self._master], [], [], 0.05)
+            if not r:
+                continue
+            try:
+                chunk = os.read(self._master, 4096)
+            except OSError:
+                continue
+            if self.strict_baud and self._host_baud() != self.baud:
+                # Bytes sent at the wrong baud rate arrive as line noise.
+                continue
+            self._receive(chunk)
+
+    def _serve_loopback(self):
+        link = self._link
+        while self._running:
+            chunk = link.read(max(link.in_waiting, 1))
+            if chunk and not (self.strict_baud and self._host_baud() != self.baud):
+                self._receive(chunk)
+
+    def _receive(self, chunk):
+        self.bytes_in += len(chunk)
+        self._buffer += chunk
+        self._process()
+
+    def _send(self, data):
+        if self._link is not None:
+            self._link.write(data)
+        else:
+            os.write(self._master, data)
+
+    def _write(self, frame):
+        frame = bytearray(frame)
+        data = frame.startswith(DATA_SYNC)
+        if self._random.random() < self.corrupt_rate or self._take_fault('corrupt', data):
+            frame[-1] ^= 0xFF
+        if self._random.random() < self.drop_rate or self._take_fault('drop', data):
+            del frame[self._random.randrange(len(frame))]
+        self.bytes_out += len(frame)
+        if not self.pace:
+            self._send(frame)
+            return
+        # Emit the frame in 5ms slices, as fast as the UART would (8N1 = 10 bits per byte).
+        byte_time = 10.0 / self.baud
+        step = max(1, int(0.005 / byte_time))
+        start = time.monotonic()
+        for i in range(0, len(frame), step):
+            self._send(frame[i:i + step])
+            due = start + (i + step) * byte_time
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _wire_delay(self, nbytes):
+        if self.pace:
+            time.sleep(nbytes * 10.0 / self.baud)
+
+    # ------------------------------------------------------------- framing
+
+    def _respond(self, ack, param=0):
+        self._write(build_packet(0x30 if ack else 0x31, param))
+
+    def _respond_data(self, payload):
+        self._write(build_data(payload))
+
+    def _nack(self, error):
+        self._respond(False, error)
+
+    def _process(self):
+        while True:
+            if self._pending:
+                if not self._process_data():
+                    return
+                continue
+            start = self._buffer.find(RESPONSE_SYNC)
+            if start < 0:
+                del self._buffer[:-1]
+                return
+            del self._buffer[:start]
+            if len(self._buffer) < 12:
+                return
+            packet = bytes(self._buffer[:12])
+            del self._buffer[:12]
+            if not verify_packet(packet):
+                logger.debug("Dropping command packet with bad checksum")
+                continue
+            param = int.from_bytes(packet[4:8], 'little')
+            cmd = int.from_bytes(packet[8:10], 'little')
+            self._wire_delay(12)
+            self._dispatch(cmd, param)
+
+    def _process_data(self):
+        cmd, param, size = self._pending
+        start = self._buffer.find(DATA_SYNC)
+        if start < 0:
+            del self._buffer[:-1]
+            return False
+        del self._buffer[:start]
+        if len(self._buffer) < size + 6:
+            return False
+        frame = bytes(self._buffer[:size + 6])
+        del self._buffer[:size + 6]
+        self._pending = None
+        self._wire_delay(len(frame))
+        if not verify_data(frame):
+            self._nack(self.NACK_COMM_ERR)
+            return True
+        handler = getattr(self, "_data_" + cmd)
+        handler(param, frame[4:-2])
+        return True
+
+    def _dispatch(self, cmd, param):
+        name = self.COMMENDS.get(cmd)
+        self.commands[name or cmd] = self.commands.get(name or cmd, 0) + 1
+        if name is None:
+            self._nack(self.NACK_IS_NOT_SUPPORTED)
+            return
+        delay = self.delays.get(name, 0)
+        if delay:
+            time.sleep(delay)
+        fault = self._take_fault('nack')
+        if fault or self._random.random() < self.nack_rate:
+            self._nack(fault[1] if fault and fault[1] else self.NACK_DEV_ERR)
+            return
+        with self._lock:
+            getattr(self, "_cmd_" + name)(param)
+
+    # -------------------------------------------------------- fault control
+
+    def fail_next(self, kind, error=None, data=False):
+        '''
+        Inject a one shot fault into the next response.
+        kind: 'nack' (optionally with an error code), 'corrupt' or 'drop'.
+        data: apply 'corrupt' / 'drop' to the next data packet instead of the next frame.
+        '''
+        self._faults.append((kind, error, data))
+
+    def _take_fault(self, kind, data=False):
+        for i, fault in enumerate(self._faults):
+            if fault[0] == kind and (data or not fault[2]):
+                return self._faults.pop(i)
+        return None
+
+    # ------------------------------------------------------- finger control
+
+    def press_finger(self, template=None):
+        '''Place a finger on the sensor. The finger is identified by its template.'''
+        if template is None:
+            template = self.make_template(self._random.getrandbits(32))
+        self.finger = bytes(template)
+        return self.finger
+
+    def release_finger(self):
+        self.finger = None
+
+    @classmethod
+    def make_template(cls, seed):
+        '''Deterministic 498 byte template for the given seed.'''
+        out = bytearray()
+        counter = 0
+        while len(out) < cls.TEMPLATE_SIZE:
+            out += hashlib.sha256(b"%d:%d" % (seed, counter)).digest()
+            counter += 1
+        return bytes(out[:cls.TEMPLATE_SIZE])
+
+    def _image(self, template, shape):
+        key = (template, shape)
+        if key not in self._images:
+            self._images[key] = self._render(template, shape)
+        return self._images[key]
+
+    @staticmethod
+    def _render(template, shape):
+        # Elliptical blob of concentric ridges on a light background.
+        rows, cols = shape
+        phase = template[0] / 255.0 * math.pi if template else 0.0
+        period = 7.0 + (template[1] % 4 if template else 0)
+        cy, cx = rows / 2.0, cols / 2.0
+        ry, rx = rows * 0.42, cols * 0.36
+        image = bytearray(b'\xe6' * (rows * cols)) if template else bytearray(b'\xf0' * (rows * cols))
+        if not template:
+            return bytes(image)
+        for y in range(rows):
+            dy = (y - cy) / ry
+            base = y * cols
+            for x in range(cols):
+                dx = (x - cx) / rx
+                if dx * dx + dy * dy > 1.0:
+                    continue
+                r = math.hypot(x - cx, (y - cy) * 0.8)
+                image[base + x] = int(128 + 100 * math.sin(2 * math.pi * r / period + phase))
+        return bytes(image)
+
+    # ------------------------------------------------------------- commands
+
+    def _cmd_Open(self, param):
+        self.opened = True
+        self._respond(True)
+        if param:
+            info = bytearray()
+            info += self.firmware_version.to_bytes(4, 'little')
+            info += self.TEMPLATE_SIZE.to_bytes(4, 'little')
+            info += self.serial_number
+            self._respond_data(info)
+
+    def _cmd_Close(self, param):
+        self.opened = False
+        self._respond(True)
+
+    def _cmd_UsbInternalCheck(self, param):
+        self._respond(True, 0x55)
+
+    def _cmd_ChangeBaudrate(self, param):
+        if param not in self.BAUDRATES:
+            self._nack(self.NACK_INVALID_BAUDRATE)
+            return
+        self._respond(True)
+        self.baud = param
+
+    def _cmd_CmosLed(self, param):
+        self.led = bool(param)
+        self._respond(True)
+
+    def _cmd_GetEnrollCount(self, param):
+        self._respond(True, len(self.db))
+
+    def _valid_slot(self, param):
+        return 0 <= param < self.capacity
+
+    def _cmd_CheckEnrolled(self, param):
+        if not self._valid_slot(param):
+            self._nack(self.NACK_INVALID_POS)
+        elif param in self.db:
+            self._respond(True)
+        else:
+            self._nack(self.NACK_IS_NOT_USED)
+
+    def _cmd_EnrollStart(self, param):
+        if param == 0xFFFFFFFF:
+            param = -1
+        elif not self._valid_slot(param):
+            self._nack(self.NACK_INVALID_POS)
+            return
+        elif param in self.db:
+            self._nack(self.NACK_IS_ALREADY_USED)
+            return
+        if len(self.db) >= self.capacity:
+            self._nack(self.NACK_DB_IS_FULL)
+            return
+        self.enroll_slot = param
+        self.enroll_stage = 0
+        self._respond(True)
+
+    def _enroll_stage(self, stage):
+        if self.enroll_slot is None or self.enroll_stage != stage - 1:
+            self._nack(self.NACK_TURN_ERR)
+            return False
+        if self.captured is None:
+            self._nack(self.NACK_BAD_FINGER)
+            return False
+        if stage > 1 and self.captured != self._enroll_template:
+            self._nack(self.NACK_ENROLL_FAILED)
+            self.enroll_slot = None
+            return False
+        for slot, template in self.db.items():
+            if template == self.captured:
+                # Duplicated finger, the parameter is the ID it is enrolled with.
+                self._respond(False, slot)
+                self.enroll_slot = None
+                return False
+        self._enroll_template = self.captured
+        self.enroll_stage = stage
+        return True
+
+    def _cmd_Enroll1(self, param):
+        if self._enroll_stage(1):
+            self._respond(True)
+
+    def _cmd_Enroll2(self, param):
+        if self._enroll_stage(2):
+            self._respond(True)
+
+    def _cmd_Enroll3(self, param):
+        if not self._enroll_stage(3):
+            return
+        slot, self.enroll_slot = self.enroll_slot, None
+        if slot == -1:
+            self._respond(True)
+            self._respond_data(self._enroll_template)
+        else:
+            self.db[slot] = self._enroll_template
+            self._respond(True)
+
+    def _cmd_IsPressFinger(self, param):
+        self._respond(True, 0 if self.finger is not None else 1)
+
+    def _cmd_DeleteID(self, param):
+        if not self._valid_slot(param):
+            self._nack(self.NACK_INVALID_POS)
+        elif self.db.pop(param, None) is None:
+            self._nack(self.NACK_IS_NOT_USED)
+        else:
+            self._respond(True)
+
+    def _cmd_DeleteAll(self, param):
+        if not self.db:
+            self._nack(self.NACK_DB_IS_EMPTY)
+            return
+        self.db.clear()
+        self._respond(True)
+
+    def _match(self, template):
+        for slot in sorted(self.db):
+            if self.db[slot] == template:
+                return slot
+        return None
+
+    def _cmd_Verify1_1(self, param):
+        if not self._valid_slot(param):
+            self._nack(self.NACK_INVALID_POS)
+        elif param not in self.db:
+            self._nack(self.NACK_IS_NOT_USED)
+        elif self.finger is None:
+            self._nack(self.NACK_FINGER_IS_NOT_PRESSED)
+        elif self.db[param] != self.captured:
+            self._nack(self.NACK_VERIFY_FAILED)
+        else:
+            self._respond(True)
+
+    def _cmd_Identify1_N(self, param):
+        if not self.db:
+            self._nack(self.NACK_DB_IS_EMPTY)
+            return
+        if self.captured is None:
+            self._nack(self.NACK_FINGER_IS_NOT_PRESSED)
+            return
+        slot = self._match(self.captured)
+        if slot is None:
+            self._nack(self.NACK_IDENTIFY_FAILED)
+        else:
+            self._respond(True, slot)
+
+    def _expect_data(self, cmd, param):
+        self._pending = (cmd, param, self.TEMPLATE_SIZE)
+        self._respond(True)
+
+    def _cmd_VerifyTemplate1_1(self, param):
+        if not self._valid_slot(param):
+            self._nack(self.NACK_INVALID_POS)
+        elif param not in self.db:
+            self._nack(self.NACK_IS_NOT_USED)
+        else:
+            self._expect_data('VerifyTemplate1_1', param)
+
+    def _data_VerifyTemplate1_1(self, param, template):
+        if self.db.get(param) == template:
+            self._respond(True)
+        else:
+            self._nack(self.NACK_VERIFY_FAILED)
+
+    def _cmd_IdentifyTemplate1_N(self, param):
+        if not self.db:
+            self._nack(self.NACK_DB_IS_EMPTY)
+        else:
+            self._expect_data('IdentifyTemplate1_N', param)
+
+    def _data_IdentifyTemplate1_N(self, param, template):
+        slot = self._match(template)
+        if slot is None:
+            self._nack(self.NACK_IDENTIFY_FAILED)
+        else:
+            self._respond(True, slot)
+
+    def _cmd_CaptureFinger(self, param):
+        if self.finger is None:
+            self.captured = None
+            self._nack(self.NACK_FINGER_IS_NOT_PRESSED)
+            return
+        self.captured = self.finger
+        self._respond(True)
+
+    def _cmd_MakeTemplate(self, param):
+        if self.captured is None:
+            self._nack(self.NACK_BAD_FINGER)
+            return
+        self._respond(True)
+        self._respond_data(self.captured)
+
+    def _cmd_GetImage(self, param):
+        self._respond(True)
+        self._respond_data(self._image(self.captured, self.IMAGE_SIZE))
+
+    def _cmd_GetRawImage(self, param):
+        self._respond(True)
+        self._respond_data(self._image(self.finger, self.RAW_IMAGE_SIZE))
+
+    def _cmd_GetTemplate(self, param):
+        if not self._valid_slot(param):
+            self._nack(self.NACK_INVALID_POS)
+        elif param not in self.db:
+            self._nack(self.NACK_IS_NOT_USED)
+        else:
+            self._respond(True)
+            self._respond_data(self.db[param])
+
+    def _cmd_SetTemplate(self, param):
+        if not self._valid_slot(param & 0xFFFF):
+            self._nack(self.NACK_INVALID_POS)
+        else:
+            self._expect_data('SetTemplate', param)
+
+    def _data_SetTemplate(self, param, template):
+        slot = param & 0xFFFF
+        if not param >> 16:
+            # Duplication check requested.
+            duplicate = self._match(template)
+            if duplicate is not None and duplicate != slot:
+                self._respond(False, duplicate)
+                return
+        self.db[slot] = bytes(template)
+        self._respond(True)
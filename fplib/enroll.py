@@ -0,0 +1,162 @@
+from collections import namedtuple
+
+from .errors import RETRYABLE
+
+# kind: 'prompt', 'finger_down', 'finger_up', 'stage_done', 'retry', 'duplicate', 'failed' or
+# 'done'. param: the error code of a retry, the ID of a duplicate, the enrolled ID when done.
+EnrollEvent = namedtuple('EnrollEvent', 'kind stage param')
+
+# ok: enrolled, idx: its ID (-1 if only the template was asked for), template: the merged
+# template if it was downloaded, duplicate: ID the finger is already enrolled with.
+EnrollResult = namedtuple('EnrollResult', 'ok idx template duplicate')
+
+
+class RetryPolicy(namedtuple('RetryPolicy', 'attempts restarts finger_timeout')):
+    '''
+    * attempts: tries per stage when the capture or the stage is refused for a reason
+      that can go away (bad finger, ...), other errors (database full, ...) end at once.
+    * restarts: how often the enrollment starts over after the sensor dropped it.
+    * finger_timeout: seconds to wait for the finger on each prompt, None waits forever.
+    '''
+
+    __slots__ = ()
+
+    def __new__(cls, attempts=3, restarts=1, finger_timeout=10):
+        return super(RetryPolicy, cls).__new__(cls, attempts, restarts, finger_timeout)
+
+
+class Enrollment():
+    '''
+    * Enrollment as a state machine: for each of the three stages prompt, wait for the
+      finger, capture, EnrollN, wait for the finger to lift. There are no fixed sleeps,
+      the finger is polled with wait_for_finger() and the LED stays on throughout.
+    * Iterating over an Enrollment runs it step by step and yields an EnrollEvent per
+      transition; `on_event` is called with the same events. run() runs it to the end.
+    * check_duplicate: enroll without saving (ID -1), look the merged template up with
+      IdentifyTemplate1_N and only store it with SetTemplate if it is unknown. Otherwise
+      the template is saved by Enroll3 directly (the sensor still refuses a finger
+      enrolled under another ID, which is reported as 'duplicate').
+    '''
+
+    def __init__(self, fp, idx=None, check_duplicate=True, policy=None, on_event=None):
+        '''idx: ID to enroll under, the first free ID if None, -1 to only get the template.'''
+        self.fp = fp
+        self.idx = idx
+        self.check_duplicate = check_duplicate
+        self.policy = policy or RetryPolicy()
+        self.on_event = on_event
+        self.result = None
+
+    def __iter__(self):
+        return self._run()
+
+    def run(self):
+        for _ in self:
+            pass
+        return self.result
+
+    def _event(self, kind, stage=0, param=None):
+        event = EnrollEvent(kind, stage, param)
+        if self.on_event:
+            self.on_event(event)
+        return event
+
+    def _free_slot(self):
+        fp = self.fp
+        idx = fp.get_enrolled_cnt()
+        if idx is None or idx < 0:
+            return None
+        while fp.check_enrolled(idx):
+            idx += 1
+        return idx
+
+    def _finish(self, ok, idx, stage=0, template=None, duplicate=None):
+        self.fp.set_led(False)
+        self.result = EnrollResult(ok, idx, template, duplicate)
+        if duplicate is not None:
+            return self._event('duplicate', stage, duplicate)
+        return self._event('done' if ok else 'failed', stage, idx)
+
+    def _stages(self, state):
+        # Runs EnrollStart and the three stages, state['stage'] is the stage reached.
+        # Yields the events; state['outcome'] ends up 'ok', 'restart', 'failed' or 'duplicate'.
+        fp = self.fp
+        policy = self.policy
+        if not fp.start_enroll(state['target']):
+            state['outcome'] = 'failed'
+            return
+        failures = 0
+        stage = state['stage'] = 1
+        while stage <= 3:
+            yield self._event('prompt', stage)
+            if not fp.wait_for_finger(policy.finger_timeout):
+                state['outcome'] = 'failed'
+                return
+            yield self._event('finger_down', stage)
+            if fp.capture_finger(best=True):
+                ack, param, state['template'] = fp._enroll_stage(stage)
+            else:
+                ack, param = False, fp.last_error
+            if ack:
+                yield self._event('stage_done', stage)
+                stage = state['stage'] = stage + 1
+                failures = 0
+            elif param is not None and param < fp.NACK_TIMEOUT:
+                # A NACK with an ID as its parameter: the finger is enrolled already.
+                state['outcome'], state['duplicate'] = 'duplicate', param
+                return
+            else:
+                failures += 1
+                retryable = param is None or param in RETRYABLE or param == fp.NACK_ENROLL_FAILED
+                if failures >= policy.attempts or not retryable:
+                    state['outcome'] = 'failed'
+                    return
+                yield self._event('retry', stage, param)
+            if stage <= 3 or param == fp.NACK_ENROLL_FAILED:
+                if not fp.wait_for_release(policy.finger_timeout, keep_led=True):
+                    state['outcome'] = 'failed'
+                    return
+                yield self._event('finger_up', stage - 1 if ack else stage)
+            if param == fp.NACK_ENROLL_FAILED:
+                # The sensor dropped the enrollment, it has to start over.
+                state['outcome'] = 'restart'
+                return
+        state['outcome'] = 'ok'
+
+    def _run(self):
+        fp = self.fp
+        idx = self.idx if self.idx is not None else self._free_slot()
+        if idx is None:
+            yield self._finish(False, None)
+            return
+        # Enrolling under -1 makes Enroll3 send the merged template back.
+        state = {'target': -1 if self.check_duplicate else idx, 'stage': 0, 'template': None}
+        for restart in range(self.policy.restarts + 1):
+            for event in self._stages(state):
+                yield event
+            if state['outcome'] != 'restart':
+                break
+        if state['outcome'] == 'duplicate':
+            yield self._finish(False, idx, state['stage'], duplicate=state['duplicate'])
+            return
+        if state['outcome'] != 'ok':
+            yield self._finish(False, idx, state['stage'])
+            return
+        if not self.check_duplicate:
+            yield self._finish(True, idx, 3)
+            return
+
+        template = state['template']
+        if template is None:
+            yield self._finish(False, idx, 3)
+            return
+        template = bytes(template)
+        duplicate = fp.identifyTemplate(template)
+        if duplicate is None:
+            yield self._finish(False, idx, 3, template)
+        elif duplicate >= 0:
+            yield self._finish(False, idx, 3, template, duplicate)
+        elif idx != -1 and not fp.setTemplate(idx, template, check_duplicate=False):
+            yield self._finish(False, idx, 3, template)
+        else:
+            yield self._finish(True, idx, 3, template)
@@ -0,0 +1,47 @@
+try:
+    from enum import IntEnum
+except ImportError:  # MicroPython: the codes are plain ints
+    IntEnum = object
+
+
+class NackError(IntEnum):
+    '''Error codes the sensor sends as the parameter of a NACK.'''
+
+    TIMEOUT = 0x1001  # obsolete, capture timeout
+    INVALID_BAUDRATE = 0x1002  # obsolete, invalid serial baud rate
+    INVALID_POS = 0x1003  # the specified ID is not between 0 and the capacity
+    IS_NOT_USED = 0x1004  # the specified ID is not used
+    IS_ALREADY_USED = 0x1005  # the specified ID is already used
+    COMM_ERR = 0x1006  # communication error, e.g. a corrupted data packet
+    VERIFY_FAILED = 0x1007  # 1:1 verification failure
+    IDENTIFY_FAILED = 0x1008  # 1:N identification failure
+    DB_IS_FULL = 0x1009  # the database is full
+    DB_IS_EMPTY = 0x100A  # the database is empty
+    TURN_ERR = 0x100B  # obsolete, invalid order of the enrollment
+    BAD_FINGER = 0x100C  # too bad fingerprint
+    ENROLL_FAILED = 0x100D  # enrollment failure
+    IS_NOT_SUPPORTED = 0x100E  # the specified command is not supported
+    DEV_ERR = 0x100F  # device error, especially if the crypto chip is trouble
+    CAPTURE_CANCELED = 0x1010  # obsolete, the capturing is canceled
+    INVALID_PARAM = 0x1011  # invalid parameter
+    FINGER_IS_NOT_PRESSED = 0x1012  # finger is not pressed
+
+    @classmethod
+    def lookup(cls, code):
+        '''The NackError of `code`, None if it is not an error code (e.g. a duplicate ID).'''
+        if IntEnum is object:
+            return code if cls.TIMEOUT <= code <= cls.FINGER_IS_NOT_PRESSED else None
+        try:
+            return cls(code)
+        except ValueError:
+            return None
+
+
+# Errors that can go away by capturing or sending again; the others will not.
+RETRYABLE = frozenset((
+    NackError.TIMEOUT,
+    NackError.COMM_ERR,
+    NackError.BAD_FINGER,
+    NackError.FINGER_IS_NOT_PRESSED,
+    NackError.CAPTURE_CANCELED,
+))
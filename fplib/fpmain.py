@@ -1,49 +1,22 @@
-import codecs
 import logging
-import serial
+import struct
 import time
 
-logging.basicConfig(format="[%(name)s][%(asctime)s] %(message)s")
+from .enroll import Enrollment, RetryPolicy
+from .errors import NackError
+from .framing import (COMMENDS, DATA_HEADER, DATA_SIZES, DATA_SYNC, NO_RESPONSE, RESPONSE_SYNC,
+                      UPLOAD_SIZES, FrameReader, _monotonic, build_packet, data_checksum,
+                      parse_response, unwrap_data, verify_data, verify_packet)
+from .transport import open_transport
+
+# The modules imported on first use (archive, batch, sync, images) are not needed on
+# MicroPython, where this class runs under fplibMicro.py.
+
 logger = logging.getLogger("Fingerprint")
-logger.setLevel(logging.INFO)
 
 class Fingerprint():
 
-    COMMENDS = {
-        'None': 0x00,  # Default value for enum. Scanner will return error if sent this.
-        'Open': 0x01,  # Open Initialization
-        'Close': 0x02,  # Close Termination
-        'UsbInternalCheck': 0x03,  # UsbInternalCheck Check if the connected USB device is valid
-        'ChangeBaudrate': 0x04,  # ChangeBaudrate Change UART baud rate
-        'SetIAPMode': 0x05,  # SetIAPMode Enter IAP Mode In this mode, FW Upgrade is available
-        'CmosLed': 0x12,  # CmosLed Control CMOS LED
-        'GetEnrollCount': 0x20,  # Get enrolled fingerprint count
-        'CheckEnrolled': 0x21,  # Check whether the specified ID is already enrolled
-        'EnrollStart': 0x22,  # Start an enrollment
-        'Enroll1': 0x23,  # Make 1st template for an enrollment
-        'Enroll2': 0x24,  # Make 2nd template for an enrollment
-        'Enroll3': 0x25,
-        # Make 3rd template for an enrollment, merge three templates into one template, save merged template to the database
-        'IsPressFinger': 0x26,  # Check if a finger is placed on the sensor
-        'DeleteID': 0x40,  # Delete the fingerprint with the specified ID
-        'DeleteAll': 0x41,  # Delete all fingerprints from the database
-        'Verify1_1': 0x50,  # Verification of the capture fingerprint image with the specified ID
-        'Identify1_N': 0x51,  # Identification of the capture fingerprint image with the database
-        'VerifyTemplate1_1': 0x52,  # Verification of a fingerprint template with the specified ID
-        'IdentifyTemplate1_N': 0x53,  # Identification of a fingerprint template with the database
-        'CaptureFinger': 0x60,  # Capture a fingerprint image(256x256) from the sensor
-        'MakeTemplate': 0x61,  # Make template for transmission
-        'GetImage': 0x62,  # Download the captured fingerprint image(256x256)
-        'GetRawImage': 0x63,  # Capture & Download raw fingerprint image(320x240)
-        'GetTemplate': 0x70,  # Download the template of the specified ID
-        'SetTemplate': 0x71,  # Upload the template of the specified ID
-        'GetDatabaseStart': 0x72,  # Start database download, obsolete
-        'GetDatabaseEnd': 0x73,  # End database download, obsolete
-        'UpgradeFirmware': 0x80,  # Not supported
-        'UpgradeISOCDImage': 0x81,  # Not supported
-        'Ack': 0x30,  # Acknowledge.
-        'Nack': 0x31  # Non-acknowledge
-    }
+    COMMENDS = COMMENDS
 
     PACKET_RES_0 = 0x55
     PACKET_RES_1 = 0xAA
@@ -53,52 +26,183 @@ class Fingerprint():
     ACK = 0x30
     NACK = 0x31
 
+    # see fplib.errors.NackError for all error codes
+    NACK_TIMEOUT = NackError.TIMEOUT  # lowest error code, NACK parameters below it are IDs
+    NACK_INVALID_POS = NackError.INVALID_POS  # the ID is out of range
+    NACK_IS_NOT_USED = NackError.IS_NOT_USED  # nothing is enrolled under the ID
+    NACK_COMM_ERR = NackError.COMM_ERR  # the sensor rejected a corrupted data packet
+    NACK_ENROLL_FAILED = NackError.ENROLL_FAILED  # the enroll stages did not match
+
+    SKIP_DUPLICATE_CHECK = 1 << 16  # added to the SetTemplate ID
+
+    DB_CAPACITY = 3000  # GT-521F52, the GT-521F32 holds 200
+
+    BAUDRATES = (9600, 19200, 38400, 57600, 115200)  # supported by ChangeBaudrate
+
+    # Ready made packets of every command with parameter 0.
+    PACKETS = {name: build_packet(code) for name, code in COMMENDS.items()}
+
+    DATA_SIZES = DATA_SIZES
+    UPLOAD_SIZES = UPLOAD_SIZES
+
+    # Fixed delays (seconds) of the original implementation, used unless wait_ack is set.
+    LEGACY_SETTLE = {
+        'Connect': 1.0,  # after opening the port in init()
+        'OpenSerial': 0.1,  # after reopening the port in open_serial()
+        'CmosLed': 1.0,  # after turning the LED on, before capturing
+        'Data': 0.1,  # after writing a data packet, before reading its response
+    }
+
+    # Minimum settle times (seconds) that are kept when waiting on the ACK packet.
+    SETTLE = {
+        'ChangeBaudrate': 0.05,  # the sensor switches its UART after sending the ACK
+    }
 
-    def __init__(self, port, baud, timeout=1):
+    def __init__(self, port, baud, timeout=1, wait_ack=False, settle=None, response_timeout=5,
+                 pool=None, retries=1, cache=None, profile=None, hook=None, transport=None):
+        '''
+            wait_ack: wait for the response packet (up to response_timeout seconds) instead of
+                      sleeping fixed delays, only the settle times in SETTLE are kept.
+            settle: per command overrides of the settle times, e.g. {'CmosLed': 0.2}
+            pool: a BufferPool to take data packet buffers from, see release().
+            retries: how often a data transfer is repeated after a checksum error.
+            cache: a TemplateCache serving repeat getTemplate() calls without the wire.
+            profile: a LinkProfile with the last working baud rate of the port, see connect().
+            hook: a fplib.metrics.Hook (e.g. Metrics) told about every packet sent and read.
+            transport: an already created transport to talk over (see fplib.transport),
+                       e.g. a LoopbackTransport; by default `port` is opened with
+                       open_transport(), which also takes "tcp://host:port".
+        '''
         self.port = port
         self.baud = baud
         self.timeout = timeout
+        self.wait_ack = wait_ack
+        self.response_timeout = response_timeout
+        self.settle = dict(Fingerprint.SETTLE if wait_ack else Fingerprint.LEGACY_SETTLE)
+        if settle:
+            self.settle.update(settle)
         self.ser = None
+        self.transport = transport
+        self._enroll_idx = None
+        self._reader = FrameReader()
+        self.pool = pool
+        self.retries = retries
+        self.cache = cache
+        self.profile = profile
+        self._sensor_id = None
+        self._led = False
+        self.last_quality = None
+        self.hook = hook
+        self.last_response = None
+        self._cmd = None
+        self._sent_at = 0.0
 
     def __del__(self):
         self.close_serial()
 
     def init(self):
         try:
-            self.ser = serial.Serial(self.port, baudrate=self.baud, timeout=self.timeout)
-            time.sleep(1)
+            self.ser = self._open_transport(self.baud)
+            self._settle('Connect')
             connected = self.open_serial()
             if not connected:
                 self.ser.close()
                 baud_prev = 9600 if self.baud == 115200 else 115200
-                self.ser = serial.Serial(self.port, baudrate=baud_prev, timeout=self.timeout)
+                self.ser = self._open_transport(baud_prev)
                 if not self.open_serial():
                     raise Exception()
                 if self.open():
                     self.change_baud(self.baud)
                     logger.info("The baud rate is changed to %s." % self.baud)
                 self.ser.close()
-                self.ser = serial.Serial(self.port, baudrate=self.baud, timeout=self.timeout)
+                self.ser = self._open_transport(self.baud)
                 if not self.open_serial():
                     raise Exception()
             logger.info("Serial connected.")
             self.open()
             self._flush()
+            self._resolve_sensor_id()
             self.close()
             return True
         except Exception as e:
-            print("Failed to connect to the serial.")
             logger.error("Failed to connect to the serial.")
             logger.error(e)
         return False
 
+    def connect(self, target=None):
+        '''
+            Fast alternative to init(): opens the port once and finds the baud rate with
+            one Open per guess, starting with the rate in the LinkProfile, then `baud`, then
+            the other supported rates. If the sensor is slower than `target` (default:
+            `baud`) it is switched over with ChangeBaudrate. The rate that works is saved
+            to the profile.
+            Returns: True if the sensor answers.
+        '''
+        if target is None:
+            target = self.baud
+        cached = self.profile.get(self.port) if self.profile else None
+        guesses = []
+        for baud in [cached, self.baud] + sorted(Fingerprint.BAUDRATES, reverse=True):
+            if baud is not None and baud not in guesses:
+                guesses.append(baud)
+        try:
+            if not self.is_connected():
+                self.ser = self._open_transport(cached or self.baud)
+                self._settle('Connect')
+            found = None
+            for baud in guesses:
+                self._set_link_baud(baud)
+                if self.open():
+                    found = baud
+                    break
+            if found is None:
+                raise IOError("The sensor does not answer at any baud rate.")
+            if found < target and self.change_baud(target):
+                self._set_link_baud(target)
+                if self.open():
+                    found = target
+                else:
+                    # the sensor did not switch after all
+                    self._set_link_baud(found)
+            self.baud = found
+            if self.profile:
+                self.profile.put(self.port, found)
+            logger.info("Serial connected at %s baud." % found)
+            self._resolve_sensor_id()
+            return True
+        except Exception as e:
+            logger.error("Failed to connect to the serial.")
+            logger.error(e)
+            if self.profile:
+                self.profile.forget(self.port)
+            self.close_serial()
+        return False
+
+    def _open_transport(self, baud):
+        # The transport given to the constructor set to `baud`, or `port` opened anew.
+        if self.transport is None:
+            return open_transport(self.port, baud, self.timeout)
+        self.transport.baudrate = baud
+        self.transport.timeout = self.timeout
+        if not self.transport.isOpen():
+            self.transport.open()
+        return self.transport
+
+    def _set_link_baud(self, baud):
+        # Changing the rate of the open port, no close / reopen needed.
+        if self.ser.baudrate != baud:
+            self.ser.baudrate = baud
+        self._flush()
+
     def open_serial(self):
         if not self.ser:
             return False
         if self.ser.isOpen():
             self.ser.close()
         self.ser.open()
-        time.sleep(0.1)
+        self._reader.clear()
+        self._led = False
+        self._settle('OpenSerial')
         connected = self.open()
         if connected is None:
             return False
@@ -117,131 +221,206 @@ class Fingerprint():
             return True
         return False
 
+    def batch(self):
+        '''
+            Batch of commands sent with as few writes as possible, see fplib.batch.Batch:
+                with fp.batch() as b:
+                    b.set_led(True)
+                    b.capture_finger()
+                print(b.results)
+        '''
+        from .batch import Batch
+        return Batch(self)
+
+    def _settle(self, name):
+        delay = self.settle.get(name)
+        if delay:
+            time.sleep(delay)
+
     def _send_packet(self, cmd, param=0):
-        cmd = Fingerprint.COMMENDS[cmd]
-        param = [int(hex(param >> i & 0xFF), 16) for i in (0, 8, 16, 24)]
-
-        packet = bytearray(12)
-        packet[0] = 0x55
-        packet[1] = 0xAA
-        packet[2] = 0x01
-        packet[3] = 0x00
-        packet[4] = param[0]
-        packet[5] = param[1]
-        packet[6] = param[2]
-        packet[7] = param[3]
-        packet[8] = cmd & 0x00FF
-        packet[9] = (cmd >> 8) & 0x00FF
-        chksum = sum(bytes(packet[:10]))
-        packet[10] = chksum & 0x00FF
-        packet[11] = (chksum >> 8) & 0x00FF
+        if param == 0:
+            packet = Fingerprint.PACKETS[cmd]
+        else:
+            packet = build_packet(Fingerprint.COMMENDS[cmd], param)
         if self.ser and self.ser.writable():
             self.ser.write(packet)
+            if self.hook is not None:
+                self._cmd = cmd
+                self._sent_at = _monotonic()
+                self.hook.command(cmd, len(packet))
             return True
         else:
             return False
 
-    def _send_data(self, data, parameter=False): 
+    def _send_data(self, data, size):
+        '''
+            Writes `data` as a data packet: header, device ID, payload and checksum. The
+            payload is written on its own, so bytes / bytearray / memoryview payloads go out
+            without being copied. A device ID + `size` byte payload + checksum body (the
+            layout downloads used to return) is accepted as well and sent unchanged.
+        '''
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        payload = unwrap_data(data, size)
+        if payload is None:
+            payload = data
         if self.ser and self.ser.writable():
-            print("length of written data : ", self.ser.write(data))
-            time.sleep(0.1)
-            print("SENDing DATA ...", end=' ')
-            ack, param, _, _ = self._read_packet()
-            print("✅")
-            if parameter:
-                if ack:
-                    return param
-                return -1
-            return ack
-        else:
-            return False
+            written = self.ser.write(DATA_HEADER)
+            written += self.ser.write(memoryview(payload))
+            written += self.ser.write(data_checksum(payload))
+            logger.debug("length of written data : %d", written)
+            if self.hook is not None:
+                self._sent_at = _monotonic()
+                self.hook.data(self._cmd, written)
+            self._settle('Data')
+            return True
+        return False
+
+    def _download(self, cmd, param=0, on_data=None):
+        '''
+            Sends `cmd` and reads its response and data packet, sending the command again
+            (up to `retries` times) if the data packet is corrupted or incomplete.
+            on_data: progress callback of the data packet, see FrameReader.read_frame_into().
+            Returns: ack, param, res, data
+        '''
+        size = Fingerprint.DATA_SIZES[cmd]
+        for attempt in range(self.retries + 1):
+            if not self._send_packet(cmd, param):
+                return None, None, None, None
+            ack, rparam, res, data = self._read_packet(size=size, on_data=on_data)
+            if not ack or data is not None:
+                break
+            logger.warning("Retrying %s, bad data packet." % cmd)
+            if self.hook is not None:
+                self.hook.retry(cmd)
+            self._flush()
+        return ack, rparam, res, data
+
+    def _upload(self, cmd, param, data):
+        '''
+            Sends `cmd` followed by `data` as a data packet, starting over (up to `retries`
+            times) when the sensor reports a communication error on the data packet.
+            Raises ValueError if `data` is not a whole template (UPLOAD_SIZES), which the
+            sensor would wait on forever.
+            Returns: ack, param of the last response
+        '''
+        size = Fingerprint.UPLOAD_SIZES[cmd]
+        if len(data) != size and unwrap_data(data, size) is None:
+            raise ValueError("%s takes %d bytes, got %d." % (cmd, size, len(data)))
+        for attempt in range(self.retries + 1):
+            if not self._send_packet(cmd, param):
+                return None, None
+            ack, rparam, _, _ = self._read_packet()
+            if not ack:
+                return ack, rparam
+            if not self._send_data(data, size):
+                return None, None
+            ack, rparam, _, _ = self._read_packet()
+            if ack or rparam != Fingerprint.NACK_COMM_ERR:
+                break
+            logger.warning("Retrying %s, data packet rejected." % cmd)
+            if self.hook is not None:
+                self.hook.retry(cmd)
+        return ack, rparam
 
     def _flush(self):
-        while self.ser.readable() and self.ser.inWaiting() > 0:
-            p = self.ser.read(self.ser.inWaiting())
+        self._reader.clear()
+        while self.ser.readable() and self.ser.in_waiting > 0:
+            p = self.ser.read(self.ser.in_waiting)
             if p == b'':
                 break
 
-    def _read(self):
-        if self.ser and self.ser.readable():
-            try:
-                p = self.ser.read()
-                if p == b'':
-                    return None
-                return int(codecs.encode(p, 'hex_codec'), 16)
-            except:
-                return None
-        else:
+    def _read_data(self, size, on_data=None):
+        '''
+            Reads one data packet with a payload of `size` bytes into a preallocated buffer.
+            Returns a memoryview of the payload as soon as the packet is complete, or None if
+            it did not arrive in time or its checksum is wrong.
+        '''
+        frame = self.pool.acquire(size + 6) if self.pool else bytearray(size + 6)
+        n = self._reader.read_frame_into(self.ser, DATA_SYNC, frame, self.response_timeout,
+                                         on_data)
+        if n < len(frame):
+            logger.error("Incomplete data packet, got %d of %d bytes." % (n, len(frame)))
+            self.release(frame)
             return None
+        if not verify_data(frame):
+            logger.error("Data packet checksum mismatch.")
+            self.release(frame)
+            return None
+        return memoryview(frame)[4:-2]
+
+    def release(self, data):
+        '''Returns a buffer handed out by a download to the BufferPool, if there is one.'''
+        if self.pool and data is not None:
+            self.pool.release(data)
+
+    def _read_packet(self, wait=True, size=None, on_data=None):
+        if self.hook is None:
+            response = self.last_response = self._read_response(wait, size, on_data)
+            return response
+        resyncs = self._reader.resyncs
+        response = self.last_response = self._read_response(wait, size, on_data)
+        nbytes = 0 if response.ack is None else 12
+        if response.data:
+            nbytes += len(response.data) + 6
+        self.hook.response(self._cmd, response.ack, response.param, nbytes,
+                           _monotonic() - self._sent_at)
+        if self._reader.resyncs != resyncs:
+            self.hook.resync(self._cmd, self._reader.resyncs - resyncs)
+        return response
+
+    @property
+    def last_error(self):
+        '''
+            NackError of the last response, None if it was not a NACK with an error code.
+            Lets callers tell a full database from a bad finger after a False return.
+        '''
+        return self.last_response.error if self.last_response else None
 
-    def _read_header(self):
-        if self.ser and self.ser.readable():
-            firstbyte = self._read()
-            secondbyte = self._read()
-            return firstbyte, secondbyte
-        return None, None
+    @staticmethod
+    def _verify_packet(packet):
+        if verify_packet(packet):
+            return True
+        logger.error("Response packet checksum mismatch, looking for the next sync word.")
+        return False
 
-    def _read_packet(self, wait=True):
+    def _read_response(self, wait=True, size=None, on_data=None):
         """
 
-        :param wait:
-        :return: ack, param, res, data
+        :param wait: keep waiting for the response, otherwise give up after one serial timeout
+        :param size: payload size of the data packet following the response, if known
+        :param on_data: progress callback of that data packet
+        :return: Response (ack, param, res, data)
         """
         # Read response packet
-        packet = bytearray(12)
-        while True:
-            firstbyte, secondbyte = self._read_header()
-            if not firstbyte or not secondbyte:
-                if wait:
-                    continue
-                else:
-                    return None, None, None, None
-            elif firstbyte == Fingerprint.PACKET_RES_0 and secondbyte == Fingerprint.PACKET_RES_1:
-                break
-        packet[0] = firstbyte
-        packet[1] = secondbyte
-        p = self.ser.read(10)
-        packet[2:12] = p[:]
-
-        # Parse ACK
-        ack = True if packet[8] == Fingerprint.ACK else False
-
-        # Parse parameter
-        param = bytearray(4)
-        param[:] = packet[4:8]
-        if param is not None:
-            param = int(codecs.encode(param[::-1], 'hex_codec'), 16)
-
-        # Parse response
-        res = bytearray(2)
-        res[:] = packet[8:10]
-        if res is not None:
-            res = int(codecs.encode(res[::-1], 'hex_codec'), 16)
-
-        # Read data packet
-        data = None
-        if self.ser and self.ser.readable() and self.ser.inWaiting() > 0:
-            firstbyte, secondbyte = self._read_header()
-            if firstbyte and secondbyte:
-                # Data exists.
-                if firstbyte == Fingerprint.PACKET_DATA_0 and secondbyte == Fingerprint.PACKET_DATA_1:
-                    print(">> Data exists...")
-                    # print("FB-SB: ", firstbyte, secondbyte)
-                    data = bytearray()
-                    data.append(firstbyte)
-                    data.append(secondbyte)
-        read_buffer = b''                    
-        if data:
-            while True:
-                chunk_size = 14400
-                p = self.ser.read(size=chunk_size)
-                read_buffer += p
-                # print(p, type(p))
-                if len(p) == 0:
-                    print(">> Transmission Completed . . .")
-                    break
-
-        return ack, param, res, read_buffer
+        if not (self.ser and self.ser.readable()):
+            return NO_RESPONSE
+        if not wait:
+            timeout = self.timeout
+        else:
+            timeout = self.response_timeout if self.wait_ack else None
+        packet = self._reader.read_frame(self.ser, RESPONSE_SYNC, 12, timeout, self._verify_packet)
+        if packet is None:
+            if wait:
+                logger.error("No response within %s seconds." % self.response_timeout)
+            return NO_RESPONSE
+        response = parse_response(packet, b'')
+        if not response.ack:
+            return response
+
+        # Read data packet of known length
+        if size is not None:
+            return parse_response(packet, self._read_data(size, on_data))
+
+        # Read data packet of unknown length
+        if self._reader.pending(self.ser).startswith(DATA_SYNC):
+            logger.debug(">> Data exists...")
+            frame = self._reader.read_idle(self.ser)
+            logger.debug(">> Transmission Completed . . .")
+            if verify_data(frame):
+                return parse_response(packet, frame[4:-2])
+            logger.error("Data packet checksum mismatch.")
+        return response
 
     def open(self):
         if self._send_packet("Open"):
@@ -249,6 +428,36 @@ class Fingerprint():
             return ack
         return None
 
+    def get_device_info(self):
+        '''
+            Open with device info: firmware version, ISO area max size and serial number.
+            Returns: dict, or None if the sensor did not send it.
+        '''
+        ack, _, _, data = self._download("Open", 1)
+        if not ack or data is None:
+            return None
+        firmware, iso_area_max = struct.unpack_from('<II', data)
+        return {
+            'firmware': firmware,
+            'iso_area_max': iso_area_max,
+            'serial': bytes(data[8:24]).hex(),
+        }
+
+    def _resolve_sensor_id(self):
+        # Looked up right after connecting, so the cache never needs an Open in the middle
+        # of another command sequence (e.g. between EnrollStart and Enroll1).
+        self._sensor_id = None
+        if self.cache is not None:
+            self.sensor_id
+
+    @property
+    def sensor_id(self):
+        '''Serial number of the sensor (the port name if it cannot be read), for the cache.'''
+        if self._sensor_id is None:
+            info = self.get_device_info()
+            self._sensor_id = info['serial'] if info else str(self.port)
+        return self._sensor_id
+
     def close(self):
         if self._send_packet("Close"):
             ack, _, _, _ = self._read_packet()
@@ -258,43 +467,129 @@ class Fingerprint():
     def set_led(self, on):
         if self._send_packet("CmosLed", 1 if on else 0):
             ack, _, _, _ = self._read_packet()
+            if ack:
+                self._led = bool(on)
             return ack
         return None
 
+    def _led_on(self):
+        # Turns the LED on unless it already is, returns whether it was on.
+        if self._led:
+            return True
+        self.set_led(True)
+        self._settle('CmosLed')
+        return False
+
     def get_enrolled_cnt(self):
         if self._send_packet("GetEnrollCount"):
             ack, param, _, _ = self._read_packet()
             return param if ack else -1
         return None
 
-    def is_finger_pressed(self):
-        print("Checking if finger is pressed or not.")
-        self.set_led(True)
-        time.sleep(1)
+    def _press_finger(self):
+        # One IsPressFinger poll: True / False, None if the sensor did not answer.
         if self._send_packet("IsPressFinger"):
             ack, param, _, _ = self._read_packet()
-            self.set_led(False)
             if not ack:
                 return None
-            return True if param == 0 else False
-        else:
-            return None
+            return param == 0
+        return None
+
+    def is_finger_pressed(self):
+        logger.debug("Checking if finger is pressed or not.")
+        was_on = self._led_on()
+        pressed = self._press_finger()
+        if not was_on:
+            self.set_led(False)
+        return pressed
+
+    def _poll_finger(self, pressed, timeout, interval, max_interval):
+        # Polls until the finger state is `pressed`, starting every `interval` seconds and
+        # backing off by half up to `max_interval` while nothing changes.
+        deadline = None if timeout is None else _monotonic() + timeout
+        while True:
+            state = self._press_finger()
+            if state is None:
+                return None
+            if state == pressed:
+                return True
+            if deadline is not None:
+                remaining = deadline - _monotonic()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(interval, remaining))
+            else:
+                time.sleep(interval)
+            interval = min(interval * 1.5, max_interval)
+
+    def wait_for_finger(self, timeout=None, interval=0.02, max_interval=0.5):
+        '''
+            Turns the LED on and polls IsPressFinger until a finger is placed, quickly at
+            first and less often the longer nothing happens. The LED stays on when a finger
+            was found so capture_finger() can follow right away, see wait_for_release().
+            Returns: True, False after `timeout` seconds, None if the sensor did not answer.
+        '''
+        was_on = self._led_on()
+        found = self._poll_finger(True, timeout, interval, max_interval)
+        if not found and not was_on:
+            self.set_led(False)
+        return found
+
+    def wait_for_release(self, timeout=None, interval=0.02, max_interval=0.5, keep_led=False):
+        '''
+            Polls until the finger is lifted and turns the LED off, unless `keep_led` is set.
+            Returns: True, False after `timeout` seconds, None if the sensor did not answer.
+        '''
+        self._led_on()
+        released = self._poll_finger(False, timeout, interval, max_interval)
+        if not keep_led:
+            self.set_led(False)
+        return released
 
     def change_baud(self, baud=115200):
         if self._send_packet("ChangeBaudrate", baud):
             ack, _, _, _ = self._read_packet()
+            self._settle('ChangeBaudrate')
             return True if ack else False
         return None
 
-    def capture_finger(self, best=False):
-        self.set_led(True)
-        time.sleep(1)
+    def capture_finger(self, best=False, quality=None, attempts=3):
+        '''
+            quality: QualityLimits (or True for the defaults) the captured image has to meet,
+                     it is downloaded and scored after each capture (needs numpy) and the
+                     finger captured again, up to `attempts` times, while it falls short.
+                     The last score is kept in `last_quality`. The image download is slow
+                     (about 4.5 seconds at 115200 baud), but it is cheaper than a failing
+                     identify / enroll round.
+        '''
+        was_on = self._led_on()
         param = 0 if not best else 1
-        if self._send_packet("CaptureFinger", param):
+        if quality is True:
+            from .quality import QualityLimits
+            quality = QualityLimits()
+        for attempt in range(attempts if quality else 1):
+            if not self._send_packet("CaptureFinger", param):
+                return None
             ack, _, _, _ = self._read_packet()
+            if not ack or not quality or self._image_quality(quality):
+                break
+            ack = False
+        if not was_on:
             self.set_led(False)
-            return ack
-        return None
+        return ack
+
+    def _image_quality(self, limits):
+        # Scores the captured image, True if it meets `limits`.
+        from .quality import assess
+        image = self.get_image()
+        if image is None:
+            return False
+        self.last_quality = assess(image)
+        self.release(image)
+        if limits.accepts(self.last_quality):
+            return True
+        logger.info("Capture rejected: %s" % (self.last_quality,))
+        return False
 
     def GetImage(self):
         '''
@@ -302,145 +597,317 @@ class Fingerprint():
             Use StartDataDownload, and then GetNextDataPacket until done
             Returns: True (device confirming download starting)
         '''
-        if self._send_packet("GetImage"):
-            ack, param, res, data = self._read_packet()
-            if not ack:
-                return None, False
-            return data, True  if param == 0 else False
-        else:
+        ack, param, res, data = self._download("GetImage")
+        if not ack or data is None:
+            return None, False
+        return data, True  if param == 0 else False
+
+    def GetRawImage(self):
+        '''
+            Captures and downloads the raw 320x240 (76800 bytes) image of the sensor.
+            Returns: data, downloadstat
+        '''
+        ack, param, res, data = self._download("GetRawImage")
+        if not ack or data is None:
             return None, False
-    
+        return data, True  if param == 0 else False
+
+    def get_image(self, on_rows=None):
+        '''
+            Downloads the captured image as a 202x258 numpy uint8 array (needs numpy).
+            The array is a view of the receive buffer, nothing is copied.
+            on_rows: called as on_rows(rows, first) with each run of rows that has arrived,
+                     `rows` being a view of the finished rows starting at row `first`.
+        '''
+        from .image import IMAGE_SHAPE, RowStream, to_array
+        ack, _, _, data = self._download("GetImage",
+                                         on_data=on_rows and RowStream(IMAGE_SHAPE, on_rows))
+        if not ack or data is None:
+            return None
+        return to_array(data, IMAGE_SHAPE)
+
+    def get_raw_image(self, on_rows=None):
+        '''The raw 240x320 image of the sensor as a numpy uint8 array, see get_image().'''
+        from .image import RAW_IMAGE_SHAPE, RowStream, to_array
+        ack, _, _, data = self._download("GetRawImage",
+                                         on_data=on_rows and RowStream(RAW_IMAGE_SHAPE, on_rows))
+        if not ack or data is None:
+            return None
+        return to_array(data, RAW_IMAGE_SHAPE)
+
     def MakeTemplate(self):
         if not self.capture_finger(best=True):
             return None
-        if self._send_packet("MakeTemplate"):
-            ack, param, res, data = self._read_packet()
-            if not ack:
-                return None, False
-            return data, True  if param == 0 else False
-        else:
+        ack, param, res, data = self._download("MakeTemplate")
+        if not ack or data is None:
+            return None, False
+        return data, True  if param == 0 else False
+
+    def _get_template(self, idx):
+        # ack, param, data of GetTemplate, served from the cache if it has the slot
+        if self.cache is not None:
+            data = self.cache.get(self.sensor_id, idx)
+            if data is not None:
+                return True, 0, data
+        ack, param, _, data = self._download("GetTemplate", idx)
+        if ack and data is None:
+            return None, param, None
+        if ack and self.cache is not None:
+            self.cache.put(self.sensor_id, idx, data)
+        return ack, param, data
+
+    def getTemplate(self, idx):
+        '''
+            Downloads the template stored under `idx`, from the cache if it has it.
+            Returns: data, downloadstat
+        '''
+        ack, _, data = self._get_template(idx)
+        if not ack:
             return None, False
+        return data, True
 
-    def start_enroll(self, idx):
-        if self._send_packet("EnrollStart", idx):
+    def check_enrolled(self, idx):
+        if self._send_packet("CheckEnrolled", idx):
             ack, _, _, _ = self._read_packet()
             return ack
         return None
 
-    def enroll1(self):
-        if self._send_packet("Enroll1"):
+    def export_database(self, path, slots=None):
+        '''
+            Streams every enrolled template into the TemplateArchive at `path`.
+            Templates are read from the sensor, never from the cache. Empty slots cost one
+            GetTemplate round trip (answered with a NACK) and are skipped. Slots already in
+            the archive are only checked with CheckEnrolled, not downloaded again, so an
+            interrupted export continues where it stopped when called again. The scan ends
+            once GetEnrollCount's worth of slots were found enrolled on the sensor.
+            Yields a TransferProgress for each exported template.
+        '''
+        from .archive import TemplateArchive, TransferProgress
+        if slots is None:
+            slots = range(Fingerprint.DB_CAPACITY)
+        enrolled = self.get_enrolled_cnt()
+        start = _monotonic()
+        found = nbytes = 0
+        with TemplateArchive(path) as archive:
+            for idx in slots:
+                if enrolled is not None and enrolled >= 0 and found >= enrolled:
+                    break
+                if idx in archive:
+                    present = self.check_enrolled(idx)
+                    if present is None:
+                        raise IOError("CheckEnrolled of slot %d failed." % idx)
+                    if present:
+                        found += 1
+                    continue
+                ack, param, _, data = self._download("GetTemplate", idx)
+                if ack is None or (ack and data is None):
+                    raise IOError("Download of template %d failed." % idx)
+                if not ack:
+                    if param == Fingerprint.NACK_INVALID_POS:
+                        break
+                    continue
+                archive.append(idx, data)
+                self.release(data)
+                found += 1
+                nbytes += len(data)
+                yield TransferProgress(idx, found, enrolled, nbytes, _monotonic() - start)
+
+    def import_database(self, path, overwrite=False):
+        '''
+            Uploads every template of the TemplateArchive at `path` under its slot ID.
+            Slots that are already enrolled are skipped unless `overwrite` is set (then
+            they are deleted first), which also makes an interrupted import resumable.
+            Yields a TransferProgress for each uploaded template.
+        '''
+        from .archive import TemplateArchive, TransferProgress
+        start = _monotonic()
+        done = nbytes = 0
+        with TemplateArchive(path) as archive:
+            total = len(archive)
+            for idx, data in archive:
+                if self.check_enrolled(idx):
+                    if not overwrite:
+                        continue
+                    self.delete(idx)
+                if not self.setTemplate(idx, data):
+                    raise IOError("Upload of template %d failed." % idx)
+                done += 1
+                nbytes += len(data)
+                yield TransferProgress(idx, done, total, nbytes, _monotonic() - start)
+
+    def plan_sync(self, store, compare=True):
+        '''
+            Dry run of sync_database(): compares the slots of the TemplateStore `store`
+            with the sensor database and returns the SyncPlan, nothing is changed.
+            Slots of the store are compared byte for byte with the template on the sensor
+            (served from the cache when there is one), or only checked for presence if
+            `compare` is False. Other enrolled slots are looked up with CheckEnrolled, and
+            only until GetEnrollCount says every enrolled slot is accounted for.
+        '''
+        from .sync import SyncOp, SyncPlan
+        start = _monotonic()
+        plan = SyncPlan()
+        enrolled = self.get_enrolled_cnt()
+        if enrolled is None or enrolled < 0:
+            raise IOError("Failed to read the enrolled count.")
+        plan.round_trips += 1
+        wanted = {entry.slot: entry for entry in store.entries() if entry.slot >= 0}
+        present = 0
+        uploads = []
+        for slot in sorted(wanted):
+            entry = wanted[slot]
+            if compare:
+                cached = self.cache is not None and (self.sensor_id, slot) in self.cache
+                ack, param, data = self._get_template(slot)
+                plan.round_trips += not cached
+                if ack is None:
+                    raise IOError("Download of template %d failed." % slot)
+                if ack:
+                    present += 1
+                    # a 16 bit sum misses swapped or offsetting bytes, compare the templates
+                    same = bytes(data) == bytes(store.get_slot(slot))
+                    self.release(data)
+                    if same:
+                        plan.unchanged += 1
+                        continue
+                elif param == Fingerprint.NACK_INVALID_POS:
+                    raise ValueError("Slot %d is out of range of the sensor." % slot)
+            else:
+                plan.round_trips += 1
+                if self.check_enrolled(slot):
+                    present += 1
+                    plan.unchanged += 1
+                    continue
+            uploads.append(SyncOp('set', slot, entry.key))
+        extra = enrolled - present
+        for slot in range(Fingerprint.DB_CAPACITY):
+            if extra <= 0:
+                break
+            if slot in wanted:
+                continue
+            plan.round_trips += 1
+            if self.check_enrolled(slot):
+                plan.ops.append(SyncOp('delete', slot, None))
+                extra -= 1
+        plan.ops += uploads
+        plan.elapsed = _monotonic() - start
+        return plan
+
+    def sync_database(self, store, plan=None, compare=True):
+        '''
+            Brings the sensor database in line with the TemplateStore `store` using only the
+            DeleteID / SetTemplate operations of the plan (plan_sync() if not given).
+            Deletes go first; uploads skip the sensor's duplicate check, since a template
+            may be moving to another slot.
+            Yields a TransferProgress for each operation.
+        '''
+        from .archive import TransferProgress
+        if plan is None:
+            plan = self.plan_sync(store, compare)
+        start = _monotonic()
+        done = nbytes = 0
+        for op in plan:
+            if op.action == 'delete':
+                if not self.delete(op.slot):
+                    raise IOError("Deleting slot %d failed." % op.slot)
+            else:
+                data = store.get(op.key)
+                if not self.setTemplate(op.slot, data, check_duplicate=False):
+                    raise IOError("Upload of template %d failed." % op.slot)
+                nbytes += len(data)
+            done += 1
+            yield TransferProgress(op.slot, done, len(plan), nbytes, _monotonic() - start)
+
+    def start_enroll(self, idx):
+        self._enroll_idx = idx
+        if self.cache is not None:
+            self.sensor_id  # looked up now, not between EnrollStart and Enroll1
+        if self._send_packet("EnrollStart", idx):
             ack, _, _, _ = self._read_packet()
+            if ack and self.cache is not None and idx >= 0:
+                self.cache.invalidate(self.sensor_id, idx)
             return ack
         return None
 
+    def _enroll_stage(self, stage):
+        # ack, param, data of Enroll1 / 2 / 3
+        cmd = "Enroll%d" % stage
+        if not self._send_packet(cmd):
+            return None, None, None
+        # The merged template is only sent back when enrolling without saving.
+        size = Fingerprint.DATA_SIZES[cmd] if stage == 3 and self._enroll_idx == -1 else None
+        ack, param, _, data = self._read_packet(size=size)
+        return ack, param, data
+
+    def enroll1(self):
+        ack, _, _ = self._enroll_stage(1)
+        return ack
+
     def enroll2(self):
-        if self._send_packet("Enroll2"):
-            ack, _, _, _ = self._read_packet()
-            return ack
-        return None
+        ack, _, _ = self._enroll_stage(2)
+        return ack
 
     def enroll3(self):
-        if self._send_packet("Enroll3"):
-            ack, param, res, data = self._read_packet()
-            if not ack:
-                return None, False
-            return data, True  if param == 0 else False
-        return None, None
-
-    def enroll(self, idx=None, try_cnt=10, sleep=1):
-        if idx >= 0:
-            # Check whether the finger already exists or not
-            for i in range(try_cnt):
-                idx = self.identify()
-                print("Given id: ", idx)
-                if idx is not None:
-                    break
-                time.sleep(sleep)
-                logger.info("Checking existence...")
-            if idx is not None and idx >= 0:
-                return -1
-
-            # Decide an ID for enrolling
-            self.open()
-            idx = self.get_enrolled_cnt()
-        logger.info("Enroll with the ID: %s" % idx)
+        ack, param, data = self._enroll_stage(3)
+        if ack is None:
+            return None, None
+        if not ack or data is None:
+            return None, False
+        return data, True  if param == 0 else False
 
-        """Start enrolling
-        """
-        logger.info("Start enrolling...")
-        cnt = 0
-        while True:
-            # idx=0
-            if self.start_enroll(idx):
-                # Enrolling started
-                break
-            else:
-                cnt += 1
-                if cnt >= try_cnt:
-                    return -1
-                time.sleep(sleep)
+    def enrollment(self, idx=None, check_duplicate=True, policy=None, on_event=None):
+        '''
+            Enrollment state machine for `idx` (the first free ID if None, -1 to only get
+            the template), see fplib.enroll.Enrollment. Iterate over it for the events or
+            call run() for the EnrollResult.
+        '''
+        return Enrollment(self, idx, check_duplicate, policy, on_event)
 
-        """Start enroll 1, 2, and 3
-        """
-        for enr_num, enr in enumerate(["enroll1", "enroll2"]):
-            print("Start %s..." % enr)
-            cnt = 0
-            while not self.capture_finger(best=True):
-                cnt += 1
-                if cnt >= try_cnt:
-                    return -1
-                time.sleep(sleep)
-                logger.info("Capturing a fingerprint...")
-            cnt = 0
-            while not getattr(self, enr)():
-                cnt += 1
-                if cnt >= try_cnt:
-                    return -1
-                time.sleep(sleep)
-                logger.info("Enrolling the captured fingerprint...")
-            
-        if self.capture_finger(best=True):
-            print("Start enroll3...")
-            data, downloadstat = self.enroll3()
-            if idx == -1:
-                return idx, data, downloadstat
-        # Enroll process finished
-        return idx, None, None
+    def enroll(self, idx=None, try_cnt=10, sleep=1, finger_timeout=10):
+        '''
+            Enrolls the finger under `idx` (the first free ID if None, -1 to get the template
+            back without saving it), after checking it is not enrolled yet.
+            try_cnt: tries per stage. sleep: unused, the finger is polled instead.
+            finger_timeout: seconds to wait for the finger to be placed or lifted.
+            Returns: idx, data, downloadstat -- or -1 if enrolling failed.
+        '''
+        logger.info("Enroll with the ID: %s" % idx)
+        policy = RetryPolicy(attempts=try_cnt, finger_timeout=finger_timeout)
+        result = self.enrollment(idx, policy=policy).run()
+        if not result.ok:
+            if result.duplicate is not None:
+                logger.info("The finger is enrolled with the ID: %s" % result.duplicate)
+            return -1
+        if result.idx == -1:
+            return result.idx, result.template, True
+        return result.idx, None, None
 
     def verifyTemplate(self, idx, data):
-        data_bytes = bytearray()
-        data_bytes.append(90)
-        data_bytes.append(165)
-        for ch in data:
-            data_bytes.append(ch)
-        if self._send_packet("VerifyTemplate1_1", param=idx):
-            ack, _, _, _ = self._read_packet()
-            if ack:
-                sendstatus = self._send_data(data_bytes)
-                if sendstatus:
-                    print('|', '>'*10, '👍 MATCH FOUND 👍')
-                    return True
-                return False
-
-    def setTemplate(self, idx, data):
-        data_bytes = bytearray()
-        data_bytes.append(90)
-        data_bytes.append(165)
-        for ch in data:
-            data_bytes.append(ch)
-        if self._send_packet("SetTemplate", param=idx):
-            ack, _, _, _ = self._read_packet()
-            if ack:
-                if self._send_data(data_bytes):
-                    print(f'👍 setTemplate @ ID: {idx}')
-                    return True
-                return False
-            return False
+        ack, _ = self._upload("VerifyTemplate1_1", idx, data)
+        if ack:
+            logger.debug("MATCH FOUND @ ID: %s", idx)
+            return True
+        return False
+
+    def setTemplate(self, idx, data, check_duplicate=True):
+        '''
+            Uploads `data` under `idx`, replacing what the slot held.
+            check_duplicate: the sensor refuses a template that is enrolled under another ID.
+        '''
+        if self.cache is not None:
+            self.cache.invalidate(self.sensor_id, idx)
+        param = idx if check_duplicate else idx | Fingerprint.SKIP_DUPLICATE_CHECK
+        ack, _ = self._upload("SetTemplate", param, data)
+        if ack:
+            if self.cache is not None:
+                self.cache.put(self.sensor_id, idx, data)
+            logger.debug("setTemplate @ ID: %s", idx)
+            return True
         return False
        
     def delete(self, idx=None):
         res = None
-         if idx == None:
+        if idx == None:
             # Delete all fingerprints
             res = self._send_packet("DeleteAll")
         else:
@@ -448,11 +915,14 @@ class Fingerprint():
             res = self._send_packet("DeleteID", idx)
         if res:
             ack, _, _, _ = self._read_packet()
+            if ack and self.cache is not None:
+                self.cache.invalidate(self.sensor_id, idx)
             return ack
         return None
 
-    def identify(self):
-        if not self.capture_finger(best=True):
+    def identify(self, quality=None):
+        '''quality: QualityLimits the captured image has to meet, see capture_finger().'''
+        if not self.capture_finger(best=True, quality=quality):
             return None
         if self._send_packet("Identify1_N"):
             ack, param, _, _ = self._read_packet()
@@ -463,17 +933,9 @@ class Fingerprint():
         return None
 
     def identifyTemplate(self, data):
-        data_bytes = bytearray()
-        data_bytes.append(90)
-        data_bytes.append(165)
-        for ch in data:
-            data_bytes.append(ch)
-        if self._send_packet("IdentifyTemplate1_N"):
-            ack, _, _, _ = self._read_packet()
-            if ack:
-                param = self._send_data(data_bytes, parameter=True)
-                return param
-            return -1
-        return None
+        ack, param = self._upload("IdentifyTemplate1_N", 0, data)
+        if ack is None:
+            return None
+        return param if ack else -1
 
             
\ No newline at end of file
@@ -0,0 +1,305 @@
+'''
+Packet encoding and the frame reader, the protocol engine of `Fingerprint` on python3 and
+on MicroPython (fplibMicro.py): no struct.Struct, no namedtuple._replace().
+'''
+import struct
+import time
+from collections import namedtuple
+
+from .errors import NackError
+
+try:
+    _monotonic = time.monotonic
+except AttributeError:  # MicroPython
+    def _monotonic():
+        return time.ticks_ms() / 1000
+
+RESPONSE_SYNC = b'\x55\xaa'  # command and response packets
+DATA_SYNC = b'\x5a\xa5'
+DEVICE_ID = b'\x01\x00'
+DATA_HEADER = DATA_SYNC + DEVICE_ID
+
+PACKET_SIZE = 12
+_PACKET = '<IH'  # param and code, after sync and device ID
+_RESPONSE = '<IH'  # param, response code at offset 4
+ACK = 0x30
+NACK = 0x31
+_FIRST_ERROR = 0x1001  # NACK params below are IDs (of a duplicate)
+_DATA_HEADER_SUM = sum(DATA_HEADER)
+
+
+COMMENDS = {
+    'None': 0x00,  # Default value for enum. Scanner will return error if sent this.
+    'Open': 0x01,  # Open Initialization
+    'Close': 0x02,  # Close Termination
+    'UsbInternalCheck': 0x03,  # UsbInternalCheck Check if the connected USB device is valid
+    'ChangeBaudrate': 0x04,  # ChangeBaudrate Change UART baud rate
+    'SetIAPMode': 0x05,  # SetIAPMode Enter IAP Mode In this mode, FW Upgrade is available
+    'CmosLed': 0x12,  # CmosLed Control CMOS LED
+    'GetEnrollCount': 0x20,  # Get enrolled fingerprint count
+    'CheckEnrolled': 0x21,  # Check whether the specified ID is already enrolled
+    'EnrollStart': 0x22,  # Start an enrollment
+    'Enroll1': 0x23,  # Make 1st template for an enrollment
+    'Enroll2': 0x24,  # Make 2nd template for an enrollment
+    'Enroll3': 0x25,
+    # Make 3rd template for an enrollment, merge three templates into one template, save merged template to the database
+    'IsPressFinger': 0x26,  # Check if a finger is placed on the sensor
+    'DeleteID': 0x40,  # Delete the fingerprint with the specified ID
+    'DeleteAll': 0x41,  # Delete all fingerprints from the database
+    'Verify1_1': 0x50,  # Verification of the capture fingerprint image with the specified ID
+    'Identify1_N': 0x51,  # Identification of the capture fingerprint image with the database
+    'VerifyTemplate1_1': 0x52,  # Verification of a fingerprint template with the specified ID
+    'IdentifyTemplate1_N': 0x53,  # Identification of a fingerprint template with the database
+    'CaptureFinger': 0x60,  # Capture a fingerprint image(256x256) from the sensor
+    'MakeTemplate': 0x61,  # Make template for transmission
+    'GetImage': 0x62,  # Download the captured fingerprint image(256x256)
+    'GetRawImage': 0x63,  # Capture & Download raw fingerprint image(320x240)
+    'GetTemplate': 0x70,  # Download the template of the specified ID
+    'SetTemplate': 0x71,  # Upload the template of the specified ID
+    'GetDatabaseStart': 0x72,  # Start database download, obsolete
+    'GetDatabaseEnd': 0x73,  # End database download, obsolete
+    'UpgradeFirmware': 0x80,  # Not supported
+    'UpgradeISOCDImage': 0x81,  # Not supported
+    'Ack': 0x30,  # Acknowledge.
+    'Nack': 0x31  # Non-acknowledge
+}
+
+# Payload size (bytes) of the data packet that follows the ACK of these commands.
+DATA_SIZES = {
+    'Open': 24,  # device info, only sent when Open is called with param 1
+    'MakeTemplate': 498,
+    'GetTemplate': 498,
+    'Enroll3': 498,  # only sent when enrolling without saving (ID -1)
+    'GetImage': 52116,  # 258x202
+    'GetRawImage': 76800,  # 320x240
+}
+
+# Payload size (bytes) of the data packet these commands send after their ACK. The sensor
+# waits for exactly that many bytes, a shorter packet leaves it stuck mid packet.
+UPLOAD_SIZES = {
+    'SetTemplate': 498,
+    'VerifyTemplate1_1': 498,
+    'IdentifyTemplate1_N': 498,
+}
+
+
+def checksum(data, start=0):
+    return (start + sum(data)) & 0xFFFF
+
+
+def build_packet(code, param=0):
+    '''Command (or response) packet: sync, device ID, param, code and checksum.'''
+    packet = bytearray(PACKET_SIZE)
+    packet[:4] = RESPONSE_SYNC + DEVICE_ID
+    struct.pack_into(_PACKET, packet, 4, param & 0xFFFFFFFF, code & 0xFFFF)
+    struct.pack_into('<H', packet, 10, checksum(packet[:10]))
+    return bytes(packet)
+
+
+def verify_packet(packet):
+    return checksum(memoryview(packet)[:10]) == (packet[10] | packet[11] << 8)
+
+
+class Response(namedtuple('Response', 'ack param res data')):
+    '''
+    * A response packet: ack (None if there was no valid response), the parameter, the
+      response code (ACK / NACK) and the payload of the data packet that followed, if any.
+    * Unpacks like the (ack, param, res, data) tuples it replaces.
+    '''
+
+    __slots__ = ()
+
+    @property
+    def error(self):
+        '''The NackError of a NACK, None otherwise (also for a NACK carrying an ID).'''
+        if self.ack is False:
+            return NackError.lookup(self.param)
+        return None
+
+    @property
+    def duplicate(self):
+        '''ID the finger is already enrolled with, for a NACK that names one.'''
+        if self.ack is False and self.param < _FIRST_ERROR:
+            return self.param
+        return None
+
+
+NO_RESPONSE = Response(None, None, None, None)
+
+
+def parse_response(packet, data=None):
+    '''Response of a (verified) 12 byte response packet, decoded in one unpack.'''
+    param, res = struct.unpack_from(_RESPONSE, packet, 4)
+    return Response(res == ACK, param, res, data)
+
+
+def data_checksum(payload):
+    '''Checksum of a data packet carrying `payload`, as the 2 trailing bytes.'''
+    return struct.pack('<H', checksum(payload, _DATA_HEADER_SUM))
+
+
+def build_data(payload):
+    return DATA_HEADER + bytes(payload) + data_checksum(payload)
+
+
+def verify_data(frame):
+    '''`frame` is a whole data packet, header to checksum.'''
+    view = memoryview(frame)
+    return checksum(view[:-2]) == (frame[-2] | frame[-1] << 8)
+
+
+def unwrap_data(data, size):
+    '''
+        Payload of `data` if it is a device ID + `size` byte payload + checksum body (the
+        layout downloads used to return), otherwise None. Data of any other length is never
+        taken apart, even when it happens to start with the device ID.
+    '''
+    if len(data) != size + 4 or bytes(data[:2]) != DEVICE_ID:
+        return None
+    payload = memoryview(data)[2:-2]
+    if data_checksum(payload) != bytes(data[-2:]):
+        return None
+    return payload
+
+
+def _find(buffer, sync):
+    try:
+        return buffer.find(sync)
+    except AttributeError:  # MicroPython bytearrays have no find()
+        return bytes(buffer).find(sync)
+
+
+class FrameReader():
+    '''
+    * Buffered decoder for the packets coming from the sensor.
+    * Pulls everything that is waiting on the port in one read, finds the sync word
+      with `bytes.find` and keeps the leftover bytes for the next frame.
+    '''
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.resyncs = 0
+
+    def clear(self):
+        self.buffer = bytearray()
+
+    def _fill(self, ser, need=1):
+        # Blocks (up to the serial timeout) for `need` bytes, or takes all that is waiting.
+        p = ser.read(max(ser.in_waiting, need))
+        if p:
+            self.buffer += p
+        elif not ser.timeout:
+            # non-blocking port, do not spin on it
+            time.sleep(0.001)
+        return len(p)
+
+    def pending(self, ser):
+        '''Buffered bytes plus whatever is already waiting on the port, without blocking.'''
+        if ser.in_waiting:
+            self._fill(ser, 0)
+        return self.buffer
+
+    def feed(self, data):
+        '''Adds received bytes, for callers that do their own I/O.'''
+        self.buffer += data
+
+    def scan(self, sync):
+        '''
+            Drops everything before the next sync word without doing any I/O.
+            Returns True once the buffer starts with `sync`.
+        '''
+        start = _find(self.buffer, sync)
+        if start == 0:
+            return True
+        if start > 0:
+            self.resyncs += 1
+            del self.buffer[:start]
+            return True
+        # keep a trailing half sync word
+        keep = 1 if self.buffer[-1:] == sync[:1] else 0
+        if len(self.buffer) > keep:
+            self.resyncs += 1
+            del self.buffer[:len(self.buffer) - keep]
+        return False
+
+    def take(self, sync, size):
+        '''Next complete `size` byte frame starting with `sync` from the buffer, or None.'''
+        if not self.scan(sync) or len(self.buffer) < size:
+            return None
+        frame = bytearray(self.buffer[:size])
+        del self.buffer[:size]
+        return frame
+
+    def _sync(self, ser, sync, deadline):
+        # Reads until the buffer starts with the sync word, False on timeout.
+        while not self.scan(sync):
+            if deadline is not None and _monotonic() > deadline:
+                return False
+            self._fill(ser, len(sync) - len(self.buffer))
+        return True
+
+    def read_frame_into(self, ser, sync, buf, timeout=None, on_data=None):
+        '''
+            Fills the preallocated `buf` with the next frame starting with `sync`.
+            `timeout` (None waits forever) bounds the wait for the sync word, once the frame
+            has started it is read for as long as bytes keep arriving.
+            on_data: called as on_data(buf, n) whenever the first n bytes of `buf` are in,
+                     the frame is then read in the chunks that arrive instead of in one go.
+            Returns the number of bytes read, len(buf) when the frame is complete.
+        '''
+        deadline = None if timeout is None else _monotonic() + timeout
+        if not self._sync(ser, sync, deadline):
+            return 0
+        size = len(buf)
+        view = memoryview(buf)
+        n = min(len(self.buffer), size)
+        view[:n] = self.buffer[:n]
+        del self.buffer[:n]
+        while n < size:
+            if on_data is None:
+                got = ser.readinto(view[n:]) or 0
+            else:
+                on_data(buf, n)
+                got = ser.readinto(view[n:n + max(ser.in_waiting, 1)]) or 0
+            n += got
+            if not got:
+                if ser.timeout or (deadline is not None and _monotonic() > deadline):
+                    break
+                time.sleep(0.001)
+        if hasattr(view, 'release'):  # not on MicroPython
+            view.release()
+        if on_data is not None:
+            on_data(buf, n)
+        return n
+
+    def read_frame(self, ser, sync, size, timeout=None, verify=None):
+        '''
+            Returns the next `size` byte frame starting with `sync`, or None if it is not
+            complete in time, see read_frame_into().
+            verify: check of a complete frame, e.g. verify_packet. A frame failing it began
+                    with a false sync word (a stray 0x55AA in noise or a payload): its first
+                    byte is dropped and the rest scanned again for the next sync word, until
+                    `timeout` (one port timeout if None).
+        '''
+        deadline = None if timeout is None else _monotonic() + timeout
+        while True:
+            frame = bytearray(size)
+            if self.read_frame_into(ser, sync, frame, timeout) < size:
+                return None
+            if verify is None or verify(frame):
+                return frame
+            self.resyncs += 1
+            self.buffer = frame[1:] + self.buffer
+            if deadline is None:
+                timeout = ser.timeout or 0
+                deadline = _monotonic() + timeout
+            else:
+                timeout = max(deadline - _monotonic(), 0)
+
+    def read_idle(self, ser):
+        '''Everything up to the next serial timeout, for packets of unknown length.'''
+        while self._fill(ser, 1 << 14):
+            pass
+        data = bytes(self.buffer)
+        self.clear()
+        return data
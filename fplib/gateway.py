@@ -0,0 +1,680 @@
+'''
+* HTTP/JSON gateway sharing the sensors attached to this machine with many clients.
+* Run with `python -m fplib.gateway door=/dev/ttyUSB0 lab=tcp://10.0.0.12:4001 [--listen 0.0.0.0:8521]`,
+  or `python -m fplib.gateway --emulate door lab` for emulated sensors.
+'''
+import argparse
+import base64
+import http.client
+import itertools
+import json
+import logging
+import queue
+import re
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from .enroll import RetryPolicy
+from .fpmain import Fingerprint
+from .framing import UPLOAD_SIZES, unwrap_data
+from .transport import open_transport
+
+logger = logging.getLogger("Fingerprint.gateway")
+
+# Requests of a sensor run lowest number first: a door waiting on identify goes before a
+# background sync.
+HIGH = 0
+NORMAL = 5
+LOW = 9
+PRIORITIES = {'high': HIGH, 'normal': NORMAL, 'low': LOW}
+
+DEFAULT_PORT = 8521
+
+
+def priority_of(value, default=NORMAL):
+    '''Priority number of 'high' / 'normal' / 'low' or a number, `default` for None.'''
+    if value is None:
+        return default
+    if isinstance(value, str) and not value.lstrip("-").isdigit():
+        if value not in PRIORITIES:
+            raise ValueError("Unknown priority %r." % value)
+        return PRIORITIES[value]
+    return int(value)
+
+
+def flag_of(value, default=True):
+    '''Boolean of a JSON value or a query string such as "false" / "0", `default` for None.'''
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "on"):
+        return True
+    if text in ("0", "false", "no", "off", ""):
+        return False
+    raise ValueError("Not a boolean: %r." % value)
+
+
+def enroll_wait(policy):
+    '''
+        Longest an enrollment with `policy` can wait on the finger: every attempt of the
+        three stages waits for the finger to be placed and to lift, on every restart.
+    '''
+    if policy.finger_timeout is None:
+        return None
+    return (policy.restarts + 1) * 3 * policy.attempts * 2 * policy.finger_timeout
+
+
+def _error(fp):
+    # Why the last command of `fp` failed: the NackError name, DUPLICATE or NO_RESPONSE.
+    if fp.last_error is not None:
+        return fp.last_error.name
+    if fp.last_response is None or fp.last_response.ack is None:
+        return "NO_RESPONSE"
+    if fp.last_response.duplicate is not None:
+        return "DUPLICATE"
+    return "FAILED"
+
+
+def _encode(data):
+    return base64.b64encode(bytes(data)).decode("ascii")
+
+
+def _template(data):
+    # A template the sensor takes: 498 bytes, or the 502 byte layout downloads used to return.
+    size = UPLOAD_SIZES['SetTemplate']
+    if len(data) != size and unwrap_data(data, size) is None:
+        raise ValueError("A template has %d bytes, got %d." % (size, len(data)))
+    return data
+
+
+def _decode(text):
+    if not text:
+        raise ValueError("No template given.")
+    return _template(base64.b64decode(text))
+
+
+class SensorSession():
+    '''
+    * One sensor of the gateway: its Fingerprint, connected and opened once and then kept
+      open across requests, and the worker thread that runs the requests one at a time,
+      most urgent first (in arrival order within a priority).
+    * A local port is opened exclusively. A sensor that stops answering is connected
+      again before the next request.
+    '''
+
+    def __init__(self, name, port, baud=115200, timeout=1, transport=None, **options):
+        '''
+            port: serial port or "tcp://host:port".
+            transport: an already created transport to use instead of opening `port`.
+            options: passed to the Fingerprint, e.g. wait_ack=True.
+        '''
+        self.name = name
+        self.port = port
+        self.baud = baud
+        self.timeout = timeout
+        self.transport = transport
+        self.options = options
+        self.fp = None
+        self.connected = False
+        self.served = 0
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._thread = None
+
+    def start(self, connect=True):
+        '''Starts the worker, which connects to the sensor right away if `connect`.'''
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._serve, name="fp-gateway-%s" % self.name,
+                                        daemon=True)
+        self._thread.start()
+        if connect:
+            self.submit(lambda fp: None, HIGH)
+
+    def stop(self):
+        '''Cancels the queued requests, waits for the running one and closes the port.'''
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        while True:
+            try:
+                _, _, _, future = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            future.cancel()
+        self._queue.put((HIGH - 1, -1, None, None))
+        thread.join()
+        if self.fp:
+            self.fp.close_serial()
+        self.connected = False
+
+    @property
+    def pending(self):
+        '''Requests waiting in the queue.'''
+        return self._queue.qsize()
+
+    def submit(self, fn, priority=NORMAL):
+        '''Queues fn(fingerprint), returns a concurrent.futures.Future of its result.'''
+        if self._thread is None:
+            raise RuntimeError("Sensor %s is not running." % self.name)
+        future = Future()
+        self._queue.put((priority, next(self._seq), fn, future))
+        return future
+
+    def _connect(self):
+        if self.fp is None:
+            transport = self.transport or open_transport(self.port, self.baud, self.timeout,
+                                                         exclusive=True)
+            self.fp = Fingerprint(self.port, self.baud, timeout=self.timeout,
+                                  transport=transport, **self.options)
+        if not self.fp.connect() or not self.fp.open():
+            raise IOError("Sensor %s on %s does not answer." % (self.name, self.port))
+        self.connected = True
+        logger.info("Sensor %s connected on %s." % (self.name, self.port))
+
+    def _serve(self):
+        while True:
+            _, _, fn, future = self._queue.get()
+            if future is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue  # the client gave up waiting
+            try:
+                if not self.connected:
+                    self._connect()
+                result = fn(self.fp)
+            except Exception as e:
+                logger.error("Sensor %s: %s" % (self.name, e))
+                self.connected = False
+                future.set_exception(e)
+                continue
+            response = self.fp.last_response
+            if response is not None and response.ack is None:
+                self.connected = False  # connect again before the next request
+            self.served += 1
+            future.set_result(result)
+
+    def status(self):
+        return {
+            'name': self.name,
+            'port': self.port,
+            'connected': self.connected,
+            'pending': self.pending,
+            'served': self.served,
+        }
+
+
+class Gateway():
+    '''
+    * Serves sensors over HTTP/JSON, so that many clients share them. Every sensor is a
+      SensorSession: the port is owned by the gateway, connected once, and the requests
+      of all clients are queued per sensor by priority.
+    * Templates are base64 strings. Every request takes an optional "priority" ('high',
+      'normal', 'low' or a number, lower runs first) and "timeout" (seconds), in the
+      JSON body or the query string.
+
+          GET    /sensors                            state and queue length of each sensor
+          GET    /sensors/<name>                     {"count": enrolled templates}
+          POST   /sensors/<name>/identify            waits for a finger, {"id": ...}
+          POST   /sensors/<name>/identify_template   {"template": ...} -> {"id": ...}
+          POST   /sensors/<name>/enroll              {"id": ..., "check_duplicate": true}
+          GET    /sensors/<name>/templates/<id>      {"template": ...}
+          PUT    /sensors/<name>/templates/<id>      {"template": ..., "check_duplicate": true}
+          DELETE /sensors/<name>/templates/<id>
+          DELETE /sensors/<name>/templates           deletes all
+          GET    /metrics                            Prometheus text, with a Metrics hook
+
+    * An operation the sensor refuses answers 200 with "error" set to the NackError name
+      (e.g. "IDENTIFY_FAILED"). Unknown sensors answer 404, invalid requests 400, a
+      sensor that does not answer 503, and a request not done within its timeout 504.
+    * identify and identify_template default to 'high', everything else to 'normal';
+      background jobs such as syncs should ask for 'low'.
+    '''
+
+    def __init__(self, sensors, host="127.0.0.1", port=DEFAULT_PORT, baud=115200, timeout=1,
+                 request_timeout=30, hook=None, **options):
+        '''
+            sensors: {name: port}, a port is a serial port, "tcp://host:port" or an
+                     already created transport (e.g. FingerprintEmulator.loopback()).
+            request_timeout: default seconds a client waits for its request.
+            hook: a fplib.metrics.Hook shared by all sensors, served on /metrics if it
+                  is a Metrics.
+            options: passed to every Fingerprint, wait_ack is on by default.
+        '''
+        options.setdefault('wait_ack', True)
+        self.address = (host, port)
+        self.request_timeout = request_timeout
+        self.hook = hook
+        self.sessions = {}
+        for name, target in sensors.items():
+            if isinstance(target, str):
+                session = SensorSession(name, target, baud, timeout, hook=hook, **options)
+            else:
+                session = SensorSession(name, name, baud, timeout, transport=target, hook=hook,
+                                        **options)
+            self.sessions[name] = session
+        self.server = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://%s:%s" % (host, port)
+
+    def start(self):
+        '''Connects the sensors and serves in the background, returns the address.'''
+        for session in self.sessions.values():
+            session.start()
+        self.server = ThreadingHTTPServer(self.address, _Handler)
+        self.server.daemon_threads = True
+        self.server.gateway = self
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fp-gateway",
+                                        daemon=True)
+        self._thread.start()
+        logger.info("Gateway listening on %s" % self.url)
+        return self.server.server_address
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self._thread.join()
+            self.server = self._thread = None
+        for session in self.sessions.values():
+            session.stop()
+
+    def call(self, name, fn, priority=NORMAL, timeout=None):
+        '''
+            Runs fn(fingerprint) on the sensor `name`, after the queued requests of the same
+            or a higher priority. Waits up to `timeout` seconds (request_timeout if None);
+            a request that did not start by then is dropped.
+        '''
+        future = self.sessions[name].submit(fn, priority)
+        try:
+            return future.result(self.request_timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    # ------------------------------------------------------------ operations
+
+    def status(self):
+        return [session.status() for session in self.sessions.values()]
+
+    def count(self, name, priority=NORMAL, timeout=None):
+        def run(fp):
+            count = fp.get_enrolled_cnt()
+            if count is None or count < 0:
+                return {'count': None, 'error': _error(fp)}
+            return {'count': count, 'error': None}
+        return self.call(name, run, priority, timeout)
+
+    def identify(self, name, priority=HIGH, timeout=None, finger_timeout=10):
+        '''Waits up to `finger_timeout` seconds for a finger and identifies it.'''
+        def run(fp):
+            found = fp.wait_for_finger(finger_timeout)
+            if found is None:
+                raise IOError("Sensor %s does not answer." % name)
+            if not found:
+                fp.set_led(False)
+                return {'id': None, 'error': "NO_FINGER"}
+            idx = fp.identify()
+            if idx is None or idx < 0:
+                result = {'id': None, 'error': _error(fp)}
+            else:
+                result = {'id': idx, 'error': None}
+            fp.set_led(False)
+            return result
+        return self.call(name, run, priority, timeout)
+
+    def identify_template(self, name, data, priority=HIGH, timeout=None):
+        _template(data)  # refused here, a short data packet would leave the sensor stuck
+
+        def run(fp):
+            idx = fp.identifyTemplate(data)
+            if idx is None or idx < 0:
+                return {'id': None, 'error': _error(fp)}
+            return {'id': idx, 'error': None}
+        return self.call(name, run, priority, timeout)
+
+    def enroll(self, name, idx=None, check_duplicate=True, priority=NORMAL, timeout=None,
+               finger_timeout=10):
+        '''
+            Enrolls the finger under `idx` (the first free ID if None, -1 for the template).
+            Without a `timeout` the request waits as long as the enrollment can take on
+            `finger_timeout`, plus request_timeout.
+        '''
+        policy = RetryPolicy(finger_timeout=finger_timeout)
+        if timeout is None:
+            wait = enroll_wait(policy)
+            timeout = None if wait is None else wait + self.request_timeout
+
+        def run(fp):
+            result = fp.enrollment(idx, check_duplicate, policy).run()
+            reply = {'ok': result.ok, 'id': result.idx, 'duplicate': result.duplicate,
+                     'error': None if result.ok else _error(fp)}
+            if result.template is not None:
+                reply['template'] = _encode(result.template)
+            return reply
+        return self.call(name, run, priority, timeout)
+
+    def get_template(self, name, idx, priority=NORMAL, timeout=None):
+        def run(fp):
+            data, ok = fp.getTemplate(idx)
+            if not ok or data is None:
+                return {'template': None, 'error': _error(fp)}
+            reply = {'template': _encode(data), 'error': None}
+            fp.release(data)
+            return reply
+        return self.call(name, run, priority, timeout)
+
+    def set_template(self, name, idx, data, check_duplicate=True, priority=NORMAL, timeout=None):
+        _template(data)
+
+        def run(fp):
+            if fp.setTemplate(idx, data, check_duplicate):
+                return {'ok': True, 'duplicate': None, 'error': None}
+            return {'ok': False, 'duplicate': fp.last_response.duplicate, 'error': _error(fp)}
+        return self.call(name, run, priority, timeout)
+
+    def delete(self, name, idx=None, priority=NORMAL, timeout=None):
+        '''Deletes the template `idx`, all of them if None.'''
+        def run(fp):
+            if fp.delete(idx):
+                return {'ok': True, 'error': None}
+            return {'ok': False, 'error': _error(fp)}
+        return self.call(name, run, priority, timeout)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection of a client open between its requests, without Nagle
+    # the body written after the headers does not wait for the delayed ACK of the client
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    ROUTES = (
+        ("GET", r"/sensors", "_sensors"),
+        ("GET", r"/sensors/(?P<name>[^/]+)", "_count"),
+        ("POST", r"/sensors/(?P<name>[^/]+)/identify", "_identify"),
+        ("POST", r"/sensors/(?P<name>[^/]+)/identify_template", "_identify_template"),
+        ("POST", r"/sensors/(?P<name>[^/]+)/enroll", "_enroll"),
+        ("GET", r"/sensors/(?P<name>[^/]+)/templates/(?P<idx>-?\d+)", "_get_template"),
+        ("PUT", r"/sensors/(?P<name>[^/]+)/templates/(?P<idx>-?\d+)", "_set_template"),
+        ("DELETE", r"/sensors/(?P<name>[^/]+)/templates(?:/(?P<idx>-?\d+))?", "_delete"),
+        ("GET", r"/metrics", "_metrics"),
+    )
+
+    @property
+    def gateway(self):
+        return self.server.gateway
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s" % (self.address_string(), format % args))
+
+    def _reply(self, status, payload, content_type="application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _arguments(self, query):
+        args = dict(parse_qsl(query))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = json.loads(self.rfile.read(length))
+            if not isinstance(body, dict):
+                raise ValueError("The body has to be a JSON object.")
+            args.update(body)
+        return args
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        try:
+            args = self._arguments(url.query)
+        except ValueError as e:
+            self._reply(400, {'error': "BAD_REQUEST", 'message': str(e)})
+            return
+        for route_method, pattern, action in _Handler.ROUTES:
+            match = re.fullmatch(pattern, url.path.rstrip("/"))
+            if match and route_method == method:
+                break
+        else:
+            self._reply(404, {'error': "NOT_FOUND", 'message': url.path})
+            return
+        params = match.groupdict()
+        name = params.get('name')
+        if name is not None and name not in self.gateway.sessions:
+            self._reply(404, {'error': "NOT_FOUND", 'message': "No sensor %s." % name})
+            return
+        try:
+            if params.get('idx') is not None:
+                params['idx'] = int(params['idx'])
+            args['priority'] = priority_of(args.get('priority'),
+                                           HIGH if action.startswith("_identify") else NORMAL)
+            if args.get('timeout') is not None:
+                args['timeout'] = float(args['timeout'])
+            status, payload = getattr(self, action)(args, **params)
+        except (ValueError, TypeError, KeyError) as e:
+            self._reply(400, {'error': "BAD_REQUEST", 'message': str(e)})
+        except FutureTimeoutError:
+            self._reply(504, {'error': "TIMEOUT", 'message': "The request was not done in time."})
+        except (IOError, RuntimeError) as e:
+            self._reply(503, {'error': "UNAVAILABLE", 'message': str(e)})
+        else:
+            if isinstance(payload, bytes):
+                self._reply(status, payload, "text/plain; version=0.0.4")
+            else:
+                self._reply(status, payload)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    # ----------------------------------------------------------------- routes
+
+    def _sensors(self, args):
+        return 200, {'sensors': self.gateway.status()}
+
+    def _count(self, args, name):
+        return 200, self.gateway.count(name, args['priority'], args.get('timeout'))
+
+    def _identify(self, args, name):
+        return 200, self.gateway.identify(name, args['priority'], args.get('timeout'),
+                                          float(args.get('finger_timeout', 10)))
+
+    def _identify_template(self, args, name):
+        return 200, self.gateway.identify_template(name, _decode(args.get('template')),
+                                                   args['priority'], args.get('timeout'))
+
+    def _enroll(self, args, name):
+        idx = args.get('id')
+        return 200, self.gateway.enroll(name, None if idx is None else int(idx),
+                                        flag_of(args.get('check_duplicate')),
+                                        args['priority'], args.get('timeout'),
+                                        float(args.get('finger_timeout', 10)))
+
+    def _get_template(self, args, name, idx):
+        return 200, self.gateway.get_template(name, idx, args['priority'], args.get('timeout'))
+
+    def _set_template(self, args, name, idx):
+        return 200, self.gateway.set_template(name, idx, _decode(args.get('template')),
+                                              flag_of(args.get('check_duplicate')),
+                                              args['priority'], args.get('timeout'))
+
+    def _delete(self, args, name, idx=None):
+        return 200, self.gateway.delete(name, idx, args['priority'], args.get('timeout'))
+
+    def _metrics(self, args):
+        hook = self.gateway.hook
+        if not hasattr(hook, "prometheus"):
+            return 404, {'error': "NOT_FOUND", 'message': "No metrics are collected."}
+        return 200, hook.prometheus().encode()
+
+
+class GatewayClient():
+    '''
+    * Client of a Gateway over one kept-alive HTTP connection (not thread safe, use one
+      client per thread). Methods return the JSON replies as dicts, with templates as
+      bytes; a request the gateway could not serve raises IOError.
+    '''
+
+    def __init__(self, url="http://127.0.0.1:%d" % DEFAULT_PORT, timeout=60):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._conn = None
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _request(self, method, path, body=None, wait=False):
+        # wait: seconds to wait for the reply if not the client timeout, None forever
+        data = None if body is None else json.dumps(body).encode()
+        headers = {'Content-Type': "application/json"} if data is not None else {}
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request(method, path, data, headers)
+                if wait is not False:
+                    self._conn.sock.settimeout(wait)
+                response = self._conn.getresponse()
+                payload = response.read()
+                if wait is not False:
+                    self._conn.sock.settimeout(self.timeout)
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # the gateway closed the kept-alive connection, open a new one once
+                self.close()
+                if attempt:
+                    raise
+        reply = json.loads(payload) if response.getheader("Content-Type", "").startswith(
+            "application/json") else payload.decode()
+        if response.status >= 400:
+            raise IOError("%s %s: %s %s" % (method, path, response.status,
+                                             reply.get('message') or reply.get('error')))
+        if isinstance(reply, dict) and reply.get('template'):
+            reply['template'] = base64.b64decode(reply['template'])
+        return reply
+
+    @staticmethod
+    def _options(**options):
+        return {key: value for key, value in options.items() if value is not None}
+
+    def sensors(self):
+        return self._request("GET", "/sensors")['sensors']
+
+    def count(self, name, priority=None):
+        return self._request("GET", "/sensors/%s" % name, self._options(priority=priority))
+
+    def identify(self, name, priority=None, finger_timeout=None, timeout=None):
+        return self._request("POST", "/sensors/%s/identify" % name, self._options(
+            priority=priority, finger_timeout=finger_timeout, timeout=timeout))
+
+    def identify_template(self, name, data, priority=None, timeout=None):
+        return self._request("POST", "/sensors/%s/identify_template" % name, self._options(
+            template=_encode(data), priority=priority, timeout=timeout))
+
+    def enroll(self, name, idx=None, check_duplicate=True, priority=None, finger_timeout=None,
+               timeout=None):
+        if timeout is not None:
+            wait = timeout + self.timeout
+        else:
+            wait = enroll_wait(RetryPolicy(finger_timeout=finger_timeout or 10))
+            wait = None if wait is None else wait + self.timeout
+        return self._request("POST", "/sensors/%s/enroll" % name, self._options(
+            id=idx, check_duplicate=check_duplicate, priority=priority,
+            finger_timeout=finger_timeout, timeout=timeout), wait)
+
+    def get_template(self, name, idx, priority=None):
+        return self._request("GET", "/sensors/%s/templates/%d" % (name, idx),
+                             self._options(priority=priority))
+
+    def set_template(self, name, idx, data, check_duplicate=True, priority=None):
+        return self._request("PUT", "/sensors/%s/templates/%d" % (name, idx), self._options(
+            template=_encode(data), check_duplicate=check_duplicate, priority=priority))
+
+    def delete(self, name, idx=None, priority=None):
+        path = "/sensors/%s/templates" % name
+        if idx is not None:
+            path += "/%d" % idx
+        return self._request("DELETE", path, self._options(priority=priority))
+
+    def metrics(self):
+        return self._request("GET", "/metrics")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Share fingerprint sensors over HTTP/JSON.")
+    parser.add_argument("sensors", nargs="*", metavar="NAME=PORT",
+                        help="sensors to serve, e.g. door=/dev/ttyUSB0 or lab=tcp://host:4001")
+    parser.add_argument("--emulate", nargs="+", default=[], metavar="NAME",
+                        help="serve emulated sensors under these names")
+    parser.add_argument("--listen", default="127.0.0.1:%d" % DEFAULT_PORT, metavar="HOST:PORT")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--metrics", action="store_true", help="collect metrics for /metrics")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    sensors = {}
+    for spec in args.sensors:
+        name, sep, port = spec.partition("=")
+        if not sep:
+            parser.error("%r is not NAME=PORT" % spec)
+        sensors[name] = port
+    emulators = []
+    if args.emulate:
+        from .emulator import FingerprintEmulator
+        for name in args.emulate:
+            emu = FingerprintEmulator(baud=args.baud)
+            sensors[name] = emu.start()
+            emulators.append(emu)
+    if not sensors:
+        parser.error("no sensors given")
+
+    hook = None
+    if args.metrics:
+        from .metrics import Metrics
+        hook = Metrics()
+    host, _, port = args.listen.rpartition(":")
+    gateway = Gateway(sensors, host or "127.0.0.1", int(port), args.baud, hook=hook)
+    gateway.start()
+    try:
+        gateway._thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gateway.stop()
+        for emu in emulators:
+            emu.stop()
+
+
+if __name__ == "__main__":
+    main()
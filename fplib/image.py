@@ -0,0 +1,73 @@
+import struct
+import zlib
+
+import numpy as np
+
+IMAGE_SHAPE = (202, 258)  # GetImage, rows x columns
+RAW_IMAGE_SHAPE = (240, 320)  # GetRawImage
+
+
+def to_array(data, shape):
+    '''uint8 array of `shape` over the image bytes `data`, without copying them.'''
+    return np.frombuffer(data, dtype=np.uint8).reshape(shape)
+
+
+class RowStream():
+    '''
+    * on_data callback for FrameReader.read_frame_into() that hands the rows of an image
+      to on_rows(rows, first) as soon as they are complete in the receive buffer.
+    '''
+
+    def __init__(self, shape, on_rows):
+        self.shape = shape
+        self.on_rows = on_rows
+        self.sent = 0
+        self._image = None
+        self._buf = None
+
+    def __call__(self, buf, n):
+        if buf is not self._buf:
+            # new frame (the first one, or a retry after a bad data packet)
+            self._buf = buf
+            self._image = to_array(memoryview(buf)[4:-2], self.shape)
+            self.sent = 0
+        ready = min(max(n - 4, 0) // self.shape[1], self.shape[0])
+        if n < 4 + self.sent * self.shape[1]:
+            self.sent = 0
+        if ready > self.sent:
+            self.on_rows(self._image[self.sent:ready], self.sent)
+            self.sent = ready
+
+
+def save_pgm(path, image):
+    '''Writes a uint8 array as a binary PGM (P5) file.'''
+    rows, cols = image.shape
+    with open(path, "wb") as f:
+        f.write(b"P5\n%d %d\n255\n" % (cols, rows))
+        f.write(np.ascontiguousarray(image, dtype=np.uint8).data)
+
+
+def _png_chunk(tag, data):
+    return (struct.pack('>I', len(data)) + tag + data
+            + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+
+def save_png(path, image, level=6):
+    '''Writes a uint8 array as an 8 bit grayscale PNG file.'''
+    rows, cols = image.shape
+    # every scanline starts with its filter type, 0 (none)
+    raw = np.zeros((rows, cols + 1), dtype=np.uint8)
+    raw[:, 1:] = image
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(_png_chunk(b"IHDR", struct.pack('>IIBBBBB', cols, rows, 8, 0, 0, 0, 0)))
+        f.write(_png_chunk(b"IDAT", zlib.compress(raw.data, level)))
+        f.write(_png_chunk(b"IEND", b""))
+
+
+def save_image(path, image):
+    '''Writes `image` as PNG or PGM, by the extension of `path`.'''
+    if str(path).lower().endswith(".pgm"):
+        save_pgm(path, image)
+    else:
+        save_png(path, image)
@@ -0,0 +1,157 @@
+import bisect
+import json
+import threading
+
+
+class Hook():
+    '''
+    * Receives the events of the transport layer of a `Fingerprint` (its `hook`).
+      Subclass it and override what you need; without a hook the events are not even
+      created.
+    '''
+
+    def command(self, cmd, nbytes):
+        '''A command packet of `nbytes` bytes was written.'''
+
+    def data(self, cmd, nbytes):
+        '''A data packet of `nbytes` bytes was written for `cmd`.'''
+
+    def response(self, cmd, ack, param, nbytes, latency):
+        '''
+            The response to `cmd` (and its data packet, all `nbytes` of it) came in
+            `latency` seconds after the last write. ack is None if nothing came.
+        '''
+
+    def retry(self, cmd):
+        '''`cmd` is sent again after a corrupted transfer.'''
+
+    def resync(self, cmd, count):
+        '''`count` times bytes were dropped to find the start of a packet.'''
+
+
+class Metrics(Hook):
+    '''
+    * Hook that counts: a latency histogram per command, bytes written and read, NACK
+      error codes, retries and resyncs.
+    * Export with `prometheus()` (text exposition format) or `json()`. One Metrics can be
+      shared by the sensors of a pool.
+    '''
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or Metrics.BUCKETS)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}  # cmd -> [bucket counts..., +Inf count, sum]
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self.commands = {}
+            self.nacks = {}  # (cmd, error) -> count
+            self.timeouts = {}
+            self.retries = {}
+            self.resyncs = 0
+
+    def command(self, cmd, nbytes):
+        with self._lock:
+            self.bytes_sent += nbytes
+            self.commands[cmd] = self.commands.get(cmd, 0) + 1
+
+    def data(self, cmd, nbytes):
+        with self._lock:
+            self.bytes_sent += nbytes
+
+    def response(self, cmd, ack, param, nbytes, latency):
+        with self._lock:
+            self.bytes_received += nbytes
+            if ack is None:
+                self.timeouts[cmd] = self.timeouts.get(cmd, 0) + 1
+                return
+            if not ack:
+                key = (cmd, param)
+                self.nacks[key] = self.nacks.get(key, 0) + 1
+            hist = self.latency.get(cmd)
+            if hist is None:
+                hist = self.latency[cmd] = [0] * (len(self.buckets) + 1) + [0.0]
+            hist[bisect.bisect_left(self.buckets, latency)] += 1
+            hist[-1] += latency
+
+    def retry(self, cmd):
+        with self._lock:
+            self.retries[cmd] = self.retries.get(cmd, 0) + 1
+
+    def resync(self, cmd, count):
+        with self._lock:
+            self.resyncs += count
+
+    # ---------------------------------------------------------------- export
+
+    def snapshot(self):
+        '''All counters as a dict of plain values.'''
+        with self._lock:
+            latency = {}
+            for cmd, hist in self.latency.items():
+                counts = hist[:-1]
+                latency[cmd] = {
+                    'count': sum(counts),
+                    'sum': hist[-1],
+                    'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], counts)),
+                }
+            return {
+                'latency_seconds': latency,
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+                'commands': dict(self.commands),
+                'nacks': {'%s:0x%04X' % key: n for key, n in self.nacks.items()},
+                'timeouts': dict(self.timeouts),
+                'retries': dict(self.retries),
+                'resyncs': self.resyncs,
+            }
+
+    def json(self, **kwargs):
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def prometheus(self, prefix="fplib"):
+        '''The counters in the Prometheus text exposition format.'''
+        snap = self.snapshot()
+        lines = []
+
+        def metric(name, kind, doc):
+            lines.append("# HELP %s_%s %s" % (prefix, name, doc))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+
+        metric("command_latency_seconds", "histogram", "Time from the request to its response.")
+        for cmd, hist in sorted(snap['latency_seconds'].items()):
+            total = 0
+            for le, n in hist['buckets'].items():
+                total += n
+                lines.append('%s_command_latency_seconds_bucket{command="%s",le="%s"} %d'
+                             % (prefix, cmd, le, total))
+            lines.append('%s_command_latency_seconds_sum{command="%s"} %f'
+                         % (prefix, cmd, hist['sum']))
+            lines.append('%s_command_latency_seconds_count{command="%s"} %d'
+                         % (prefix, cmd, hist['count']))
+        metric("bytes_sent_total", "counter", "Bytes written to the sensor.")
+        lines.append("%s_bytes_sent_total %d" % (prefix, snap['bytes_sent']))
+        metric("bytes_received_total", "counter", "Bytes read from the sensor.")
+        lines.append("%s_bytes_received_total %d" % (prefix, snap['bytes_received']))
+        metric("commands_total", "counter", "Command packets sent.")
+        for cmd, n in sorted(snap['commands'].items()):
+            lines.append('%s_commands_total{command="%s"} %d' % (prefix, cmd, n))
+        metric("nacks_total", "counter", "NACK responses by error code.")
+        with self._lock:
+            nacks = sorted(self.nacks.items())
+        for (cmd, error), n in nacks:
+            lines.append('%s_nacks_total{command="%s",error="0x%04X"} %d' % (prefix, cmd, error, n))
+        metric("timeouts_total", "counter", "Commands without a response.")
+        for cmd, n in sorted(snap['timeouts'].items()):
+            lines.append('%s_timeouts_total{command="%s"} %d' % (prefix, cmd, n))
+        metric("retries_total", "counter", "Transfers repeated after a corrupted packet.")
+        for cmd, n in sorted(snap['retries'].items()):
+            lines.append('%s_retries_total{command="%s"} %d' % (prefix, cmd, n))
+        metric("resyncs_total", "counter", "Times bytes were dropped to find a packet start.")
+        lines.append("%s_resyncs_total %d" % (prefix, snap['resyncs']))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,51 @@
+import json
+import os
+import threading
+
+
+class LinkProfile():
+    '''
+    * Remembers the last baud rate each port talked at, in a small JSON file, so the next
+      connect() tries it first instead of guessing.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._bauds = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self.load()
+
+    def get(self, port):
+        return self._bauds.get(str(port))
+
+    def put(self, port, baud):
+        '''Records `baud` for `port` and saves the file if it changed.'''
+        with self._lock:
+            if self._bauds.get(str(port)) == baud:
+                return
+            self._bauds[str(port)] = baud
+        self.save()
+
+    def forget(self, port):
+        with self._lock:
+            if self._bauds.pop(str(port), None) is None:
+                return
+        self.save()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                bauds = json.load(f)
+        except ValueError:
+            bauds = {}  # a damaged profile only costs one slow connect
+        with self._lock:
+            self._bauds = {port: int(baud) for port, baud in bauds.items()}
+
+    def save(self):
+        with self._lock:
+            bauds = dict(self._bauds)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(bauds, f)
+        os.replace(tmp, self.path)
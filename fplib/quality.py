@@ -0,0 +1,63 @@
+from collections import namedtuple
+
+import numpy as np
+
+# All scores are between 0 and 1.
+# coverage: share of the image covered by the finger.
+# contrast: spread of the grey levels on the finger (5th to 95th percentile).
+# clarity: how well defined the ridge direction is, averaged over the finger.
+# dryness: how much lighter than balanced the finger is (broken, faint ridges); 0 is balanced.
+Quality = namedtuple('Quality', 'coverage contrast clarity dryness')
+
+
+class QualityLimits(namedtuple('QualityLimits', 'coverage contrast clarity dryness')):
+    '''Minimum coverage, contrast and clarity and maximum dryness of an acceptable image.'''
+
+    __slots__ = ()
+
+    def __new__(cls, coverage=0.4, contrast=0.25, clarity=0.5, dryness=0.5):
+        return super(QualityLimits, cls).__new__(cls, coverage, contrast, clarity, dryness)
+
+    def accepts(self, quality):
+        return (quality.coverage >= self.coverage and quality.contrast >= self.contrast
+                and quality.clarity >= self.clarity and quality.dryness <= self.dryness)
+
+
+def _blocks(a, block):
+    # (rows, cols) -> (rows // block, cols // block, block * block), the edge is cut off
+    rows, cols = a.shape[0] // block, a.shape[1] // block
+    a = a[:rows * block, :cols * block]
+    return a.reshape(rows, block, cols, block).swapaxes(1, 2).reshape(rows, cols, -1)
+
+
+def assess(image, block=8, min_std=10.0):
+    '''
+        Scores a fingerprint image (2D uint8 array, e.g. from Fingerprint.get_image()).
+        The image is cut into `block` x `block` tiles, tiles whose grey levels vary by less
+        than `min_std` are background.
+        Returns: Quality
+    '''
+    image = np.asarray(image, dtype=np.float32)
+    tiles = _blocks(image, block)
+    foreground = tiles.std(axis=2) >= min_std
+    coverage = float(foreground.mean())
+    if not foreground.any():
+        return Quality(coverage, 0.0, 0.0, 0.0)
+
+    pixels = tiles[foreground]
+    low, high = np.percentile(pixels, (5, 95))
+    contrast = float((high - low) / 255.0)
+
+    # Ridge clarity: coherence of the structure tensor per tile.
+    gy, gx = np.gradient(image)
+    gxx = _blocks(gx * gx, block).sum(axis=2)[foreground]
+    gyy = _blocks(gy * gy, block).sum(axis=2)[foreground]
+    gxy = _blocks(gx * gy, block).sum(axis=2)[foreground]
+    energy = gxx + gyy
+    coherence = np.sqrt((gxx - gyy) ** 2 + 4 * gxy ** 2) / np.maximum(energy, 1e-6)
+    clarity = float(coherence.mean())
+
+    # Ridges are dark: a balanced print is about half ridge, a dry one much less.
+    ridge = float((pixels < (low + high) / 2).mean())
+    dryness = float(np.clip(1.0 - 2.0 * ridge, 0.0, 1.0))
+    return Quality(coverage, contrast, clarity, dryness)
@@ -0,0 +1,200 @@
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from .fpmain import Fingerprint
+
+logger = logging.getLogger("Fingerprint.pool")
+
+# global_id is the ID of the template across all shards, slot its ID on the sensor at port.
+IdentifyHit = namedtuple('IdentifyHit', 'global_id port slot')
+
+
+class PoolResult():
+    '''
+    * Outcome of one operation on every sensor of a SensorPool.
+    * `results` maps port -> return value, `errors` maps port -> exception.
+    '''
+
+    __slots__ = ('results', 'errors')
+
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def __repr__(self):
+        return "PoolResult(results=%r, errors=%r)" % (self.results, self.errors)
+
+
+class SensorPool():
+    '''
+    * Drives many sensors, each on its own port, in parallel.
+    * Every sensor has its own worker thread, so its commands stay in order while the
+      other sensors run at the same time.
+    * The sensors can also hold shards of one population: sensor i holds the global IDs
+      i * shard_size ... (i + 1) * shard_size - 1, see identify_template().
+    '''
+
+    def __init__(self, ports=None, baud=115200, timeout=1, shard_size=Fingerprint.DB_CAPACITY,
+                 **options):
+        '''
+            ports: list of serial ports, discovered with discover() if None.
+            shard_size: number of global IDs per sensor, in the order of `ports`.
+            options: passed to every Fingerprint, e.g. wait_ack=True.
+        '''
+        self.ports = list(ports) if ports is not None else self.discover()
+        self.baud = baud
+        self.timeout = timeout
+        self.shard_size = shard_size
+        self.options = options
+        self.sensors = {}
+        self._workers = {}
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def discover():
+        '''Serial ports of the USB-UART adapters that are plugged in.'''
+        from serial.tools import list_ports
+        return sorted(p.device for p in list_ports.comports() if p.vid is not None)
+
+    def open(self):
+        '''Connects every port, ports that fail are left out of the pool.'''
+        def connect(port):
+            fp = Fingerprint(port, self.baud, timeout=self.timeout, **self.options)
+            if not fp.init():
+                raise IOError("Failed to connect to %s." % port)
+            fp.open()
+            return fp
+
+        for port in self.ports:
+            if port not in self._workers:
+                self._workers[port] = ThreadPoolExecutor(1)
+        result = self._run(self.ports, connect, pass_port=True)
+        for port, fp in result.results.items():
+            self.sensors[port] = fp
+        for port, e in result.errors.items():
+            logger.error("Sensor %s: %s" % (port, e))
+            self._workers.pop(port).shutdown(wait=False)
+        return result
+
+    def close(self):
+        for port, fp in self.sensors.items():
+            fp.close_serial()
+        for worker in self._workers.values():
+            worker.shutdown(wait=True)
+        self.sensors = {}
+        self._workers = {}
+
+    def _run(self, ports, fn, timeout=None, pass_port=False):
+        futures = {}
+        for port in ports:
+            arg = port if pass_port else self.sensors[port]
+            futures[self._workers[port].submit(fn, arg)] = port
+        done, not_done = wait(futures, timeout)
+        result = PoolResult()
+        for future in done:
+            port = futures[future]
+            e = future.exception()
+            if e is not None:
+                result.errors[port] = e
+            else:
+                result.results[port] = future.result()
+        for future in not_done:
+            result.errors[futures[future]] = TimeoutError("no result within %s seconds" % timeout)
+        return result
+
+    def run(self, fn, ports=None, timeout=None):
+        '''
+            Calls fn(fingerprint) on every sensor (or the given ports) in parallel.
+            Returns a PoolResult; sensors still busy after `timeout` seconds are reported
+            as errors.
+        '''
+        if ports is None:
+            ports = list(self.sensors)
+        return self._run(ports, fn, timeout)
+
+    def call(self, method, *args, **kwargs):
+        '''Calls the Fingerprint method `method` with the same arguments on every sensor.'''
+        return self.run(lambda fp: getattr(fp, method)(*args, **kwargs))
+
+    def enrolled_counts(self):
+        return self.call("get_enrolled_cnt")
+
+    def push_template(self, idx, data):
+        '''Uploads one template under `idx` to every sensor.'''
+        return self.call("setTemplate", idx, data)
+
+    def push_templates(self, templates):
+        '''Uploads {idx: template} to every sensor, each sensor works through the whole set.'''
+        def push(fp):
+            return {idx: fp.setTemplate(idx, data) for idx, data in templates.items()}
+        return self.run(push)
+
+    def delete(self, idx=None):
+        return self.call("delete", idx)
+
+    def global_id(self, port, slot):
+        return self.ports.index(port) * self.shard_size + slot
+
+    def locate(self, global_id):
+        '''Port and slot of a global ID.'''
+        shard, slot = divmod(global_id, self.shard_size)
+        return self.ports[shard], slot
+
+    def identify_template(self, data, ports=None, timeout=None):
+        '''
+            Sends `data` to every shard at once with IdentifyTemplate1_N and returns the
+            IdentifyHit of the first sensor that knows the template, without waiting for the
+            others. Returns None if no shard knows it within `timeout` seconds; sensors that
+            fail count as a miss.
+        '''
+        if ports is None:
+            ports = list(self.sensors)
+        data = bytes(data)
+        futures = {}
+        for port in ports:
+            futures[self._workers[port].submit(self.sensors[port].identifyTemplate, data)] = port
+        try:
+            for future in as_completed(futures, timeout):
+                port = futures[future]
+                e = future.exception()
+                if e is not None:
+                    logger.error("Sensor %s: %s" % (port, e))
+                    continue
+                slot = future.result()
+                if slot is not None and slot >= 0:
+                    return IdentifyHit(self.global_id(port, slot), port, slot)
+        except FutureTimeoutError:
+            logger.warning("Identification timed out after %s seconds." % timeout)
+        return None
+
+    def identify(self, port, timeout=None):
+        '''
+            Captures the finger on the sensor at `port`, makes its template there and looks
+            it up on every shard, see identify_template().
+        '''
+        fp = self.sensors[port]
+
+        def make_template(fp):
+            result = fp.MakeTemplate()
+            if not result or result[0] is None:
+                return None
+            data = bytes(result[0])
+            fp.release(result[0])
+            return data
+
+        data = self._workers[port].submit(make_template, fp).result(timeout)
+        if data is None:
+            return None
+        return self.identify_template(data, timeout=timeout)
@@ -0,0 +1,200 @@
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+from .framing import checksum
+
+StoreEntry = namedtuple('StoreEntry', 'key slot checksum timestamp')
+
+
+class TemplateStore():
+    '''
+    * On-disk template store: fixed size 498 byte records in one memory-mapped file, each
+      preceded by its index entry (slot, user key, checksum, timestamp).
+    * Lookups by key or slot are dictionary hits, deleted records go on a free list and
+      are reused by the next put(). A full store grows by extending the file in place.
+    * get() returns a memoryview into the mapping, which can be handed to `setTemplate` /
+      `identifyTemplate` as it is. Views stay valid while the store is open, also when it
+      grows (the mapping they point into is kept until close()); a record that is
+      replaced or deleted changes under its views.
+    '''
+
+    MAGIC = b'FPTS\x02'
+    _HEADER = struct.Struct('<5s3xIIIi')  # magic, record size, capacity, allocated, free head
+    _ENTRY = struct.Struct('<B3xi32sHdi')  # used, slot, key, checksum, timestamp, next free
+    HEADER_SIZE = 64
+    KEY_SIZE = 32
+
+    def __init__(self, path, capacity=4096, record_size=498):
+        self.path = path
+        if not os.path.exists(path):
+            self._create(path, capacity, record_size)
+        self._open()
+
+    # ------------------------------------------------------------- file
+
+    @classmethod
+    def _create(cls, path, capacity, record_size):
+        with open(path, "wb") as f:
+            f.write(cls._HEADER.pack(cls.MAGIC, record_size, capacity, 0, -1))
+            f.truncate(cls._file_size(capacity, record_size))
+
+    @classmethod
+    def _file_size(cls, capacity, record_size):
+        return cls.HEADER_SIZE + capacity * (cls._ENTRY.size + record_size)
+
+    def _open(self):
+        self._retired = []  # mappings from before the store grew, views may point into them
+        self._map = None
+        self._file = open(self.path, "r+b")
+        if os.fstat(self._file.fileno()).st_size < self.HEADER_SIZE:
+            self._file.close()
+            raise ValueError("%s is not a template store." % self.path)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self.record_size, self.capacity, self._allocated, self._free = \
+            self._HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError("%s is not a template store." % self.path)
+        self._keys = {}
+        self._slots = {}
+        for rec in range(self.capacity):
+            used, slot, key, _, _, _ = self._ENTRY.unpack_from(self._map, self._entry_offset(rec))
+            if used:
+                self._index(rec, key.rstrip(b'\0').decode(), slot)
+
+    def _index(self, rec, key, slot):
+        self._keys[key] = rec
+        if slot >= 0:
+            self._slots[slot] = rec
+
+    def _write_header(self):
+        self._HEADER.pack_into(self._map, 0, self.MAGIC, self.record_size, self.capacity,
+                               self._allocated, self._free)
+
+    def _entry_offset(self, rec):
+        return self.HEADER_SIZE + rec * (self._ENTRY.size + self.record_size)
+
+    def _record_offset(self, rec):
+        return self._entry_offset(rec) + self._ENTRY.size
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        if self._map is not None:
+            self._map.flush()
+            for m in self._retired + [self._map]:
+                try:
+                    m.close()
+                except BufferError:
+                    pass  # a view is still alive, the map is freed with the last one
+            self._file.close()
+            self._retired = []
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _grow(self):
+        # Doubles the capacity by extending the file, records keep their offsets. The old
+        # mapping stays open (shared with the new one) for the views already handed out.
+        self._map.flush()
+        self.capacity *= 2
+        self._file.truncate(self._file_size(self.capacity, self.record_size))
+        self._retired.append(self._map)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._write_header()
+
+    # ---------------------------------------------------------- records
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def _view(self, rec):
+        offset = self._record_offset(rec)
+        return memoryview(self._map)[offset:offset + self.record_size]
+
+    def _entry(self, rec):
+        _, slot, key, chksum, timestamp, _ = self._ENTRY.unpack_from(
+            self._map, self._entry_offset(rec))
+        return StoreEntry(key.rstrip(b'\0').decode(), slot, chksum, timestamp)
+
+    def get(self, key):
+        '''Template stored under `key` as a memoryview into the file, or None.'''
+        rec = self._keys.get(key)
+        return None if rec is None else self._view(rec)
+
+    def get_slot(self, slot):
+        '''Template stored for sensor slot `slot`, or None.'''
+        rec = self._slots.get(slot)
+        return None if rec is None else self._view(rec)
+
+    def entry(self, key):
+        rec = self._keys.get(key)
+        return None if rec is None else self._entry(rec)
+
+    def entries(self):
+        '''StoreEntry of every record, ordered by slot.'''
+        return sorted((self._entry(rec) for rec in self._keys.values()), key=lambda e: e.slot)
+
+    def put(self, key, data, slot=-1):
+        '''
+            Stores `data` under `key` (and sensor slot `slot`), replacing the record that
+            already has that key.
+        '''
+        if len(data) != self.record_size:
+            raise ValueError("template has %d bytes, expected %d" % (len(data), self.record_size))
+        encoded = key.encode()
+        if len(encoded) > self.KEY_SIZE:
+            raise ValueError("key longer than %d bytes: %r" % (self.KEY_SIZE, key))
+        rec = self._keys.get(key)
+        if slot >= 0 and self._slots.get(slot, rec) != rec:
+            raise KeyError("slot %d already holds %r" % (slot, self._entry(self._slots[slot]).key))
+        if rec is None:
+            rec = self._allocate()
+        else:
+            old = self._entry(rec)
+            if old.slot >= 0 and self._slots.get(old.slot) == rec:
+                del self._slots[old.slot]
+        offset = self._record_offset(rec)
+        self._map[offset:offset + self.record_size] = data
+        self._ENTRY.pack_into(self._map, self._entry_offset(rec), 1, slot, encoded,
+                              checksum(data), time.time(), -1)
+        self._index(rec, key, slot)
+        return rec
+
+    def _allocate(self):
+        if self._free >= 0:
+            rec = self._free
+            self._free = self._ENTRY.unpack_from(self._map, self._entry_offset(rec))[5]
+        else:
+            if self._allocated >= self.capacity:
+                self._grow()
+            rec = self._allocated
+            self._allocated += 1
+        self._write_header()
+        return rec
+
+    def delete(self, key):
+        rec = self._keys.pop(key, None)
+        if rec is None:
+            return False
+        entry = self._entry(rec)
+        if entry.slot >= 0:
+            self._slots.pop(entry.slot, None)
+        self._ENTRY.pack_into(self._map, self._entry_offset(rec), 0, -1, b'', 0, 0.0, self._free)
+        self._free = rec
+        self._write_header()
+        return True
@@ -0,0 +1,40 @@
+from collections import namedtuple
+
+# action is 'delete' or 'set', key is the TemplateStore key (None for deletes).
+SyncOp = namedtuple('SyncOp', 'action slot key')
+
+
+class SyncPlan():
+    '''
+    * The operations that bring a sensor database in line with a TemplateStore:
+      DeleteID for slots the store does not have, SetTemplate for slots that are
+      missing or hold a different template. Slots that already match are left alone.
+    * `round_trips` counts the commands spent on comparing, `unchanged` the slots that
+      already match.
+    '''
+
+    __slots__ = ('ops', 'unchanged', 'round_trips', 'elapsed')
+
+    def __init__(self):
+        self.ops = []
+        self.unchanged = 0
+        self.round_trips = 0
+        self.elapsed = 0.0
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __iter__(self):
+        return iter(self.ops)
+
+    @property
+    def deletes(self):
+        return [op.slot for op in self.ops if op.action == 'delete']
+
+    @property
+    def uploads(self):
+        return [op.slot for op in self.ops if op.action == 'set']
+
+    def __repr__(self):
+        return "SyncPlan(delete=%d, set=%d, unchanged=%d, round_trips=%d)" % (
+            len(self.deletes), len(self.uploads), self.unchanged, self.round_trips)
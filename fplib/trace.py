@@ -0,0 +1,188 @@
+import struct
+import time
+from collections import namedtuple
+
+MAGIC = b'FPTR\x01'
+_RECORD = struct.Struct('<BII')  # direction, microseconds since the start, length
+
+WRITE = 0x57  # 'W', host to sensor
+READ = 0x52  # 'R', sensor to host
+
+TraceRecord = namedtuple('TraceRecord', 'direction time data')
+
+
+def read_trace(path):
+    '''Yields the TraceRecords of a trace file, `time` in seconds since the start.'''
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a trace file." % path)
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            direction, usec, length = _RECORD.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                return  # cut short by a crash
+            yield TraceRecord(direction, usec / 1e6, data)
+
+
+class RecordingSerial():
+    '''
+    * Wraps the serial port of a `Fingerprint` and logs every write and every chunk read,
+      with a monotonic timestamp, to a binary trace file:
+          fp.ser = RecordingSerial(fp.ser, "site-a.fptr")
+    * Everything else is passed through to the wrapped port, setting attributes too
+      (fp.ser.baudrate = 9600 switches the real port).
+    '''
+
+    _OWN = frozenset(('ser', 'path', '_file', '_start'))
+
+    def __init__(self, ser, path):
+        self.ser = ser
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._start = time.monotonic()
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+    def __setattr__(self, name, value):
+        if name in RecordingSerial._OWN:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.ser, name, value)
+
+    def _record(self, direction, data):
+        if not data:
+            return
+        usec = int((time.monotonic() - self._start) * 1e6)
+        self._file.write(_RECORD.pack(direction, usec, len(data)))
+        self._file.write(data)
+
+    def write(self, data):
+        n = self.ser.write(data)
+        self._record(WRITE, memoryview(data)[:n] if n is not None else data)
+        return n
+
+    def read(self, size=1):
+        data = self.ser.read(size)
+        self._record(READ, data)
+        return data
+
+    def readinto(self, buf):
+        n = self.ser.readinto(buf) or 0
+        self._record(READ, memoryview(buf)[:n])
+        return n
+
+    def close(self):
+        self.ser.close()
+        if not self._file.closed:
+            self._file.close()
+
+
+class ReplaySerial():
+    '''
+    * Serial port stand-in that plays the sensor side of a trace back to a `Fingerprint`:
+          fp.ser = ReplaySerial("site-a.fptr", speed=10)
+    * The bytes the sensor sent after a write become readable with the same delay as in
+      the trace, divided by `speed` (None: right away). What the host writes is not
+      checked, every write just moves on to the next write of the trace.
+    '''
+
+    def __init__(self, path, speed=1.0, timeout=1, baudrate=115200):
+        self.path = path
+        self.speed = speed
+        self.timeout = timeout
+        self.baudrate = baudrate
+        self.port = path
+        self._records = list(read_trace(path))
+        self._next = 0  # next record to play
+        self._anchor = (time.monotonic(), 0.0)  # wall clock and trace time of the last write
+        self._buffer = bytearray()
+        self._open = True
+
+    def _due(self, record):
+        # Wall clock time a read record of the trace becomes readable.
+        if not self.speed:
+            return 0.0
+        wall, traced = self._anchor
+        return wall + (record.time - traced) / self.speed
+
+    def _release(self):
+        # Moves the read records that are due into the buffer, returns the time the next
+        # one is due (None if the next record is a write or the trace is over).
+        now = time.monotonic()
+        while self._next < len(self._records):
+            record = self._records[self._next]
+            if record.direction != READ:
+                return None
+            due = self._due(record)
+            if due > now:
+                return due
+            self._buffer += record.data
+            self._next += 1
+        return None
+
+    @property
+    def in_waiting(self):
+        self._release()
+        return len(self._buffer)
+
+    def inWaiting(self):
+        return self.in_waiting
+
+    def write(self, data):
+        # skip what the sensor had not sent yet when the host wrote, then follow the trace
+        while self._next < len(self._records):
+            record = self._records[self._next]
+            self._next += 1
+            if record.direction == WRITE:
+                self._anchor = (time.monotonic(), record.time)
+                break
+        return len(data)
+
+    def _wait(self, size, deadline):
+        while len(self._buffer) < size:
+            due = self._release()
+            if len(self._buffer) >= size:
+                break
+            now = time.monotonic()
+            if due is None or (deadline is not None and due > deadline):
+                if deadline is not None and deadline > now:
+                    time.sleep(deadline - now)
+                return
+            time.sleep(max(0.0, due - now))
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        self._wait(size, deadline)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def reset_input_buffer(self):
+        self._buffer = bytearray()
+
+    def readable(self):
+        return self._open
+
+    def writable(self):
+        return self._open
+
+    def isOpen(self):
+        return self._open
+
+    is_open = property(isOpen)
+
+    def open(self):
+        self._open = True
+
+    def close(self):
+        self._open = False
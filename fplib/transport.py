@@ -0,0 +1,268 @@
+'''
+Byte transports the protocol runs over. A transport is anything with the part of the
+pyserial API the library uses:
+
+    write(data) -> int, read(size) -> bytes, readinto(buf) -> int, in_waiting,
+    timeout (seconds, None blocks), baudrate, open(), close(), isOpen(), readable(),
+    writable(), reset_input_buffer()
+
+read(size) / readinto(buf) block until they have `size` / len(buf) bytes or `timeout`
+passed. A pyserial `Serial` is used as it is; TcpTransport, LoopbackTransport and
+UartTransport adapt a TCP connection, an in-process pipe and a MicroPython UART.
+'''
+import time
+
+try:
+    import socket
+except ImportError:  # MicroPython board without network
+    socket = None
+
+
+def open_transport(port, baudrate, timeout=1, exclusive=False):
+    '''
+        Opens `port`: "tcp://host:port" (or "socket://host:port") connects to a remote serial
+        server such as ser2net, anything else is opened with pyserial.
+        exclusive: lock a local port (POSIX) so no other process can open it meanwhile.
+    '''
+    if isinstance(port, str) and port.startswith(("tcp://", "socket://")):
+        host, _, number = port.split("://", 1)[1].rpartition(":")
+        return TcpTransport(host, int(number), timeout, baudrate)
+    import serial
+    return serial.Serial(port, baudrate=baudrate, timeout=timeout, exclusive=exclusive or None)
+
+
+class TcpTransport():
+    '''
+    * A sensor behind a TCP serial server (ser2net in raw mode, a serial-to-ethernet
+      adapter, ...). The baud rate of the line is set on the server; `baudrate` is only
+      recorded.
+    '''
+
+    def __init__(self, host, port, timeout=1, baudrate=None):
+        self.host = host
+        self.port = port
+        self.baudrate = baudrate
+        self._timeout = timeout
+        self.sock = None
+        self.open()
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self._timeout = timeout
+        if self.sock:
+            self.sock.settimeout(timeout)
+
+    def open(self):
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port), self._timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.sock.settimeout(self._timeout)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def isOpen(self):
+        return self.sock is not None
+
+    is_open = property(isOpen)
+
+    def readable(self):
+        return self.sock is not None
+
+    writable = readable
+
+    @property
+    def in_waiting(self):
+        # a socket with a timeout waits even with MSG_DONTWAIT, peek non-blocking
+        self.sock.settimeout(0)
+        try:
+            return len(self.sock.recv(1 << 16, socket.MSG_PEEK))
+        except (BlockingIOError, InterruptedError):
+            return 0
+        finally:
+            self.sock.settimeout(self._timeout)
+
+    def write(self, data):
+        self.sock.sendall(data)
+        return len(data)
+
+    def readinto(self, buf):
+        view = memoryview(buf)
+        n = 0
+        deadline = None if self._timeout is None else time.monotonic() + self._timeout
+        try:
+            while n < len(view):
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 and self._timeout:
+                        break
+                    self.sock.settimeout(max(remaining, 0))
+                got = self.sock.recv_into(view[n:])
+                if not got:
+                    break  # closed by the server
+                n += got
+        except (socket.timeout, BlockingIOError, InterruptedError):
+            pass
+        finally:
+            self.sock.settimeout(self._timeout)
+        return n
+
+    def read(self, size=1):
+        buf = bytearray(size)
+        n = self.readinto(buf)
+        return bytes(buf[:n])
+
+    def reset_input_buffer(self):
+        while self.in_waiting:
+            self.sock.recv(1 << 16)
+
+
+class LoopbackTransport():
+    '''
+    * One end of an in-process byte pipe, what is written to one end of a pair() is read
+      from the other. Lets the library talk to the emulator without a pty, on any OS.
+    '''
+
+    def __init__(self, timeout=1, baudrate=9600):
+        import threading
+        self.timeout = timeout
+        self.baudrate = baudrate
+        self.peer = None
+        self._rx = bytearray()
+        self._cond = threading.Condition()
+        self._open = True
+
+    @classmethod
+    def pair(cls, timeout=1, baudrate=9600):
+        a = cls(timeout, baudrate)
+        b = cls(timeout, baudrate)
+        a.peer, b.peer = b, a
+        return a, b
+
+    def open(self):
+        self._open = True
+
+    def close(self):
+        self._open = False
+
+    def isOpen(self):
+        return self._open
+
+    is_open = property(isOpen)
+
+    def readable(self):
+        return self._open
+
+    writable = readable
+
+    @property
+    def in_waiting(self):
+        return len(self._rx)
+
+    def write(self, data):
+        peer = self.peer
+        with peer._cond:
+            peer._rx += data
+            peer._cond.notify_all()
+        return len(data)
+
+    def readinto(self, buf):
+        size = len(buf)
+        with self._cond:
+            if len(self._rx) < size and self.timeout != 0:
+                deadline = None if self.timeout is None else time.monotonic() + self.timeout
+                while len(self._rx) < size:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            n = min(size, len(self._rx))
+            buf[:n] = self._rx[:n]
+            del self._rx[:n]
+        return n
+
+    def read(self, size=1):
+        buf = bytearray(size)
+        n = self.readinto(buf)
+        return bytes(buf[:n])
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._rx = bytearray()
+
+
+class UartTransport():
+    '''
+    * machine.UART of MicroPython. The UART's own timeout (set when it is created, in ms)
+      applies to reads, `timeout` is what the frame reader uses for its deadlines.
+    * settings: the other UART.init() arguments (tx / rx pins, the UART timeout, ...),
+      given again with the baud rate whenever the UART is set up anew: close() deinit()s
+      it and open() initialises it again.
+    '''
+
+    def __init__(self, uart, timeout=1, baudrate=None, settings=None):
+        self.uart = uart
+        self.timeout = timeout
+        self._baudrate = baudrate
+        self.settings = dict(settings or {})
+        self._open = True
+
+    @property
+    def baudrate(self):
+        return self._baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate):
+        self._baudrate = baudrate
+        if self._open:
+            self._init()
+
+    def _init(self):
+        # init() without the pins falls back to the default pins on some ports
+        if self._baudrate is None:
+            self.uart.init(**self.settings)
+        else:
+            self.uart.init(baudrate=self._baudrate, **self.settings)
+
+    def open(self):
+        if not self._open:
+            self._init()
+            self._open = True
+
+    def close(self):
+        if self._open:
+            self.uart.deinit()
+            self._open = False
+
+    def isOpen(self):
+        return self._open
+
+    is_open = property(isOpen)
+
+    def readable(self):
+        return self._open
+
+    writable = readable
+
+    @property
+    def in_waiting(self):
+        return self.uart.any()
+
+    def write(self, data):
+        return self.uart.write(data)
+
+    def readinto(self, buf):
+        return self.uart.readinto(buf) or 0
+
+    def read(self, size=1):
+        return self.uart.read(size) or b''
+
+    def reset_input_buffer(self):
+        while self.uart.any():
+            self.uart.read()
@@ -65,7 +65,7 @@ if task == 6:
     
 # 7. settemplate - set a template data to device
 if task == 7:
-    DATA = [] # a 502 length python list, that we get after running "task 3"
+    DATA = [] # a 498 length python list, that we get after running "task 3"
     fp.delete(idx=0)
     status = fp.setTemplate(idx=0, data=DATA)
     print("\n |__ set template status :", status)
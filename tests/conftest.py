@@ -0,0 +1,92 @@
+import pytest
+
+from fplib.emulator import FingerprintEmulator
+from fplib.fpmain import Fingerprint
+
+# No settle delays and short timeouts: the emulator answers as soon as it has the command.
+FP_OPTIONS = {
+    'timeout': 0.5,
+    'wait_ack': True,
+    'response_timeout': 1,
+    'settle': {'Connect': 0, 'OpenSerial': 0},
+}
+
+
+@pytest.fixture
+def emulator():
+    '''emulator(**options): an emulated sensor without processing delays or byte pacing.'''
+    made = []
+
+    def make(baud=115200, **options):
+        options.setdefault('delays', {})
+        options.setdefault('pace', False)
+        options.setdefault('seed', 1)
+        emu = FingerprintEmulator(baud=baud, **options)
+        made.append(emu)
+        return emu
+
+    yield make
+    for emu in made:
+        emu.stop()
+
+
+@pytest.fixture
+def emu(emulator):
+    return emulator()
+
+
+@pytest.fixture
+def fp_options():
+    '''Fingerprint options of the tests, for the Fingerprints they create themselves.'''
+    return dict(FP_OPTIONS, settle=dict(FP_OPTIONS['settle']))
+
+
+@pytest.fixture
+def make_fp(fp_options):
+    '''make_fp(emu, **options): a Fingerprint on the in-process loopback of `emu`, not connected.'''
+    made = []
+
+    def make(emu, baud=115200, **options):
+        transport = emu.loopback()  # sets emu.port
+        fp = Fingerprint(emu.port, baud, transport=transport, **dict(fp_options, **options))
+        made.append(fp)
+        return fp
+
+    yield make
+    for fp in made:
+        fp.close_serial()
+
+
+@pytest.fixture
+def fp(emu, make_fp):
+    '''Fingerprint connected and opened over the emulator's loopback transport.'''
+    fp = make_fp(emu)
+    assert fp.connect()
+    assert fp.open()
+    return fp
+
+
+@pytest.fixture
+def finger(emu, monkeypatch):
+    '''
+        finger(template) places a finger that lifts after every accepted or refused
+        Enroll1 / Enroll2 and is put back once IsPressFinger has seen it lifted, as a
+        user following the prompts would.
+    '''
+    placed = {}
+    dispatch = emu._dispatch
+
+    def lifting(cmd, param):
+        name = emu.COMMENDS.get(cmd)
+        dispatch(cmd, param)
+        if name in ('Enroll1', 'Enroll2'):
+            emu.release_finger()
+        elif name == 'IsPressFinger' and emu.finger is None and placed:
+            emu.press_finger(placed['template'])
+
+    def place(template):
+        placed['template'] = template
+        emu.press_finger(template)
+
+    monkeypatch.setattr(emu, '_dispatch', lifting)
+    return place
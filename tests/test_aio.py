@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from fplib.aio import AsyncFingerprint, SerialStream
+from fplib.framing import ACK, RESPONSE_SYNC, build_packet, parse_response, verify_packet
+
+
+@pytest.fixture
+def port(emu):
+    '''The emulator served on a pty, SerialStream needs a file descriptor.'''
+    return emu.start()
+
+
+def run(port, body, **options):
+    async def main():
+        async with AsyncFingerprint(port, 115200, response_timeout=1, **options) as fp:
+            assert fp.is_connected()
+            return await body(fp)
+    return asyncio.run(main())
+
+
+def test_commands(port, emu):
+    tpl = emu.make_template(1)
+    emu.db[2] = tpl
+
+    async def body(fp):
+        assert await fp.get_enrolled_cnt() == 1
+        assert await fp.check_enrolled(2)
+        assert await fp.identifyTemplate(tpl) == 2
+        assert await fp.setTemplate(5, emu.make_template(2))
+        assert await fp.verifyTemplate(2, tpl)
+        assert await fp.delete(2)
+        return await fp.get_enrolled_cnt()
+
+    assert run(port, body) == 1
+    assert list(emu.db) == [5]
+
+
+def test_false_sync_word_is_skipped(port):
+    packet = build_packet(ACK, 7)
+
+    async def main():
+        stream = SerialStream(port, 115200)
+        try:
+            stream.reader.feed(RESPONSE_SYNC + b'\x00\x00\x00' + packet)
+            frame = await stream.read_frame(RESPONSE_SYNC, 12, 0.5, verify_packet)
+            return frame, stream.reader.resyncs
+        finally:
+            stream.close()
+
+    frame, resyncs = asyncio.run(main())
+    assert bytes(frame) == packet
+    assert parse_response(frame).param == 7
+    assert resyncs >= 1
+
+
+def test_silent_sensor_times_out(port, emu):
+    async def body(fp):
+        emu.fail_next('drop')
+        with pytest.raises(asyncio.TimeoutError):
+            await fp.get_enrolled_cnt()
+        return await fp.get_enrolled_cnt()
+
+    assert run(port, body) == 0
+
+
+def test_enroll(port, emu, finger):
+    emu.db[0] = emu.make_template(0)
+    tpl = emu.make_template(4)
+    finger(tpl)
+
+    async def body(fp):
+        return await fp.enroll(finger_timeout=2, sleep=0.05)
+
+    assert run(port, body) == (1, None, None)
+    assert emu.db[1] == tpl
+
+
+def test_enroll_stops_at_a_duplicate(port, emu, finger):
+    tpl = emu.make_template(5)
+    emu.db[0] = tpl
+    finger(tpl)
+
+    async def body(fp):
+        return await fp.enroll(3, try_cnt=5, finger_timeout=2, sleep=0.05), fp.last_duplicate
+
+    assert run(port, body) == (-1, 0)
+    assert emu.commands['Enroll1'] == 1
+    assert 3 not in emu.db
+
+
+@pytest.mark.parametrize('restarts', [1, 0])
+def test_enroll_starts_over_after_enroll_failed(port, emu, finger, monkeypatch, restarts):
+    tpl, other = emu.make_template(6), emu.make_template(7)
+    finger(tpl)
+    dispatch = emu._dispatch
+
+    def swapping(cmd, param):
+        # the second capture is another finger, the sensor drops the enrollment
+        name = emu.COMMENDS.get(cmd)
+        dispatch(cmd, param)
+        if name in ('Enroll1', 'Enroll2') and emu.commands[name] == 1:
+            finger(other if name == 'Enroll1' else tpl)
+            emu.release_finger()
+
+    monkeypatch.setattr(emu, '_dispatch', swapping)
+
+    async def body(fp):
+        return await fp.enroll(2, finger_timeout=2, sleep=0.05, restarts=restarts)
+
+    if restarts:
+        assert run(port, body) == (2, None, None)
+        assert emu.db[2] == tpl
+    else:
+        assert run(port, body) == -1
+        assert 2 not in emu.db
+    assert emu.commands['EnrollStart'] == 1 + restarts
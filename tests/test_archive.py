@@ -0,0 +1,66 @@
+import pytest
+
+from fplib.archive import TemplateArchive
+from fplib.cache import TemplateCache
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "sensor.fpdb")
+
+
+def test_export_and_import(fp, emu, path):
+    emu.db = {0: emu.make_template(0), 4: emu.make_template(4), 9: emu.make_template(9)}
+    progress = list(fp.export_database(path))
+    assert [(p.slot, p.done, p.total) for p in progress] == [(0, 1, 3), (4, 2, 3), (9, 3, 3)]
+    assert progress[-1].nbytes == 3 * 498
+    assert emu.commands['GetTemplate'] == 10  # the scan stops at the last enrolled slot
+
+    saved = dict(emu.db)
+    emu.db = {4: emu.make_template(40)}
+    assert [p.slot for p in fp.import_database(path)] == [0, 9]
+    assert emu.db[4] == emu.make_template(40)
+    assert [p.slot for p in fp.import_database(path, overwrite=True)] == [0, 4, 9]
+    assert emu.db == saved
+
+
+def test_interrupted_export_resumes(fp, emu, path):
+    emu.db = {1: emu.make_template(1), 3: emu.make_template(3)}
+    for progress in fp.export_database(path):
+        break  # interrupted after the first template
+    assert progress.slot == 1
+    downloads = emu.commands['GetTemplate']
+
+    assert [p.slot for p in fp.export_database(path)] == [3]
+    assert emu.commands['GetTemplate'] == downloads + 3  # slots 0, 2 and 3, not 1 again
+    assert emu.commands['CheckEnrolled'] == 1
+    with TemplateArchive(path) as archive:
+        assert archive.slots() == [1, 3]
+        assert archive.read(3) == emu.db[3]
+
+
+def test_resume_counts_only_slots_still_on_the_sensor(fp, emu, path):
+    with TemplateArchive(path) as archive:
+        archive.append(1, emu.make_template(1))  # deleted from the sensor since
+    emu.db = {0: emu.make_template(0), 2: emu.make_template(2)}
+    assert [p.slot for p in fp.export_database(path)] == [0, 2]
+    with TemplateArchive(path) as archive:
+        assert archive.slots() == [0, 1, 2]
+
+
+def test_export_reads_the_sensor_not_the_cache(emu, make_fp, path):
+    fp = make_fp(emu, cache=TemplateCache())
+    assert fp.connect()
+    emu.db[0] = emu.make_template(0)
+    fp.cache.put(fp.sensor_id, 0, emu.make_template(99))  # stale
+    list(fp.export_database(path))
+    with TemplateArchive(path) as archive:
+        assert archive.read(0) == emu.db[0]
+
+
+def test_failed_download_stops_the_export(fp, emu, path):
+    fp.retries = 0
+    emu.db = {0: emu.make_template(0)}
+    emu.fail_next('corrupt', data=True)
+    with pytest.raises(IOError):
+        list(fp.export_database(path))
@@ -0,0 +1,84 @@
+from fplib.cache import TemplateCache
+
+
+def count_writes(transport):
+    '''List that gets the size of every write to `transport`.'''
+    writes = []
+    write = transport.write
+
+    def counting(data):
+        writes.append(len(data))
+        return write(data)
+
+    transport.write = counting
+    return writes
+
+
+def test_commands_go_out_in_one_write(fp, emu):
+    emu.db[2] = emu.make_template(2)
+    writes = count_writes(fp.ser)
+    with fp.batch() as b:
+        b.set_led(True)
+        b.get_enrolled_cnt()
+        b.check_enrolled(2)
+        b.check_enrolled(3)
+        b.getTemplate(2)
+        b.is_finger_pressed()
+        b.set_led(False)
+    assert writes == [7 * 12]
+    led, count, enrolled, free, (data, ok), pressed, off = b.results
+    assert (led, count, enrolled, free, ok, pressed, off) == (True, 1, True, False, True, False, True)
+    assert bytes(data) == emu.db[2]
+    assert len(b) == 0
+
+
+def test_uploads_run_on_their_own(fp, emu):
+    tpl = emu.make_template(4)
+    writes = count_writes(fp.ser)
+    results = fp.batch().open().setTemplate(4, tpl).identifyTemplate(tpl).delete(4).run()
+    assert results == [True, True, 4, True]
+    assert writes[:2] == [12, 12]  # Open, then SetTemplate on its own before its data
+    assert writes[-1] == 12  # DeleteID
+    assert 4 not in emu.db
+
+
+def test_led_settle_time_ends_a_write(emu, make_fp):
+    fp = make_fp(emu, settle={'CmosLed': 0.01})
+    assert fp.connect()
+    writes = count_writes(fp.ser)
+    with fp.batch() as b:
+        b.set_led(True)
+        b.is_finger_pressed()
+        b.set_led(False)
+        b.open()
+    assert writes == [12, 3 * 12]
+
+
+def test_missing_response_ends_the_batch(fp, emu, monkeypatch):
+    dispatch = emu._dispatch
+
+    def silent(cmd, param):
+        # the sensor stops answering after the first command
+        if not emu.commands:
+            dispatch(cmd, param)
+        else:
+            emu.commands['ignored'] = emu.commands.get('ignored', 0) + 1
+
+    emu.commands.clear()
+    monkeypatch.setattr(emu, '_dispatch', silent)
+    fp.response_timeout = 0.2
+    results = fp.batch().get_enrolled_cnt().check_enrolled(0).open().run()
+    assert results == [0, None, None]
+    assert emu.commands['ignored'] == 2
+    monkeypatch.setattr(emu, '_dispatch', dispatch)
+    assert fp.get_enrolled_cnt() == 0
+
+
+def test_cache_follows_the_batch(emu, make_fp):
+    fp = make_fp(emu, cache=TemplateCache())
+    assert fp.connect()
+    emu.db[1] = emu.make_template(1)
+    fp.batch().getTemplate(1).run()
+    assert fp.cache.get(fp.sensor_id, 1) == emu.db[1]
+    fp.batch().delete(1).run()
+    assert fp.cache.get(fp.sensor_id, 1) is None
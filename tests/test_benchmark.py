@@ -0,0 +1,48 @@
+from fplib.benchmark import Benchmark, format_table, percentile, succeeded
+from fplib.enroll import EnrollResult
+
+
+def test_percentile():
+    samples = [4, 1, 3, 2]
+    assert percentile(samples, 50) == 2
+    assert percentile(samples, 99) == 4
+    assert percentile([], 50) is None
+
+
+def test_succeeded():
+    assert succeeded(True)
+    assert succeeded(0)  # identify: the ID
+    assert succeeded((b'data', True))
+    assert succeeded(EnrollResult(True, 1, None, None))
+    for failed in (None, False, -1, (None, False), EnrollResult(False, 1, None, 0)):
+        assert not succeeded(failed)
+
+
+def test_failed_calls_are_left_out_of_the_figures(fp, emu):
+    bench = Benchmark(115200, iterations=4)
+    bench.emu, bench.fp = emu, fp
+    calls = iter(range(4))
+
+    def setup():
+        if next(calls) % 2:
+            emu.fail_next('nack')
+
+    result = bench._measure("open", setup, fp.open)
+    assert result["failures"] == 2
+    assert result["commands_per_s"] > 0
+    assert result["bytes_per_call"] == 24  # the Open packet and its response
+
+    emu.fail_next('nack')
+    bench.iterations = 1
+    result = bench._measure("open", None, fp.open)
+    assert result["failures"] == 1
+    assert result["p50_ms"] is None
+    assert "-" in format_table([result])
+
+
+def test_benchmark_runs_every_command():
+    results = Benchmark(115200, iterations=1, delays={}, wait_ack=True).run(
+        ["open", "identify", "setTemplate", "enroll"])
+    assert [r["command"] for r in results] == ["open", "identify", "setTemplate", "enroll"]
+    assert all(r["failures"] == 0 for r in results)
+    assert "identify" in format_table(results)
@@ -0,0 +1,57 @@
+import pytest
+
+from fplib.cache import TemplateCache
+
+
+@pytest.fixture
+def cached(emu, make_fp):
+    fp = make_fp(emu, cache=TemplateCache())
+    assert fp.connect()
+    return fp
+
+
+def test_repeat_reads_come_from_the_cache(cached, emu):
+    tpl = emu.make_template(1)
+    emu.db[1] = tpl
+    for _ in range(3):
+        data, ok = cached.getTemplate(1)
+        assert ok and bytes(data) == tpl
+    assert emu.commands['GetTemplate'] == 1
+    assert (cached.cache.hits, cached.cache.misses) == (2, 1)
+    assert cached.sensor_id == emu.serial_number.hex()
+
+
+def test_writes_invalidate_the_slot(cached, emu, finger):
+    emu.db[1] = emu.make_template(1)
+    cached.getTemplate(1)
+    new = emu.make_template(2)
+    assert cached.setTemplate(1, new)
+    assert bytes(cached.getTemplate(1)[0]) == new  # stored by setTemplate, no download
+    assert emu.commands['GetTemplate'] == 1
+
+    assert cached.delete(1)
+    assert cached.getTemplate(1) == (None, False)
+    assert emu.commands['GetTemplate'] == 2
+
+    emu.db[1] = emu.make_template(1)
+    cached.getTemplate(1)
+    finger(emu.make_template(3))
+    emu.db.pop(1)
+    assert cached.enroll(1, try_cnt=2)[0] == 1
+    assert bytes(cached.getTemplate(1)[0]) == emu.make_template(3)
+
+
+def test_lru_eviction_and_persistence(tmp_path):
+    path = str(tmp_path / "cache.fptc")
+    cache = TemplateCache(capacity=2, path=path)
+    cache.put("a", 1, b'one')
+    cache.put("a", 2, b'two')
+    cache.get("a", 1)
+    cache.put("b", 1, b'three')  # evicts ("a", 2), the least recently used
+    assert ("a", 2) not in cache
+    cache.save()
+    again = TemplateCache(path=path)
+    assert again.get("a", 1) == b'one'
+    assert again.get("b", 1) == b'three'
+    again.invalidate("a")
+    assert len(again) == 1
@@ -0,0 +1,61 @@
+import pytest
+
+from fplib.profile import LinkProfile
+
+
+@pytest.fixture
+def profile(tmp_path):
+    return LinkProfile(str(tmp_path / "links.json"))
+
+
+def writes_of(transport):
+    '''Counts what is written to `transport`, wrong baud rates included.'''
+    written = []
+    write = transport.write
+
+    def counting(data):
+        written.append((transport.baudrate, bytes(data)))
+        return write(data)
+
+    transport.write = counting
+    return written
+
+
+def test_connect_finds_and_raises_the_baud_rate(emulator, make_fp, profile):
+    emu = emulator(baud=9600)
+    fp = make_fp(emu, profile=profile)
+    assert fp.connect()
+    assert (fp.baud, emu.baud) == (115200, 115200)
+    assert fp.get_enrolled_cnt() == 0
+    assert LinkProfile(profile.path).get("loop") == 115200
+
+
+def test_connect_tries_the_cached_rate_first(emulator, make_fp, profile):
+    profile.put("loop", 57600)
+    emu = emulator(baud=57600)
+    fp = make_fp(emu, baud=57600, profile=profile)
+    written = writes_of(fp.transport)
+    assert fp.connect()
+    assert [baud for baud, _ in written] == [57600]  # one Open, no guessing
+    assert emu.commands == {'Open': 1}
+
+
+def test_stale_profile_costs_one_guess(emulator, make_fp, profile):
+    profile.put("loop", 9600)
+    emu = emulator(baud=115200)
+    fp = make_fp(emu, profile=profile)
+    written = writes_of(fp.transport)
+    assert fp.connect()
+    assert [baud for baud, _ in written] == [9600, 115200]
+    assert profile.get("loop") == 115200
+
+
+def test_silent_sensor_is_forgotten(emulator, make_fp, profile):
+    profile.put("loop", 115200)
+    emu = emulator()
+    fp = make_fp(emu, profile=profile, timeout=0.05)
+    emu.strict_baud = True
+    emu.baud = 1200  # answers at no supported rate
+    assert not fp.connect()
+    assert profile.get("loop") is None
+    assert not fp.is_connected()
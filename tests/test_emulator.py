@@ -0,0 +1,57 @@
+from fplib.emulator import FingerprintEmulator
+from fplib.fpmain import Fingerprint
+
+
+def test_pty_port(fp_options):
+    with FingerprintEmulator(baud=115200, delays={}, pace=False) as emu:
+        fp = Fingerprint(emu.port, 115200, **fp_options)
+        try:
+            assert fp.init()
+            assert fp.open()
+            emu.db[0] = emu.make_template(0)
+            assert fp.get_enrolled_cnt() == 1
+        finally:
+            fp.close_serial()
+
+
+def test_commands(fp, emu):
+    tpl = emu.make_template(1)
+    emu.db[2] = tpl
+    assert fp.get_enrolled_cnt() == 1
+    assert fp.check_enrolled(2)
+    assert not fp.check_enrolled(3)
+    emu.press_finger(tpl)
+    assert fp.is_finger_pressed()
+    assert fp.identify() == 2
+    assert fp.identifyTemplate(tpl) == 2
+    assert fp.verifyTemplate(2, tpl)
+    assert fp.delete(2)
+    assert fp.get_enrolled_cnt() == 0
+    assert emu.commands['GetEnrollCount'] == 2
+
+
+def test_get_image(fp, emu):
+    emu.press_finger(emu.make_template(7))
+    assert fp.capture_finger(best=True)
+    data, ok = fp.GetImage()
+    assert ok
+    assert len(data) == Fingerprint.DATA_SIZES['GetImage']
+
+
+def test_injected_faults(fp, emu):
+    fp.response_timeout = 0.2
+    emu.fail_next('drop')
+    assert fp.get_enrolled_cnt() == -1
+    assert fp.last_response.ack is None
+    emu.fail_next('nack')
+    assert fp.get_enrolled_cnt() == -1
+    assert fp.last_response.ack is False
+    assert fp.get_enrolled_cnt() == 0
+
+
+def test_wrong_baud_rate_is_not_answered(emu, make_fp):
+    fp = make_fp(emu)
+    fp.ser = fp._open_transport(9600)
+    assert fp.open() is None
+    fp._set_link_baud(115200)
+    assert fp.open()
@@ -0,0 +1,111 @@
+from fplib.enroll import RetryPolicy
+from fplib.errors import NackError
+
+POLICY = RetryPolicy(attempts=2, restarts=0, finger_timeout=2)
+
+
+def run(fp, idx=None, check_duplicate=True, policy=POLICY):
+    events = []
+    result = fp.enrollment(idx, check_duplicate, policy, on_event=events.append).run()
+    return result, [event.kind for event in events]
+
+
+def test_enroll_takes_the_first_free_slot(fp, emu, finger):
+    for idx in (0, 1, 3):
+        emu.db[idx] = emu.make_template(idx)
+    tpl = emu.make_template(10)
+    finger(tpl)
+    result, kinds = run(fp)
+    assert result.ok
+    assert result.idx == 4
+    assert emu.db[4] == tpl
+    assert kinds.count('stage_done') == 3
+    assert kinds.count('finger_up') == 2
+    assert kinds[-1] == 'done'
+
+
+def test_enroll_finds_a_duplicate(fp, emu, finger):
+    tpl = emu.make_template(11)
+    emu.db[0] = tpl
+    finger(tpl)
+    result, kinds = run(fp, 5)
+    assert not result.ok
+    assert result.duplicate == 0
+    assert 5 not in emu.db
+    assert kinds[-1] == 'duplicate'
+
+
+def test_enroll_saved_by_enroll3(fp, emu, finger):
+    tpl = emu.make_template(12)
+    finger(tpl)
+    result, _ = run(fp, 7, check_duplicate=False)
+    assert result.ok
+    assert emu.db[7] == tpl
+    assert 'SetTemplate' not in emu.commands
+    assert 'IdentifyTemplate1_N' not in emu.commands
+
+
+def test_enroll_template_only(fp, emu, finger):
+    tpl = emu.make_template(13)
+    finger(tpl)
+    result, _ = run(fp, -1)
+    assert result.ok
+    assert bytes(result.template) == tpl
+    assert not emu.db
+
+
+def test_enroll_retries_a_refused_stage(fp, emu, finger, monkeypatch):
+    dispatch = emu._dispatch
+    refused = []
+
+    def refusing(cmd, param):
+        if emu.COMMENDS.get(cmd) == 'Enroll2' and not refused:
+            refused.append(cmd)
+            emu.fail_next('nack', NackError.BAD_FINGER)
+        dispatch(cmd, param)
+
+    monkeypatch.setattr(emu, '_dispatch', refusing)
+    finger(emu.make_template(14))
+    events = []
+    result = fp.enrollment(8, policy=POLICY, on_event=events.append).run()
+    assert result.ok
+    assert ('retry', 2, NackError.BAD_FINGER) in [tuple(event) for event in events]
+    assert emu.commands['Enroll2'] == 2
+
+
+def test_enroll_fails_without_a_finger(fp, emu):
+    policy = RetryPolicy(attempts=1, restarts=0, finger_timeout=0.2)
+    result, kinds = run(fp, 9, policy=policy)
+    assert not result.ok
+    assert kinds == ['prompt', 'failed']
+    assert not emu.led
+
+
+def test_enroll_wrapper(fp, emu, finger):
+    tpl = emu.make_template(15)
+    finger(tpl)
+    assert fp.enroll(2, try_cnt=2) == (2, None, None)
+    assert emu.db[2] == tpl
+
+
+def test_enroll_starts_over_after_enroll_failed(fp, emu, finger, monkeypatch):
+    tpl, other = emu.make_template(16), emu.make_template(17)
+    finger(tpl)
+    dispatch = emu._dispatch
+
+    def swapping(cmd, param):
+        # the second capture is another finger, the sensor drops the enrollment
+        name = emu.COMMENDS.get(cmd)
+        dispatch(cmd, param)
+        if name in ('Enroll1', 'Enroll2') and emu.commands[name] == 1:
+            finger(other if name == 'Enroll1' else tpl)
+            emu.release_finger()
+
+    monkeypatch.setattr(emu, '_dispatch', swapping)
+    policy = RetryPolicy(attempts=2, restarts=1, finger_timeout=2)
+    result, kinds = run(fp, 3, check_duplicate=False, policy=policy)
+    assert result.ok
+    assert emu.db[3] == tpl
+    assert emu.commands['EnrollStart'] == 2
+    assert 'retry' in kinds
+    assert kinds.count('prompt') == 5  # stages 1, 2 (refused), then 1, 2, 3 again
@@ -0,0 +1,173 @@
+import threading
+import time
+
+from fplib.buffers import BufferPool
+from fplib.errors import NackError
+from fplib.fpmain import Fingerprint
+from fplib.framing import DATA_HEADER, DEVICE_ID, data_checksum
+
+
+def test_downloads_land_in_pooled_buffers(emu, make_fp):
+    fp = make_fp(emu, pool=BufferPool())
+    assert fp.connect()
+    emu.db[1] = emu.make_template(1)
+    data, ok = fp.getTemplate(1)
+    assert ok
+    assert isinstance(data, memoryview)
+    assert bytes(data) == emu.db[1]
+    buf = data.obj
+    fp.release(data)
+    again, _ = fp.getTemplate(1)
+    assert again.obj is buf
+
+
+def test_template_that_looks_like_the_legacy_layout_is_sent_whole(fp, emu):
+    middle = bytes(range(256)) + bytes(range(238))
+    tpl = DEVICE_ID + middle + data_checksum(middle)  # 498 bytes
+    assert fp.setTemplate(1, tpl)
+    assert emu.db[1] == tpl
+    assert fp.setTemplate(2, DEVICE_ID + tpl + data_checksum(tpl), check_duplicate=False)
+    assert emu.db[2] == tpl
+
+
+def test_settle_times():
+    legacy = Fingerprint(None, 115200, settle={'CmosLed': 0.2})
+    assert legacy.settle == dict(Fingerprint.LEGACY_SETTLE, CmosLed=0.2)
+    assert Fingerprint(None, 115200, wait_ack=True).settle == Fingerprint.SETTLE
+
+
+def test_wait_ack_waits_for_the_response(emulator, make_fp):
+    emu = emulator(delays={'GetEnrollCount': 0.3})
+    fp = make_fp(emu, timeout=0.05)  # shorter than the sensor takes to answer
+    assert fp.connect()
+    start = time.monotonic()
+    assert fp.get_enrolled_cnt() == 0
+    assert 0.3 <= time.monotonic() - start < 1
+    fp.response_timeout = 0.1
+    start = time.monotonic()
+    assert fp.get_enrolled_cnt() == -1
+    assert fp.last_response.ack is None
+    assert time.monotonic() - start < 0.3
+
+
+def test_data_packet_is_read_by_its_length(emulator, make_fp):
+    emu = emulator(pace=True)  # the packet arrives in 5 ms slices, as from a real UART
+    fp = make_fp(emu, timeout=0.05)
+    assert fp.connect()
+    emu.db[1] = emu.make_template(1)
+    data, ok = fp.getTemplate(1)
+    assert ok
+    assert bytes(data) == emu.db[1]
+    assert fp.get_enrolled_cnt() == 1  # nothing of the data packet was left behind
+
+
+def test_incomplete_data_packet_is_no_data(fp, emu):
+    fp.retries = 0
+    emu.db[3] = emu.make_template(3)
+    emu.fail_next('drop', data=True)
+    assert fp.getTemplate(3) == (None, False)
+    assert emu.commands['GetTemplate'] == 1
+    assert fp.get_enrolled_cnt() == 1
+
+
+def corrupt_next_upload(transport):
+    '''Flips a bit of the next data packet payload the host writes.'''
+    write = transport.write
+    state = {'header': False}
+
+    def corrupting(data):
+        if state['header']:
+            data = bytearray(data)
+            data[0] ^= 0x01
+            transport.write = write
+        state['header'] = bytes(data[:4]) == DATA_HEADER
+        return write(data)
+
+    transport.write = corrupting
+
+
+def test_response_after_a_false_sync_word(fp, emu):
+    send = emu._send
+
+    def noisy(data):
+        emu._send = send
+        send(b'\x55\xaa\x99')
+        send(data)
+
+    emu._send = noisy
+    emu.db[0] = emu.make_template(0)
+    assert fp.get_enrolled_cnt() == 1
+
+
+def test_corrupted_response_is_no_response(fp, emu):
+    fp.response_timeout = 0.3
+    emu.fail_next('corrupt')
+    assert fp.get_enrolled_cnt() == -1
+    assert fp.last_response.ack is None
+    assert fp.get_enrolled_cnt() == 0
+
+
+def test_download_retried_after_a_corrupted_data_packet(fp, emu):
+    tpl = emu.make_template(3)
+    emu.db[3] = tpl
+    emu.fail_next('corrupt', data=True)
+    data, ok = fp.getTemplate(3)
+    assert ok
+    assert bytes(data) == tpl
+    assert emu.commands['GetTemplate'] == 2
+
+
+def test_upload_retried_after_a_comm_error(fp, emu):
+    tpl = emu.make_template(4)
+    corrupt_next_upload(fp.ser)
+    assert fp.setTemplate(4, tpl)
+    assert emu.db[4] == tpl
+    assert emu.commands['SetTemplate'] == 2
+
+
+def test_upload_fails_without_retries(fp, emu):
+    fp.retries = 0
+    corrupt_next_upload(fp.ser)
+    assert not fp.setTemplate(4, emu.make_template(4))
+    assert fp.last_error == NackError.COMM_ERR
+    assert 4 not in emu.db
+
+
+def test_last_error_of_a_refused_command(fp, emu):
+    emu.fail_next('nack', NackError.DEV_ERR)
+    assert not fp.open()
+    assert fp.last_error == NackError.DEV_ERR
+    assert fp.check_enrolled(7) is False
+    assert fp.last_error == NackError.IS_NOT_USED
+    assert fp.open()
+    assert fp.last_error is None
+
+
+def test_upload_of_a_duplicate(fp, emu):
+    tpl = emu.make_template(5)
+    emu.db[3] = tpl
+    assert not fp.setTemplate(6, tpl)
+    assert fp.last_response.duplicate == 3
+    assert fp.last_error is None
+    assert fp.setTemplate(6, tpl, check_duplicate=False)
+    assert emu.db[6] == tpl
+
+
+def test_finger_polling_backs_off(fp, emu):
+    start = time.monotonic()
+    assert fp.wait_for_finger(timeout=0.5, interval=0.02, max_interval=0.2) is False
+    assert 0.5 <= time.monotonic() - start < 1
+    assert 5 <= emu.commands['IsPressFinger'] <= 12  # 25 at a fixed 20 ms
+    assert not emu.led
+
+
+def test_wait_for_finger_and_release(fp, emu):
+    timer = threading.Timer(0.1, emu.press_finger, [emu.make_template(1)])
+    timer.start()
+    assert fp.wait_for_finger(timeout=2)
+    assert emu.led  # stays on for the capture
+    assert fp.capture_finger(best=True)
+    threading.Timer(0.1, emu.release_finger).start()
+    assert fp.wait_for_release(timeout=2)
+    assert not emu.led
+    timer.join()
@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+from fplib.errors import NackError
+from fplib.framing import (ACK, DATA_SYNC, DEVICE_ID, NACK, RESPONSE_SYNC, FrameReader,
+                           build_data, build_packet, data_checksum, parse_response, unwrap_data,
+                           verify_data, verify_packet)
+from fplib.transport import LoopbackTransport
+
+
+@pytest.fixture
+def link():
+    '''(host, sensor) ends of an in-process pipe, reads time out after 0.1 s.'''
+    return LoopbackTransport.pair(timeout=0.1)
+
+
+def test_data_round_trip():
+    payload = bytes(range(200))
+    frame = build_data(payload)
+    assert verify_data(frame)
+    frame = bytearray(frame)
+    frame[10] ^= 0x01
+    assert not verify_data(frame)
+
+
+def test_unwrap_only_the_legacy_length():
+    payload = bytes(range(200))
+    legacy = DEVICE_ID + payload + data_checksum(payload)
+    assert bytes(unwrap_data(legacy, 200)) == payload
+    assert unwrap_data(payload, 200) is None
+    assert unwrap_data(legacy, 198) is None  # looks like the layout, but not the size asked for
+    assert unwrap_data(legacy[:-1] + b'\x00', 200) is None
+
+
+def test_read_frame_into_reports_progress(link):
+    host, sensor = link
+    frame = build_data(bytes(300))
+    sensor.write(frame)
+    seen = []
+    buf = bytearray(len(frame))
+    n = FrameReader().read_frame_into(host, frame[:2], buf, 1, lambda b, n: seen.append(n))
+    assert n == len(frame)
+    assert buf == frame
+    assert seen[-1] == len(frame)
+
+
+def test_read_frame_times_out(link):
+    host, sensor = link
+    reader = FrameReader()
+    start = time.monotonic()
+    assert reader.read_frame(host, DATA_SYNC, 20, 0.2) is None
+    sensor.write(DATA_SYNC + bytes(10))  # cut short
+    assert reader.read_frame(host, DATA_SYNC, 20, 0.2) is None
+    assert time.monotonic() - start < 1.5
+
+
+def test_take_waits_for_a_split_sync_word():
+    packet = build_packet(ACK, 1)
+    reader = FrameReader()
+    reader.feed(b'\x00\x01' + packet[:1])
+    assert reader.take(RESPONSE_SYNC, 12) is None
+    assert reader.buffer == packet[:1]  # the half sync word is kept
+    reader.feed(packet[1:])
+    assert reader.take(RESPONSE_SYNC, 12) == packet
+
+
+def test_read_frame_skips_noise(link):
+    host, sensor = link
+    packet = build_packet(ACK, 2)
+    sensor.write(b'\xff\x00\x55' + packet + build_packet(ACK, 3))
+    reader = FrameReader()
+    assert reader.read_frame(host, RESPONSE_SYNC, 12, 1) == packet
+    assert reader.read_frame(host, RESPONSE_SYNC, 12, 1) == build_packet(ACK, 3)
+    assert reader.resyncs == 1
+
+
+def test_response_after_noise(fp, emu):
+    send = emu._send
+
+    def noisy(data):
+        emu._send = send
+        send(b'\x00\xff\x5a' * 50)
+        send(data)
+
+    emu._send = noisy
+    emu.db[0] = emu.make_template(0)
+    assert fp.get_enrolled_cnt() == 1
+
+
+def test_read_frame_rescans_after_a_false_sync_word(link):
+    host, sensor = link
+    packet = build_packet(ACK, 4)
+    sensor.write(b'\x55\xaa\x01\x02' + b'\x55\xaa\x00\x00' + packet)
+    reader = FrameReader()
+    assert reader.read_frame(host, RESPONSE_SYNC, 12, 1, verify_packet) == packet
+    assert reader.resyncs >= 2
+
+
+def test_false_sync_word_without_a_packet_times_out(link):
+    host, sensor = link
+    sensor.write(b'\x55\xaa' + bytes(10))
+    start = time.monotonic()
+    assert FrameReader().read_frame(host, RESPONSE_SYNC, 12, 0.2, verify_packet) is None
+    assert time.monotonic() - start < 1
+
+
+def test_packet_round_trip():
+    packet = build_packet(ACK, 0x1234)
+    assert len(packet) == 12
+    assert packet[:2] == RESPONSE_SYNC
+    assert verify_packet(packet)
+    ack, param, res, data = parse_response(packet)
+    assert (ack, param, res, data) == (True, 0x1234, ACK, None)
+    packet = bytearray(packet)
+    packet[5] ^= 0x01
+    assert not verify_packet(packet)
+
+
+def test_nack_carries_an_error_or_a_duplicate_id():
+    duplicate = parse_response(build_packet(NACK, 5))
+    assert duplicate.duplicate == 5
+    assert duplicate.error is None
+    refused = parse_response(build_packet(NACK, NackError.BAD_FINGER))
+    assert refused.duplicate is None
+    assert refused.error is NackError.BAD_FINGER
+    assert refused.error.name == 'BAD_FINGER'
+    assert parse_response(build_packet(ACK, 5)).error is None
+    assert NackError.lookup(0x2000) is None
@@ -0,0 +1,156 @@
+import base64
+import http.client
+import json
+
+import pytest
+
+from fplib.fpmain import Fingerprint
+from fplib.framing import DEVICE_ID, data_checksum
+from fplib.gateway import HIGH, LOW, Gateway, GatewayClient, flag_of, priority_of
+from fplib.metrics import Metrics
+
+
+@pytest.fixture
+def gateway(emu, fp_options):
+    gateway = Gateway({'door': emu.loopback()}, port=0, hook=Metrics(), **fp_options)
+    gateway.start()
+    yield gateway
+    gateway.stop()
+
+
+@pytest.fixture
+def client(gateway):
+    client = GatewayClient(gateway.url, timeout=10)
+    yield client
+    client.close()
+
+
+def raw(gateway, method, path, body=None):
+    '''Status and JSON reply of a request sent without the client.'''
+    host, port = gateway.server.server_address[:2]
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        conn.request(method, path, None if body is None else json.dumps(body))
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b'null')
+    finally:
+        conn.close()
+
+
+def test_priority_and_flag_parsing():
+    assert priority_of('high') == HIGH
+    assert priority_of('9') == LOW
+    assert priority_of(None, LOW) == LOW
+    with pytest.raises(ValueError):
+        priority_of('urgent')
+    assert flag_of(None) is True
+    assert flag_of('false') is False
+    assert flag_of('1') is True
+    with pytest.raises(ValueError):
+        flag_of('maybe')
+
+
+def test_sensors_and_count(client, emu):
+    emu.db[0] = emu.make_template(0)
+    assert client.count('door') == {'count': 1, 'error': None}
+    sensors = client.sensors()
+    assert [s['name'] for s in sensors] == ['door']
+    assert sensors[0]['connected']
+
+
+def test_template_routes(client, emu):
+    tpl = emu.make_template(1)
+    assert client.set_template('door', 3, tpl)['ok']
+    assert emu.db[3] == tpl
+    reply = client.get_template('door', 3)
+    assert reply['template'] == tpl
+    assert client.get_template('door', 4)['error'] == 'IS_NOT_USED'
+
+    duplicate = client.set_template('door', 4, tpl)
+    assert (duplicate['ok'], duplicate['duplicate'], duplicate['error']) == (False, 3, 'DUPLICATE')
+    assert client.set_template('door', 4, tpl, check_duplicate=False)['ok']
+
+    assert client.delete('door', 4)['ok']
+    assert client.count('door')['count'] == 1
+    assert client.delete('door')['ok']
+    assert not emu.db
+
+
+def test_check_duplicate_from_the_query_string(gateway, emu):
+    tpl = emu.make_template(2)
+    emu.db[0] = tpl
+    body = {'template': base64.b64encode(tpl).decode()}
+    status, reply = raw(gateway, "PUT", "/sensors/door/templates/1?check_duplicate=false", body)
+    assert status == 200
+    assert reply['ok']
+    status, reply = raw(gateway, "PUT", "/sensors/door/templates/2?check_duplicate=maybe", body)
+    assert status == 400
+
+
+def test_short_template_is_refused(gateway, client, emu):
+    body = {'template': base64.b64encode(b'short').decode()}
+    assert raw(gateway, "PUT", "/sensors/door/templates/1", body)[0] == 400
+    assert raw(gateway, "POST", "/sensors/door/identify_template", body)[0] == 400
+    with pytest.raises(ValueError):
+        gateway.set_template('door', 1, b'short')
+    assert 'SetTemplate' not in emu.commands
+    assert client.count('door') == {'count': 0, 'error': None}
+    tpl = emu.make_template(1)
+    legacy = DEVICE_ID + tpl + data_checksum(tpl)
+    body = {'template': base64.b64encode(legacy).decode()}
+    assert raw(gateway, "PUT", "/sensors/door/templates/1", body) == (
+        200, {'ok': True, 'duplicate': None, 'error': None})
+    assert emu.db[1] == tpl
+    body = {'template': base64.b64encode(bytes(502)).decode()}
+    assert raw(gateway, "PUT", "/sensors/door/templates/2", body)[0] == 400
+
+
+def test_library_refuses_a_short_upload(fp, emu):
+    for call in (lambda: fp.setTemplate(1, b'short'),
+                 lambda: fp.identifyTemplate(bytes(400)),
+                 lambda: fp.verifyTemplate(1, bytes(Fingerprint.UPLOAD_SIZES['SetTemplate'] + 1))):
+        with pytest.raises(ValueError):
+            call()
+    assert fp.get_enrolled_cnt() == 0
+    assert 'SetTemplate' not in emu.commands
+
+
+def test_identify(client, emu):
+    tpl = emu.make_template(3)
+    emu.db[6] = tpl
+    emu.press_finger(tpl)
+    assert client.identify('door', finger_timeout=1) == {'id': 6, 'error': None}
+    assert client.identify_template('door', tpl)['id'] == 6
+    emu.release_finger()
+    assert client.identify('door', finger_timeout=0.2) == {'id': None, 'error': 'NO_FINGER'}
+
+
+def test_identify_on_a_silent_sensor(client, emu):
+    for _ in range(3):
+        emu.fail_next('drop')
+    with pytest.raises(IOError) as error:
+        client.identify('door', finger_timeout=0.2)
+    assert "503" in str(error.value)
+
+
+def test_enroll(client, emu, finger):
+    emu.db[0] = emu.make_template(0)
+    tpl = emu.make_template(4)
+    finger(tpl)
+    reply = client.enroll('door', finger_timeout=2)
+    assert reply['ok']
+    assert reply['id'] == 1
+    assert emu.db[1] == tpl
+
+
+def test_errors(client, gateway):
+    assert raw(gateway, "GET", "/nowhere")[0] == 404
+    assert raw(gateway, "GET", "/sensors/lab")[0] == 404
+    assert raw(gateway, "GET", "/sensors/door?priority=urgent")[0] == 400
+    with pytest.raises(IOError):
+        client.count('lab')
+
+
+def test_metrics(client):
+    client.count('door')
+    assert client.metrics()
@@ -0,0 +1,62 @@
+import struct
+import zlib
+
+import numpy as np
+
+from fplib.image import IMAGE_SHAPE, RAW_IMAGE_SHAPE, RowStream, save_image
+
+
+def capture(fp, emu, seed=1):
+    emu.press_finger(emu.make_template(seed))
+    assert fp.capture_finger()
+
+
+def test_get_image(fp, emu):
+    capture(fp, emu)
+    image = fp.get_image()
+    assert image.shape == IMAGE_SHAPE
+    assert image.dtype == np.uint8
+    assert image.tobytes() == emu._image(emu.captured, emu.IMAGE_SIZE)
+    raw = fp.get_raw_image()
+    assert raw.shape == RAW_IMAGE_SHAPE
+
+
+def test_rows_are_handed_over_in_order(fp, emu):
+    capture(fp, emu)
+    seen = []
+    image = fp.get_image(on_rows=lambda rows, first: seen.append((first, rows.copy())))
+    assert seen[0][0] == 0
+    assert np.array_equal(np.concatenate([rows for _, rows in seen]), image)
+
+
+def test_row_stream_starts_over_with_a_new_frame():
+    seen = []
+    stream = RowStream((2, 3), lambda rows, first: seen.append((first, len(rows))))
+    buf = bytearray(4 + 6 + 2)
+    stream(buf, 4 + 4)
+    stream(buf, len(buf))
+    stream(bytearray(len(buf)), len(buf))  # retried after a bad data packet
+    assert seen == [(0, 1), (1, 1), (0, 2)]
+
+
+def test_save_png(tmp_path):
+    image = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    path = str(tmp_path / "finger.png")
+    save_image(path, image)
+    with open(path, "rb") as f:
+        png = f.read()
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    assert struct.unpack('>II', png[16:24]) == (4, 3)
+    idat = png.index(b"IDAT")
+    size = struct.unpack('>I', png[idat - 4:idat])[0]
+    raw = np.frombuffer(zlib.decompress(png[idat + 4:idat + 4 + size]), dtype=np.uint8)
+    assert np.array_equal(raw.reshape(3, 5)[:, 1:], image)
+    assert png.endswith(b"IEND\xaeB`\x82")
+
+
+def test_save_pgm(tmp_path):
+    image = np.full((2, 3), 7, dtype=np.uint8)
+    path = str(tmp_path / "finger.PGM")
+    save_image(path, image)
+    with open(path, "rb") as f:
+        assert f.read() == b"P5\n3 2\n255\n" + bytes([7] * 6)
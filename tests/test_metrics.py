@@ -0,0 +1,69 @@
+import json
+
+from fplib.errors import NackError
+from fplib.metrics import Metrics
+
+
+def test_counters(emu, make_fp):
+    metrics = Metrics()
+    fp = make_fp(emu, hook=metrics)
+    assert fp.connect()
+    metrics.reset()
+    emu.db[1] = emu.make_template(1)
+    assert fp.get_enrolled_cnt() == 1
+    assert fp.getTemplate(1)[1]
+    emu.fail_next('nack', NackError.DEV_ERR)
+    assert not fp.open()
+    emu.fail_next('corrupt', data=True)
+    assert fp.getTemplate(1)[1]
+
+    snap = metrics.snapshot()
+    assert snap['commands'] == {'GetEnrollCount': 1, 'GetTemplate': 3, 'Open': 1}
+    assert snap['bytes_sent'] == 5 * 12
+    assert snap['bytes_received'] == 5 * 12 + 2 * (498 + 6)  # not the corrupted data packet
+    assert snap['nacks'] == {'Open:0x%04X' % NackError.DEV_ERR: 1}
+    assert snap['retries'] == {'GetTemplate': 1}
+    assert snap['latency_seconds']['GetTemplate']['count'] == 3
+    assert json.loads(metrics.json()) == snap
+
+
+def test_timeouts_and_uploads(emu, make_fp, monkeypatch):
+    metrics = Metrics()
+    fp = make_fp(emu, hook=metrics, response_timeout=0.2)
+    assert fp.connect()
+    metrics.reset()
+    assert fp.setTemplate(2, emu.make_template(2))
+    assert metrics.bytes_sent == 12 + 498 + 6
+    monkeypatch.setattr(emu, '_dispatch', lambda cmd, param: None)  # no response
+    assert fp.get_enrolled_cnt() == -1
+    assert metrics.timeouts == {'GetEnrollCount': 1}
+    assert 'GetEnrollCount' not in metrics.latency
+
+
+def test_latency_buckets():
+    metrics = Metrics(buckets=(0.01, 0.1))
+    for latency in (0.005, 0.05, 0.05, 1.0):
+        metrics.response('Open', True, 0, 12, latency)
+    assert metrics.snapshot()['latency_seconds']['Open']['buckets'] == {
+        '0.01': 1, '0.1': 2, '+Inf': 1}
+
+
+def test_prometheus_labels():
+    metrics = Metrics(buckets=(0.01, 0.1))
+    metrics.command('Open', 12)
+    metrics.response('Open', True, 0, 12, 0.05)
+    metrics.response('Open', False, NackError.DEV_ERR, 12, 0.005)
+    metrics.response('GetEnrollCount', None, 0, 0, 0)
+    text = metrics.prometheus()
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    assert '# TYPE fplib_command_latency_seconds histogram' in lines
+    # cumulative buckets
+    assert 'fplib_command_latency_seconds_bucket{command="Open",le="0.01"} 1' in lines
+    assert 'fplib_command_latency_seconds_bucket{command="Open",le="0.1"} 2' in lines
+    assert 'fplib_command_latency_seconds_bucket{command="Open",le="+Inf"} 2' in lines
+    assert 'fplib_command_latency_seconds_count{command="Open"} 2' in lines
+    assert 'fplib_commands_total{command="Open"} 1' in lines
+    assert 'fplib_nacks_total{command="Open",error="0x%04X"} 1' % NackError.DEV_ERR in lines
+    assert 'fplib_timeouts_total{command="GetEnrollCount"} 1' in lines
+    assert 'fplib_bytes_received_total 24' in lines
@@ -0,0 +1,89 @@
+import importlib
+import sys
+import types
+
+import pytest
+
+from fplib.transport import UartTransport
+
+
+class FakeUART():
+    '''machine.UART on a LoopbackTransport, which is passed as the UART id.'''
+
+    def __init__(self, link, baudrate=9600, **settings):
+        self.link = link
+        self.inits = []
+        self.deinits = 0
+        self.init(baudrate=baudrate, **settings)
+
+    def init(self, baudrate=None, **settings):
+        self.inits.append(dict(settings, baudrate=baudrate))
+        if baudrate is not None:
+            self.link.baudrate = baudrate
+
+    def deinit(self):
+        self.deinits += 1
+
+    def any(self):
+        return self.link.in_waiting
+
+    def write(self, data):
+        return self.link.write(data)
+
+    def readinto(self, buf):
+        return self.link.readinto(buf) or None
+
+    def read(self, size=None):
+        return self.link.read(self.link.in_waiting if size is None else size) or None
+
+
+class FakePin():
+    OUT = 1
+
+    def __init__(self, pin, mode):
+        self.values = []
+
+    def value(self, value):
+        self.values.append(value)
+
+
+@pytest.fixture
+def micro(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'machine', types.SimpleNamespace(UART=FakeUART, Pin=FakePin))
+    monkeypatch.delitem(sys.modules, 'fplibMicro', raising=False)
+    return importlib.import_module('fplibMicro')
+
+
+def test_uart_is_set_up_again_on_open(emu):
+    uart = FakeUART(emu.loopback(), 9600, tx=4, rx=5)
+    transport = UartTransport(uart, 1, 9600, {'tx': 4, 'rx': 5})
+    transport.baudrate = 115200
+    transport.close()
+    transport.close()
+    assert uart.deinits == 1
+    transport.open()
+    assert transport.isOpen()
+    assert uart.inits[-1] == {'baudrate': 115200, 'tx': 4, 'rx': 5}
+    assert len(uart.inits) == 3
+
+
+def test_micro_runs_the_library_commands(micro, emu, finger):
+    fp = micro.Fingerprint(emu.loopback(), 115200, ledpin=2, timeout=0.5, response_timeout=1)
+    assert fp.ser is None
+    assert fp.init()
+    assert isinstance(fp.ser, UartTransport)
+    assert fp.ser.settings == {'timeout': 500}
+    assert fp.open()
+    finger(emu.make_template(3))
+    assert fp.enroll(finger_timeout=2) == (0, None, None)
+    data, ok = fp.getTemplate(0)
+    assert ok and bytes(data) == emu.db[0]
+    assert fp.identifyTemplate(bytes(data)) == 0
+    with pytest.raises(ValueError):
+        fp.setTemplate(1, b'short')
+    assert fp.led.values[:2] == [1, 0]
+    assert fp.led.values[-1] == 0
+    deinits = fp.ser.uart.deinits
+    fp.close_serial()
+    assert fp.ser.uart.deinits == deinits + 1
+    assert not fp.ser.isOpen()
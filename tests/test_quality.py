@@ -0,0 +1,40 @@
+import numpy as np
+
+from fplib.quality import Quality, QualityLimits, assess
+
+
+def test_assess_a_finger(emu):
+    image = np.frombuffer(emu._render(emu.make_template(1), (202, 258)), dtype=np.uint8)
+    quality = assess(image.reshape(202, 258))
+    assert QualityLimits().accepts(quality)
+    assert 0.4 < quality.coverage < 0.9
+    assert quality.contrast > 0.5
+
+
+def test_assess_no_finger():
+    assert assess(np.full((202, 258), 0xf0, dtype=np.uint8)) == Quality(0.0, 0.0, 0.0, 0.0)
+    assert not QualityLimits().accepts(Quality(0.0, 0.0, 0.0, 0.0))
+
+
+def test_limits():
+    limits = QualityLimits(coverage=0.5)
+    assert limits == (0.5, 0.25, 0.5, 0.5)
+    assert limits.accepts(Quality(0.5, 0.25, 0.5, 0.5))
+    assert not limits.accepts(Quality(0.5, 0.25, 0.5, 0.6))  # too dry
+
+
+def test_capture_accepts_a_good_image(fp, emu):
+    emu.press_finger(emu.make_template(1))
+    assert fp.capture_finger(quality=True)
+    assert emu.commands['CaptureFinger'] == 1
+    assert QualityLimits().accepts(fp.last_quality)
+
+
+def test_capture_again_while_the_image_falls_short(fp, emu):
+    emu.press_finger(emu.make_template(1))
+    assert not fp.capture_finger(quality=QualityLimits(coverage=1.0), attempts=2)
+    assert emu.commands['CaptureFinger'] == 2
+    assert emu.commands['GetImage'] == 2
+    assert fp.last_quality.coverage < 1.0
+    assert fp.identify(quality=QualityLimits(coverage=1.0)) is None
+    assert 'Identify1_N' not in emu.commands
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from fplib.sensorpool import IdentifyHit, SensorPool
+
+
+@pytest.fixture
+def ports(emulator):
+    '''Two emulated sensors on ptys.'''
+    emus = [emulator(), emulator()]
+    for emu in emus:
+        emu.start()
+    return emus
+
+
+@pytest.fixture
+def pool(ports, fp_options):
+    pool = SensorPool([emu.port for emu in ports], shard_size=10, **fp_options)
+    pool.open()
+    yield pool
+    pool.close()
+
+
+def test_pool_runs_on_every_sensor(pool, ports):
+    ports[1].db[0] = ports[1].make_template(0)
+    counts = pool.enrolled_counts()
+    assert counts.ok
+    assert sorted(counts.results.values()) == [0, 1]
+
+    tpl = ports[0].make_template(1)
+    assert all(pool.push_template(5, tpl).results.values())
+    assert [emu.db[5] for emu in ports] == [tpl, tpl]
+    pushed = pool.push_templates({6: ports[0].make_template(2), 7: ports[0].make_template(3)})
+    assert all(r == {6: True, 7: True} for r in pushed.results.values())
+    assert pool.delete().ok
+    assert not any(emu.db for emu in ports)
+
+
+def test_failing_port_is_left_out(ports, fp_options, tmp_path):
+    missing = str(tmp_path / "ttyMISSING")
+    with SensorPool([ports[0].port, missing], **fp_options) as pool:
+        assert list(pool.sensors) == [ports[0].port]
+        result = pool.call("get_enrolled_cnt")
+        assert result.results == {ports[0].port: 0}
+
+
+def test_errors_and_timeouts_are_reported(pool, ports):
+    def fail(fp):
+        raise IOError("unplugged")
+
+    result = pool.run(fail, ports=[ports[0].port])
+    assert not result.ok
+    assert isinstance(result.errors[ports[0].port], IOError)
+    result = pool.run(lambda fp: time.sleep(0.5), timeout=0.05)
+    assert all(isinstance(e, TimeoutError) for e in result.errors.values())
+
+
+def test_sharded_identify_template(pool, ports):
+    tpl = ports[1].make_template(4)
+    ports[1].db[4] = tpl
+    hit = pool.identify_template(tpl, timeout=2)
+    assert hit == IdentifyHit(14, ports[1].port, 4)
+    assert pool.locate(hit.global_id) == (ports[1].port, 4)
+    assert pool.identify_template(ports[1].make_template(5), timeout=2) is None
+    assert all(emu.commands['IdentifyTemplate1_N'] == 2 for emu in ports)
+
+
+def test_identify_on_another_shard(pool, ports):
+    tpl = ports[0].make_template(6)
+    ports[1].db[2] = tpl
+    ports[0].press_finger(tpl)  # the finger is on the first sensor
+    assert pool.identify(ports[0].port, timeout=2).global_id == 12
+    assert 'MakeTemplate' not in ports[1].commands
+    ports[0].release_finger()
+    assert pool.identify(ports[0].port, timeout=2) is None
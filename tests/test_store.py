@@ -0,0 +1,63 @@
+import pytest
+
+from fplib.store import TemplateStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "templates.fpts")
+
+
+@pytest.fixture
+def store(path):
+    store = TemplateStore(path, capacity=4)
+    yield store
+    store.close()
+
+
+def template(i):
+    return bytes((i + n) & 0xFF for n in range(498))
+
+
+def test_records_survive_reopening(store, path):
+    store.put('alice', template(1), 1)
+    store.put('bob', template(2))
+    assert store.delete('bob')
+    assert not store.delete('bob')
+    store.put('carol', template(3), 3)
+    store.close()
+    with TemplateStore(path) as again:
+        assert sorted(again) == ['alice', 'carol']
+        assert [e.slot for e in again.entries()] == [1, 3]
+        assert bytes(again.get_slot(3)) == template(3)
+        assert again.get_slot(2) is None
+        assert again.capacity == 4
+
+
+def test_slots_and_sizes_are_checked(store):
+    store.put('alice', template(1), 1)
+    with pytest.raises(KeyError):
+        store.put('bob', template(2), 1)
+    with pytest.raises(ValueError):
+        store.put('bob', b'short', 2)
+    store.put('alice', template(1), 2)  # moves to another slot
+    assert store.get_slot(1) is None
+    assert bytes(store.get_slot(2)) == template(1)
+
+
+def test_store_grows_under_live_views(store):
+    store.put('k0', template(0), 0)
+    view = store.get('k0')
+    for i in range(1, 9):
+        store.put('k%d' % i, template(i), i)
+    assert store.capacity >= 9
+    assert bytes(view) == template(0)
+    assert bytes(store.get('k8')) == template(8)
+
+
+@pytest.mark.parametrize('content', [b'', b'FPTS', b'garbage ' * 16])
+def test_other_files_are_refused(path, content):
+    with open(path, "wb") as f:
+        f.write(content)
+    with pytest.raises(ValueError):
+        TemplateStore(path)
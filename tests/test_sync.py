@@ -0,0 +1,59 @@
+import pytest
+
+from fplib.store import TemplateStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TemplateStore(str(tmp_path / "templates.fpts"), capacity=4)
+    yield store
+    store.close()
+
+
+def test_sync_brings_the_sensor_in_line(fp, emu, store):
+    alice, bob, stale = (emu.make_template(i) for i in (1, 2, 3))
+    store.put('alice', alice, 1)
+    store.put('bob', bob, 2)
+    emu.db = {1: alice, 5: stale}
+
+    plan = fp.plan_sync(store)
+    assert plan.deletes == [5]
+    assert plan.uploads == [2]
+    assert plan.unchanged == 1
+    assert emu.db == {1: alice, 5: stale}  # a dry run
+
+    progress = list(fp.sync_database(store, plan))
+    assert [p.done for p in progress] == [1, 2]
+    assert emu.db == {1: alice, 2: bob}
+    assert not fp.plan_sync(store)
+
+
+def test_plan_sync_compares_the_templates(fp, emu, store):
+    tpl = emu.make_template(4)
+    store.put('carol', tpl, 0)
+    i = next(i for i in range(len(tpl) - 1) if tpl[i] != tpl[i + 1])
+    changed = bytearray(tpl)
+    changed[i], changed[i + 1] = tpl[i + 1], tpl[i]
+    emu.db[0] = bytes(changed)  # two bytes swapped, the same 16 bit sum
+
+    assert fp.plan_sync(store).uploads == [0]
+    assert fp.plan_sync(store, compare=False).unchanged == 1
+    list(fp.sync_database(store))
+    assert emu.db[0] == tpl
+
+
+
+def test_plan_sync_rejects_slots_beyond_the_sensor(fp, emu, store):
+    store.put('dave', emu.make_template(6), fp.DB_CAPACITY)
+    with pytest.raises(ValueError):
+        fp.plan_sync(store)
+
+
+def test_plan_sync_stops_looking_once_every_slot_is_found(fp, emu, store):
+    tpl = emu.make_template(7)
+    store.put('erin', tpl, 0)
+    emu.db = {0: tpl, 2: emu.make_template(8)}
+    plan = fp.plan_sync(store)
+    assert plan.deletes == [2]
+    assert emu.commands['CheckEnrolled'] == 2  # slots 1 and 2, not the rest of the database
+    assert plan.round_trips == 4
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from fplib.fpmain import Fingerprint
+from fplib.trace import MAGIC, READ, WRITE, RecordingSerial, ReplaySerial, read_trace
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "site-a.fptr")
+
+
+def record(fp, emu, path):
+    '''Records a short session with the emulator, returns its results.'''
+    emu.db[3] = emu.make_template(3)
+    fp.ser = RecordingSerial(fp.ser, path)
+    results = [fp.get_enrolled_cnt(), fp.check_enrolled(3), bytes(fp.getTemplate(3)[0])]
+    fp.ser.close()
+    return results
+
+
+def test_record(fp, emu, path):
+    results = record(fp, emu, path)
+    assert results == [1, True, emu.db[3]]
+    records = list(read_trace(path))
+    writes = [r for r in records if r.direction == WRITE]
+    assert len(writes) == 3
+    assert all(len(r.data) == 12 for r in writes)
+    assert sum(len(r.data) for r in records if r.direction == READ) == 3 * 12 + 498 + 6
+    assert [r.time for r in records] == sorted(r.time for r in records)
+
+
+def test_replay(fp, emu, path, fp_options):
+    results = record(fp, emu, path)
+    replay = Fingerprint(None, 115200, **fp_options)
+    replay.ser = ReplaySerial(path, speed=None)
+    assert [replay.get_enrolled_cnt(), replay.check_enrolled(3),
+            bytes(replay.getTemplate(3)[0])] == results
+
+
+def test_replay_keeps_the_timing(emulator, make_fp, path, fp_options):
+    emu = emulator(delays={'GetEnrollCount': 0.2})
+    fp = make_fp(emu)
+    assert fp.connect()
+    record(fp, emu, path)
+    for speed, least, most in ((1, 0.2, 0.5), (4, 0.05, 0.15)):
+        replay = Fingerprint(None, 115200, **fp_options)
+        replay.ser = ReplaySerial(path, speed=speed)
+        start = time.monotonic()
+        assert replay.get_enrolled_cnt() == 1
+        assert least <= time.monotonic() - start < most
+
+
+def test_recording_passes_attributes_through(fp, path):
+    ser = fp.ser
+    fp.ser = RecordingSerial(ser, path)
+    fp.ser.timeout = 0.25
+    assert ser.timeout == 0.25
+    assert fp.ser.path == path
+    fp.ser.close()
+
+
+def test_read_trace_checks_the_file(path):
+    with open(path, "wb") as f:
+        f.write(b"not a trace")
+    with pytest.raises(ValueError):
+        list(read_trace(path))
+    with open(path, "wb") as f:
+        f.write(MAGIC + b"\x52\x00\x00\x00\x00\x10\x00\x00\x00abc")  # cut short
+    assert list(read_trace(path)) == []
@@ -0,0 +1,66 @@
+import socket
+import threading
+
+import pytest
+
+from fplib.fpmain import Fingerprint
+from fplib.transport import TcpTransport, open_transport
+
+
+@pytest.fixture
+def relay(emu):
+    '''A TCP serial server in front of the emulator: "tcp://127.0.0.1:<port>".'''
+    link = emu.loopback()
+    link.timeout = 0.05
+    server = socket.create_server(('127.0.0.1', 0))
+    stop = threading.Event()
+
+    def pump_to_client(conn):
+        while not stop.is_set():
+            data = link.read(max(link.in_waiting, 1))
+            if data:
+                conn.sendall(data)
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            threading.Thread(target=pump_to_client, args=(conn,), daemon=True).start()
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                link.write(data)
+        stop.set()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield "tcp://127.0.0.1:%d" % server.getsockname()[1]
+    stop.set()
+    server.close()
+
+
+def test_open_transport_parses_tcp_urls(relay):
+    transport = open_transport(relay, 115200, timeout=0.5)
+    try:
+        assert isinstance(transport, TcpTransport)
+        assert transport.isOpen()
+        assert transport.port == int(relay.rpartition(':')[2])
+        assert transport.in_waiting == 0
+        assert transport.read(4) == b''
+    finally:
+        transport.close()
+    assert not transport.isOpen()
+
+
+def test_fingerprint_over_tcp(relay, emu, fp_options):
+    fp = Fingerprint(relay, 115200, **fp_options)
+    try:
+        assert fp.connect()
+        tpl = emu.make_template(5)
+        emu.db[2] = tpl
+        assert fp.get_enrolled_cnt() == 1
+        data, ok = fp.getTemplate(2)
+        assert ok and bytes(data) == tpl
+        assert fp.setTemplate(3, tpl, check_duplicate=False)
+        assert emu.db[3] == tpl
+    finally:
+        fp.close_serial()